@@ -0,0 +1,179 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# --- KONFIGURASI CACHE ---
+# Hasil AI disimpan di file SQLite lokal supaya email yang sama (atau hampir sama)
+# tidak perlu dikirim ulang ke Gemini.
+CACHE_PATH = os.getenv("AI_CACHE_PATH", "ai_cache.db")
+CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_AGE_DAYS = int(os.getenv("AI_CACHE_MAX_AGE_DAYS", "60"))
+
+# SimHash 64-bit: jarak Hamming <= 6 bit ~ isi email ±95% sama
+SIMHASH_BITS = 64
+NEAR_DUP_MAX_DISTANCE = 6
+# Index LSH: hash dipecah jadi (jarak + 1) band, jadi dua hash yang jaraknya
+# <= NEAR_DUP_MAX_DISTANCE pasti punya minimal 1 band yang identik (pigeonhole)
+BAND_COUNT = NEAR_DUP_MAX_DISTANCE + 1
+BAND_BITS = SIMHASH_BITS // BAND_COUNT
+NEAR_DUP_MIN_WORDS = 20   # Email terlalu pendek tidak dicek near-duplicate
+SHINGLE_SIZE = 3
+
+# Prefix subjek yang tidak mengubah isi (Re:, Fwd:, [Milis] ...)
+SUBJECT_PREFIX = re.compile(r"^\s*((re|fw|fwd|tr)\s*:\s*|\[[^\]]*\]\s*)+", re.IGNORECASE)
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _normalize_text(text):
+    return " ".join(WORD_PATTERN.findall((text or "").lower()))
+
+
+def _sender_domain(sender):
+    match = re.search(r"@([\w.-]+)", sender or "")
+    return match.group(1).lower() if match else (sender or "").strip().lower()
+
+
+def content_key(sender, subject, body_text):
+    """Hash isi email yang sudah dinormalisasi (domain pengirim + subjek + body)."""
+    subject = SUBJECT_PREFIX.sub("", subject or "")
+    raw = "\n".join([_sender_domain(sender), _normalize_text(subject), _normalize_text(body_text)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def simhash(text):
+    """SimHash 64-bit dari shingle 3 kata. Return None kalau teks terlalu pendek."""
+    words = _normalize_text(text).split()
+    if len(words) < NEAR_DUP_MIN_WORDS:
+        return None
+    weights = [0] * SIMHASH_BITS
+    for i in range(len(words) - SHINGLE_SIZE + 1):
+        shingle = " ".join(words[i : i + SHINGLE_SIZE])
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    value = 0
+    for bit in range(SIMHASH_BITS):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def _bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * i)) & mask for i in range(BAND_COUNT)]
+
+
+def _to_signed(value):
+    # SQLite INTEGER itu signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class AICache:
+    """Cache hasil AI: exact match (hash konten) + near-duplicate (SimHash)."""
+
+    def __init__(self, path=CACHE_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        band_columns = ", ".join(f"band{i} INTEGER" for i in range(BAND_COUNT))
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS ai_results (
+                content_key TEXT PRIMARY KEY,
+                simhash INTEGER,
+                {band_columns},
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        for i in range(BAND_COUNT):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_band{i} ON ai_results (band{i})")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON ai_results (last_used)")
+        self.conn.commit()
+
+        self.hits_exact = 0
+        self.hits_near = 0
+        self.misses = 0
+
+    def lookup(self, sender, subject, body_text):
+        """Return hasil AI yang tersimpan (dict) atau None."""
+        key = content_key(sender, subject, body_text)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result FROM ai_results WHERE content_key = ?", (key,)
+            ).fetchone()
+            if row:
+                self.conn.execute("UPDATE ai_results SET last_used = ? WHERE content_key = ?", (now, key))
+                self.conn.commit()
+                self.hits_exact += 1
+                return json.loads(row[0])
+
+            # --- NEAR-DUPLICATE ---
+            value = simhash(body_text)
+            if value is not None:
+                bands = _bands(value)
+                where = " OR ".join(f"band{i} = ?" for i in range(BAND_COUNT))
+                rows = self.conn.execute(
+                    f"SELECT content_key, simhash, result FROM ai_results WHERE {where}",
+                    bands,
+                ).fetchall()
+                for cand_key, cand_hash, result in rows:
+                    distance = bin(value ^ _to_unsigned(cand_hash)).count("1")
+                    if distance <= NEAR_DUP_MAX_DISTANCE:
+                        self.conn.execute(
+                            "UPDATE ai_results SET last_used = ? WHERE content_key = ?", (now, cand_key)
+                        )
+                        self.conn.commit()
+                        self.hits_near += 1
+                        return json.loads(result)
+
+            self.misses += 1
+            return None
+
+    def store(self, sender, subject, body_text, result):
+        key = content_key(sender, subject, body_text)
+        value = simhash(body_text)
+        bands = _bands(value) if value is not None else [None] * BAND_COUNT
+        band_columns = ", ".join(f"band{i}" for i in range(BAND_COUNT))
+        placeholders = ", ".join("?" * (BAND_COUNT + 5))
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO ai_results "
+                f"(content_key, simhash, {band_columns}, result, created_at, last_used) "
+                f"VALUES ({placeholders})",
+                [key, _to_signed(value) if value is not None else None, *bands,
+                 json.dumps(result, ensure_ascii=False), now, now],
+            )
+            self.conn.commit()
+
+    def evict(self):
+        """Buang entry yang kedaluwarsa lalu yang paling lama tidak dipakai (LRU)."""
+        cutoff = time.time() - CACHE_MAX_AGE_DAYS * 86400
+        with self.lock:
+            expired = self.conn.execute("DELETE FROM ai_results WHERE created_at < ?", (cutoff,)).rowcount
+            overflow = self.conn.execute(
+                "DELETE FROM ai_results WHERE content_key IN ("
+                "  SELECT content_key FROM ai_results ORDER BY last_used DESC LIMIT -1 OFFSET ?"
+                ")",
+                (CACHE_MAX_ENTRIES,),
+            ).rowcount
+            self.conn.commit()
+        return expired + overflow
+
+    def report(self):
+        total = self.hits_exact + self.hits_near + self.misses
+        rate = (self.hits_exact + self.hits_near) / total * 100 if total else 0
+        print("\n🗃️ Cache AI:")
+        print(f"   - Hit (sama persis)   : {self.hits_exact}")
+        print(f"   - Hit (near-duplicate): {self.hits_near}")
+        print(f"   - Miss (panggil AI)   : {self.misses}")
+        print(f"   - Hit rate            : {rate:.0f}%")
@@ -1,7 +1,12 @@
 import os
-import json
+import time
 import google.generativeai as genai
 from dotenv import load_dotenv
+from rate_limiter import scheduler, estimate_tokens, parse_retry_after, is_rate_limit_error
+from circuit_breaker import breaker
+from compaction import compact_body
+import ai_schema
+from metrics import registry
 
 load_dotenv()
 API_KEY = os.getenv("GEMINI_API_KEY")
@@ -18,23 +23,19 @@ MODELS_TO_TRY = [
     "gemma-3-27b-it"          
 ]
 
-def ask_ai_json(sender, subject, body_text):
-    """
-    Versi INTEGRASI DATABASE (JSON OUTPUT)
-    Menggunakan logika prompt kamu, tapi outputnya Data yang bisa disimpan.
-    """
-    if not API_KEY:
-        print("❌ Error: GEMINI_API_KEY belum di-set di .env")
-        return None
+# Maksimal waktu nunggu kuota (detik) sebelum email di-skip ke run berikutnya
+MAX_QUOTA_WAIT = int(os.getenv("AI_MAX_QUOTA_WAIT", "120"))
 
-    prompt = f"""
-    Kamu adalah asisten mahasiswa UMN yang cerdas. Tugasmu mengekstrak informasi email.
-    
-    DATA EMAIL:
-    - Pengirim: {sender}
-    - Subjek: {subject}
-    - Isi: {body_text}
+# --- KONFIGURASI BATCH MODE ---
+# Beberapa email dipaketkan dalam 1 request supaya instruksi prompt cukup dikirim sekali.
+BATCH_MAX_ITEMS = int(os.getenv("AI_BATCH_MAX_ITEMS", "15"))
+BATCH_TOKEN_BUDGET = int(os.getenv("AI_BATCH_TOKEN_BUDGET", "8000"))
+BATCH_MAX_ATTEMPTS = 2  # Email yang gagal/hilang dari jawaban dicoba ulang 1x di paket berikutnya
+# Body email di prompt follow-up (hanya field yang kurang) dipadatkan lebih kecil lagi
+FOLLOWUP_BODY_TOKEN_BUDGET = 200
 
+# Instruksi analisis dipakai bersama oleh mode single & batch
+ANALYSIS_RULES = """
     TUGAS ANALISIS (Cari Detail Ini):
     1. KLASIFIKASI (Category):
        - 'URGENT': Perubahan jadwal dadakan, pembatalan kelas, wajib hadir besok.
@@ -51,44 +52,143 @@ def ask_ai_json(sender, subject, body_text):
     
     4. ACTION ITEMS:
        - Langkah konkret: "Daftar di link...", "Kumpul tugas...", "Abaikan".
+"""
 
-    OUTPUT WAJIB JSON (Jangan markdown):
-    {{
-        "category": "URGENT/BENEFIT/TASK/NOISE",
-        "deadline_date": "YYYY-MM-DD" atau null,
-        "priority_score": 1-5,
-        "summary_text": "...",
-        "action_items": ["...", "..."]
-    }}
+# Cache objek model: dibuat sekali per model, bukan tiap request
+_model_clients = {}
+
+def _get_model(model_name):
+    model = _model_clients.get(model_name)
+    if model is None:
+        model = genai.GenerativeModel(model_name)
+        _model_clients[model_name] = model
+    return model
+
+def _generate_json(prompt):
+    """
+    Kirim prompt ke MODELS_TO_TRY (urut prioritas, lewat rate limiter).
+    Return hasil JSON (diperbaiki lokal kalau sedikit rusak), atau None kalau semua model gagal.
     """
+    # Tiap model dicoba maksimal sekali per prompt. Model yang kuotanya lagi penuh
+    # dilewati dulu; kalau semua penuh, tunggu model yang paling cepat tersedia.
+    # Model yang lagi "open" di circuit breaker (kuota habis / error beruntun) tidak dicoba.
+    est_tokens = estimate_tokens(prompt)
+    remaining = breaker.available(MODELS_TO_TRY)
+    if not remaining:
+        print("   🔌 Semua model sedang diistirahatkan (circuit breaker open).")
+        return None
+    deadline = time.monotonic() + MAX_QUOTA_WAIT
+
+    while remaining:
+        model_name, wait = scheduler.acquire_any(remaining, est_tokens)
+        if model_name is None:
+            if time.monotonic() + wait > deadline:
+                print(f"   ⏳ Kuota semua model penuh (tunggu {wait:.0f} detik). Skip dulu.")
+                break
+            time.sleep(wait)
+            continue
 
-    # --- LOOPING COBA MODEL ---
-    for model_name in MODELS_TO_TRY:
+        remaining.remove(model_name)
+        if not breaker.before_call(model_name):
+            # Model half-open sedang diprobe worker lain
+            continue
+
+        started = time.monotonic()
         try:
             # print(f"   🤖 Mencoba model: {model_name}...") 
             
-            model = genai.GenerativeModel(model_name)
+            model = _get_model(model_name)
             
             response = model.generate_content(
                 prompt,
                 generation_config={"response_mime_type": "application/json"} 
             )
             
-            clean_text = response.text.replace("```json", "").replace("```", "").strip()
-            return json.loads(clean_text)
+            result, repaired = ai_schema.repair_json(response.text)
+            if repaired:
+                # Tanpa perbaikan lokal, jawaban ini dianggap gagal -> 1 request ke model cadangan
+                print(f"   🩹 JSON dari {model_name} diperbaiki lokal.")
+                ai_schema.stats.add_repair("json")
+                ai_schema.stats.add_saved()
+
+            usage = getattr(response, "usage_metadata", None)
+            prompt_tokens = getattr(usage, "prompt_token_count", None)
+            elapsed = time.monotonic() - started
+            scheduler.report_success(model_name, est_tokens, prompt_tokens)
+            breaker.record_success(model_name, elapsed, model_name == MODELS_TO_TRY[0])
+            registry.observe("stage_seconds", elapsed, stage="llm_call", model=model_name)
+            registry.inc("llm_calls_total", model=model_name, outcome="ok")
+            registry.inc("llm_tokens_total", prompt_tokens or est_tokens, model=model_name, kind="prompt")
+            registry.inc("llm_tokens_total", getattr(usage, "candidates_token_count", None) or 0,
+                         model=model_name, kind="completion")
+            if model_name != MODELS_TO_TRY[0]:
+                registry.inc("llm_fallback_total", model=model_name)
+            return result
 
         except Exception as e:
-            # Jika Error 429 lanjut ke model berikutnya
-            if "429" in str(e):
-                print(f"   ⚠️ Kuota {model_name} HABIS! Mengalihkan ke cadangan...")
+            # Jika Error 429: cooldown model ini (untuk semua worker) lalu pakai cadangan
+            if is_rate_limit_error(e):
+                backoff = scheduler.report_rate_limited(model_name, parse_retry_after(e))
+                print(f"   ⚠️ Kuota {model_name} HABIS! Cooldown {backoff:.0f} detik, mengalihkan ke cadangan...")
             else:
                 print(f"   ⚠️ {model_name} Error: {e}. Mencoba cadangan...")
+            breaker.record_failure(model_name, e, time.monotonic() - started)
+            breaker.save()
+            registry.inc("llm_calls_total", model=model_name,
+                         outcome="rate_limited" if is_rate_limit_error(e) else "error")
             
-            # Lanjut ke iterasi loop berikutnya (Model selanjutnya)
+            # Lanjut ke model berikutnya
             continue
 
     # --- JIKA SEMUA MODEL GAGAL ---
     print("❌ SEMUA MODEL GAGAL MERESPON.")
+    return None
+
+def ask_ai_json(sender, subject, body_text):
+    """
+    Versi INTEGRASI DATABASE (JSON OUTPUT)
+    Menggunakan logika prompt kamu, tapi outputnya Data yang bisa disimpan.
+    """
+    if not API_KEY:
+        print("❌ Error: GEMINI_API_KEY belum di-set di .env")
+        return None
+
+    body_text = compact_body(body_text)
+
+    prompt = f"""
+    Kamu adalah asisten mahasiswa UMN yang cerdas. Tugasmu mengekstrak informasi email.
+    
+    DATA EMAIL:
+    - Pengirim: {sender}
+    - Subjek: {subject}
+    - Isi: {body_text}
+{ANALYSIS_RULES}
+    OUTPUT WAJIB JSON (Jangan markdown):
+    {{
+        "category": "URGENT/BENEFIT/TASK/NOISE",
+        "deadline_date": "YYYY-MM-DD" atau null,
+        "priority_score": 1-5,
+        "summary_text": "...",
+        "action_items": ["...", "..."]
+    }}
+    """
+
+    result = _generate_json(prompt)
+    if isinstance(result, dict):
+        clean, missing, repaired = ai_schema.validate(result)
+        for field in repaired:
+            ai_schema.stats.add_repair(field)
+        if "deadline_date" in repaired:
+            # Dulu tanggal mentah gagal disimpan ke kolom DATE -> email dianalisis ulang run berikutnya
+            ai_schema.stats.add_saved()
+        if ai_schema.needs_followup(missing, repaired):
+            filled = _complete_missing([("1", sender, subject, body_text, clean, missing)])
+            clean = filled.get("1")
+        elif missing:
+            clean["deadline_date"] = None
+        if clean:
+            return clean
+
     return {
         "category": "ERROR",
         "deadline_date": None,
@@ -96,3 +196,173 @@ def ask_ai_json(sender, subject, body_text):
         "summary_text": "Gagal memproses AI (Semua kuota habis)",
         "action_items": []
     }
+
+def _format_batch_item(email):
+    return (
+        f"[EMAIL id={email['id']}]\n"
+        f"- Pengirim: {email['sender']}\n"
+        f"- Subjek: {email['subject']}\n"
+        f"- Isi: {compact_body(email['body_snippet'])}\n"
+    )
+
+def _build_batch_prompt(items_text):
+    emails_block = "\n".join(items_text)
+    return f"""
+    Kamu adalah asisten mahasiswa UMN yang cerdas. Tugasmu mengekstrak informasi dari BANYAK email sekaligus.
+    Analisis SETIAP email secara terpisah.
+{ANALYSIS_RULES}
+    OUTPUT WAJIB JSON ARRAY (Jangan markdown), satu objek per email, pakai "id" persis seperti di data:
+    [
+        {{
+            "id": "...",
+            "category": "URGENT/BENEFIT/TASK/NOISE",
+            "deadline_date": "YYYY-MM-DD" atau null,
+            "priority_score": 1-5,
+            "summary_text": "...",
+            "action_items": ["...", "..."]
+        }}
+    ]
+
+    DATA EMAIL:
+{emails_block}
+    """
+
+FOLLOWUP_FIELDS = {
+    "category": '"category": "URGENT/BENEFIT/TASK/NOISE"',
+    "summary_text": '"summary_text": "ringkasan singkat bahasa Indonesia"',
+    "deadline_date": '"deadline_date": "YYYY-MM-DD" atau null',
+}
+
+def _build_followup_prompt(entries):
+    items = []
+    for item_id, sender, subject, body, _, missing in entries:
+        items.append(
+            f"[EMAIL id={item_id}]\n"
+            f"- Pengirim: {sender}\n"
+            f"- Subjek: {subject}\n"
+            f"- Isi: {compact_body(body, FOLLOWUP_BODY_TOKEN_BUDGET)}\n"
+            f"- Field: {', '.join(FOLLOWUP_FIELDS[field] for field in missing)}\n"
+        )
+    emails_block = "\n".join(items)
+    return f"""
+    Lengkapi HANYA field yang diminta untuk tiap email.
+    Kategori: URGENT (jadwal berubah/batal), BENEFIT (recruitment/SKKM/lomba/beasiswa/magang), TASK (tugas kuliah), NOISE (lainnya).
+    OUTPUT WAJIB JSON ARRAY (Jangan markdown): [{{"id": "...", <field yang diminta>}}]
+
+{emails_block}
+    """
+
+def _complete_missing(entries):
+    """
+    1 request kecil untuk field yang kurang dari beberapa hasil AI sekaligus.
+    `entries` = list (id, pengirim, subjek, body, hasil_bersih, field_kurang).
+    Return {id: hasil_lengkap}; yang tetap kurang tidak ada di hasil.
+    """
+    fields = sorted({field for *_, missing in entries for field in missing})
+    print(f"   🩹 Follow-up AI: {', '.join(fields)} untuk {len(entries)} email...")
+    ai_schema.stats.add_followup()
+    response = _generate_json(_build_followup_prompt(entries))
+    if isinstance(response, dict):
+        response = response.get("results") or response.get("emails") or [response]
+    by_id = {}
+    for item in response if isinstance(response, list) else []:
+        if isinstance(item, dict) and item.get("id") is not None:
+            by_id[str(item["id"])] = item
+    # Jawaban 1 objek tanpa id untuk 1 email tetap dipakai
+    if len(entries) == 1 and not by_id and isinstance(response, list) and response and isinstance(response[0], dict):
+        by_id[str(entries[0][0])] = response[0]
+
+    completed = {}
+    for item_id, _, _, _, clean, missing in entries:
+        patched, still_missing = ai_schema.merge(clean, by_id.get(str(item_id)), missing)
+        if not still_missing:
+            completed[str(item_id)] = patched
+    return completed
+
+def _pack_batch(queue):
+    """Ambil email dari depan antrian selama muat di BATCH_MAX_ITEMS & BATCH_TOKEN_BUDGET."""
+    base_tokens = estimate_tokens(_build_batch_prompt([]))
+    used = base_tokens
+    batch, texts = [], []
+    while queue and len(batch) < BATCH_MAX_ITEMS:
+        text = _format_batch_item(queue[0])
+        cost = estimate_tokens(text)
+        # Email pertama selalu masuk walau sendirian melebihi budget
+        if batch and used + cost > BATCH_TOKEN_BUDGET:
+            break
+        batch.append(queue.pop(0))
+        texts.append(text)
+        used += cost
+    return batch, texts
+
+def ask_ai_json_batch(emails):
+    """
+    Mode BATCH: klasifikasi banyak email dalam sedikit request.
+    `emails` = list dict berisi id, sender, subject, body_snippet.
+    Return dict {id_email: hasil_ai}. Email yang tetap gagal tidak ada di hasil.
+    """
+    if not API_KEY:
+        print("❌ Error: GEMINI_API_KEY belum di-set di .env")
+        return {}
+
+    results = {}
+    attempts = {}
+    queue = list(emails)
+
+    while queue:
+        batch, texts = _pack_batch(queue)
+        print(f"   📦 Batch AI: {len(batch)} email dalam 1 request...")
+
+        response = _generate_json(_build_batch_prompt(texts))
+        if response is None:
+            # Semua model gagal -> sisanya dicoba di run berikutnya
+            break
+        if isinstance(response, dict):
+            response = response.get("results") or response.get("emails") or [response]
+
+        by_id = {}
+        for item in response if isinstance(response, list) else []:
+            if isinstance(item, dict) and item.get("id") is not None:
+                by_id[str(item["id"])] = item
+
+        # --- VALIDASI PER ITEM ---
+        # Field rusak dinormalisasi lokal; field wajib yang kurang ditanyakan ulang dalam 1
+        # follow-up kecil. Email yang hilang dari jawaban (atau tetap kurang) masuk antrian lagi.
+        failed = []
+        followups = []
+        batch_repaired = False
+        for email in batch:
+            key = str(email["id"])
+            clean, missing, repaired = ai_schema.validate(by_id.get(key)) if key in by_id else (None, None, [])
+            if clean is None:
+                failed.append(email)
+                continue
+            for field in repaired:
+                ai_schema.stats.add_repair(field)
+            # Objek terpotong sudah dihitung di _generate_json (JSON diperbaiki), jangan dobel
+            batch_repaired = batch_repaired or any(field != "truncated" for field in repaired)
+            if ai_schema.needs_followup(missing, repaired):
+                followups.append((key, email["sender"], email["subject"], email["body_snippet"], clean, missing))
+                continue
+            if missing:
+                clean["deadline_date"] = None
+            results[key] = clean
+        if batch_repaired:
+            # Dulu email dengan kategori/tanggal rusak diulang di paket berikutnya
+            ai_schema.stats.add_saved()
+
+        if followups:
+            completed = _complete_missing(followups)
+            results.update(completed)
+            by_key = {str(email["id"]): email for email in batch}
+            failed.extend(by_key[entry[0]] for entry in followups if entry[0] not in completed)
+
+        for email in failed:
+            key = str(email["id"])
+            attempts[key] = attempts.get(key, 0) + 1
+            if attempts[key] < BATCH_MAX_ATTEMPTS:
+                queue.append(email)
+            else:
+                print(f"   ⚠️ Hasil AI tidak valid untuk: {email['subject'][:30]}...")
+
+    return results
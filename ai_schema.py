@@ -0,0 +1,351 @@
+import re
+import json
+import threading
+from datetime import date, datetime
+from metrics import registry
+
+# --- SKEMA OUTPUT AI ---
+# Jawaban Gemini divalidasi & diperbaiki di sini sebelum masuk DB. JSON yang sedikit rusak
+# (teks tambahan, kutip tunggal, array terpotong) diperbaiki lokal, bukan dianggap model gagal
+# (yang berarti 1 request lagi ke model cadangan). Field wajib yang tetap kosong diminta ulang
+# lewat prompt follow-up kecil, hanya untuk field itu saja.
+VALID_CATEGORIES = ("URGENT", "BENEFIT", "TASK", "NOISE")
+REQUIRED_FIELDS = ("category", "summary_text")
+# Jawaban model yang sering muncul selain 4 kategori resmi
+CATEGORY_ALIASES = {
+    "PENTING": "URGENT", "MENDESAK": "URGENT", "DARURAT": "URGENT",
+    "BENEFITS": "BENEFIT", "MANFAAT": "BENEFIT", "PELUANG": "BENEFIT", "OPPORTUNITY": "BENEFIT",
+    "TASKS": "TASK", "TUGAS": "TASK", "ASSIGNMENT": "TASK",
+    "SPAM": "NOISE", "UMUM": "NOISE", "INFO": "NOISE", "OTHER": "NOISE", "LAINNYA": "NOISE",
+}
+CATEGORY_WORD = re.compile(r"[A-Z]+")
+MONTHS = {
+    "jan": 1, "januari": 1, "january": 1, "feb": 2, "februari": 2, "february": 2,
+    "mar": 3, "maret": 3, "march": 3, "apr": 4, "april": 4, "mei": 5, "may": 5,
+    "jun": 6, "juni": 6, "june": 6, "jul": 7, "juli": 7, "july": 7,
+    "agu": 8, "agt": 8, "agustus": 8, "aug": 8, "august": 8, "sep": 9, "sept": 9, "september": 9,
+    "okt": 10, "oktober": 10, "oct": 10, "october": 10, "nov": 11, "nopember": 11, "november": 11,
+    "des": 12, "desember": 12, "dec": 12, "december": 12,
+}
+# Tahun dulu dicek sebelum hari dulu; dibatasi (?<!\d)/(?!\d) supaya "2026/06/05" tidak terbaca "26/06/05"
+ISO_DATE = re.compile(r"(?<!\d)(\d{4})[/.-](\d{1,2})[/.-](\d{1,2})(?!\d)")
+NUMERIC_DATE = re.compile(r"(?<!\d)(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})(?!\d)")   # Format Indonesia: hari dulu
+NAMED_DATE = re.compile(r"(\d{1,2})\s+([a-z]+)\.?\s+(\d{4})")
+NAMED_DATE_EN = re.compile(r"([a-z]+)\.?\s+(\d{1,2}),?\s+(\d{4})")
+EMPTY_VALUES = {"", "null", "none", "-", "n/a", "na", "tidak ada", "tidak ada deadline"}
+PYTHON_LITERALS = {"None": "null", "True": "true", "False": "false"}
+# Penanda di objek yang terpotong (jawaban model berhenti di tengah objek itu): field yang
+# tidak ada dianggap kurang, bukan "tidak ada deadline" (lihat validate)
+TRUNCATED_KEY = "_truncated"
+TRUNCATED_FIELDS = ("category", "summary_text", "deadline_date")
+
+
+class SchemaStats:
+    """Perbaikan output AI dalam 1 run + perkiraan request LLM yang tidak jadi dikirim."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.repairs = {}      # jenis perbaikan -> jumlah
+        self.saved = 0         # Request yang dihemat (tanpa layer ini: fallback / batch ulang)
+        self.followups = 0     # Request follow-up kecil yang tetap dikirim
+
+    def add_repair(self, kind, count=1):
+        with self.lock:
+            self.repairs[kind] = self.repairs.get(kind, 0) + count
+        registry.inc("ai_output_repairs_total", count, kind=kind)
+
+    def add_saved(self, count=1):
+        with self.lock:
+            self.saved += count
+        registry.inc("llm_requests_saved_total", count)
+
+    def add_followup(self):
+        with self.lock:
+            self.followups += 1
+        registry.inc("llm_followup_total")
+
+    def net_saved(self):
+        with self.lock:
+            return self.saved - self.followups
+
+    def report(self):
+        if not self.repairs and not self.followups:
+            return
+        repairs = ", ".join(f"{kind} {count}" for kind, count in sorted(self.repairs.items()))
+        print("\n🩹 Validasi output AI:")
+        print(f"   - Perbaikan lokal   : {repairs or '-'}")
+        print(f"   - Follow-up dikirim : {self.followups}")
+        print(f"   - Request dihemat   : {self.net_saved()} (bersih: {self.saved} dihemat - {self.followups} follow-up)")
+
+
+stats = SchemaStats()
+
+
+# =========================================================
+# PERBAIKAN JSON
+# =========================================================
+
+def _find_start(text):
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return min(starts) if starts else -1
+
+
+def _normalize_tokens(text):
+    """
+    1 kali scan: kutip tunggal -> kutip ganda, None/True/False -> JSON, koma sebelum
+    penutup dibuang. Return (potongan, stack_kurung_terbuka, titik_potong_aman, masih_di_string).
+    Titik potong aman = indeks potongan sebelum koma pemisah + stack saat itu (untuk jawaban terpotong).
+    """
+    out = []
+    stack = []
+    cuts = []
+    quote = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == "\\" and i + 1 < len(text):
+                # \' bukan escape JSON yang sah (dari string berkutip tunggal gaya Python)
+                out.append("'" if text[i + 1] == "'" else text[i : i + 2])
+                i += 2
+                continue
+            if char == quote:
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')   # Kutip ganda di dalam string berkutip tunggal
+            else:
+                out.append(char)
+            i += 1
+            continue
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            out.append(char)
+        elif char in "}]":
+            # Buang koma menggantung: [1, 2,] / {"a": 1,}
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+                if cuts and cuts[-1][0] == len(out):
+                    cuts.pop()
+            if stack:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                # Teks setelah objek/array utama (penjelasan model) diabaikan
+                return out, stack, cuts, False
+        elif char == ",":
+            cuts.append((len(out), list(stack)))
+            out.append(char)
+        elif char.isalpha():
+            j = i
+            while j < len(text) and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(PYTHON_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(char)
+        i += 1
+    return out, stack, cuts, quote is not None
+
+
+def _close(text, stack):
+    text = text.rstrip()
+    # Pasangan key tanpa nilai di ujung ({"a": 1, "b":) dibuang
+    text = re.sub(r',?\s*"[^"]*"\s*:\s*$', "", text)
+    text = text.rstrip().rstrip(",")
+    return text + "".join(reversed(stack))
+
+
+def _mark_truncated(result, stack):
+    """Tandai objek yang sedang terbuka saat jawaban terpotong (item terakhir array / objek utama)."""
+    if isinstance(result, list) and len(stack) >= 2 and result and isinstance(result[-1], dict):
+        result[-1][TRUNCATED_KEY] = True
+    elif isinstance(result, dict) and stack:
+        result[TRUNCATED_KEY] = True
+    return result
+
+
+def repair_json(text):
+    """
+    Parse JSON jawaban model, perbaiki cacat umum kalau perlu.
+    Jawaban terpotong: elemen terakhir yang belum selesai (string/angka di tengah jalan) dibuang,
+    bukan ditutup paksa ("2025-10-1" bukan tanggal yang benar), dan objeknya ditandai TRUNCATED_KEY.
+    Return (hasil, diperbaiki). Raise ValueError kalau tidak bisa diselamatkan.
+    """
+    clean = text.replace("```json", "").replace("```", "").strip()
+    try:
+        return json.loads(clean), False
+    except ValueError:
+        pass
+    start = _find_start(clean)
+    if start < 0:
+        raise ValueError("Tidak ada objek/array JSON di jawaban model")
+    pieces, stack, cuts, in_string = _normalize_tokens(clean[start:])
+    normalized = "".join(pieces)
+    # Ujung utuh = berakhir di string/objek/array yang sudah ditutup; angka/literal/string
+    # yang terpotong tidak pernah dipakai
+    if not in_string and normalized.rstrip()[-1:] in ('"', "}", "]"):
+        try:
+            return _mark_truncated(json.loads(_close(normalized, stack)), stack), True
+        except ValueError:
+            pass
+    # Mundur ke elemen utuh terakhir (sebelum koma pemisah)
+    for position, cut_stack in reversed(cuts):
+        try:
+            return _mark_truncated(json.loads(_close("".join(pieces[:position]), cut_stack)), cut_stack), True
+        except ValueError:
+            continue
+    raise ValueError("JSON jawaban model rusak dan tidak bisa diperbaiki")
+
+
+# =========================================================
+# NORMALISASI FIELD
+# =========================================================
+
+def normalize_category(value):
+    """
+    'urgent', 'Urgent!', 'Penting' -> kategori resmi. None kalau tidak dikenali atau ambigu
+    (>1 kategori berbeda, misal template "URGENT/BENEFIT/TASK/NOISE" disalin mentah) -> ditanya ulang.
+    """
+    if not isinstance(value, str):
+        return None
+    found = set()
+    for word in CATEGORY_WORD.findall(value.upper()):
+        if word in VALID_CATEGORIES:
+            found.add(word)
+        elif word in CATEGORY_ALIASES:
+            found.add(CATEGORY_ALIASES[word])
+    return found.pop() if len(found) == 1 else None
+
+
+def _safe_date(year, month, day):
+    year = int(year)
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, int(month), int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+def normalize_date(value):
+    """
+    Tanggal deadline -> 'YYYY-MM-DD'. Return (tanggal_atau_None, valid).
+    valid=False berarti ada isi tapi formatnya tidak dikenali (perlu ditanya ulang).
+    """
+    if value is None:
+        return None, True
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d"), True
+    text = str(value).strip().lower()
+    if text in EMPTY_VALUES:
+        return None, True
+    match = ISO_DATE.search(text)
+    if match:
+        result = _safe_date(*match.groups())
+        return result, result is not None
+    match = NUMERIC_DATE.search(text)
+    if match:
+        day, month, year = match.groups()
+        result = _safe_date(year, month, day)
+        return result, result is not None
+    match = NAMED_DATE.search(text)
+    if match and match.group(2) in MONTHS:
+        day, month, year = match.groups()
+        result = _safe_date(year, MONTHS[month], day)
+        return result, result is not None
+    match = NAMED_DATE_EN.search(text)
+    if match and match.group(1) in MONTHS:
+        month, day, year = match.groups()
+        result = _safe_date(year, MONTHS[month], day)
+        return result, result is not None
+    return None, False
+
+
+def normalize_priority(value, category):
+    try:
+        score = int(float(str(value).split("/")[0].strip()))
+    except (TypeError, ValueError):
+        return {"URGENT": 5, "TASK": 4, "BENEFIT": 3}.get(category, 1)
+    return min(max(score, 1), 5)
+
+
+def normalize_action_items(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [line.strip(" -•") for line in re.split(r"[\n;]+", str(value)) if line.strip(" -•")]
+
+
+def validate(item):
+    """
+    Bersihkan 1 hasil analisis. Return (hasil_bersih, field_kurang, field_diperbaiki).
+    Field yang kurang berisi None di hasil_bersih; isi lewat merge() setelah follow-up.
+    field_diperbaiki = nilai yang dulu lolos mentah / ditolak, sekarang dinormalisasi lokal
+    ("truncated" kalau objeknya terpotong, lihat repair_json).
+    """
+    if not isinstance(item, dict):
+        return None, list(REQUIRED_FIELDS), []
+    missing = []
+    repaired = []
+    truncated = item.get(TRUNCATED_KEY, False)
+    raw_category = item.get("category")
+    category = normalize_category(raw_category)
+    if category is None:
+        missing.append("category")
+    elif category != str(raw_category).strip().upper():
+        repaired.append("category")
+
+    summary = item.get("summary_text")
+    summary = str(summary).strip() if summary is not None else ""
+    if not summary:
+        missing.append("summary_text")
+
+    raw_deadline = item.get("deadline_date")
+    deadline, deadline_ok = normalize_date(raw_deadline)
+    if not deadline_ok:
+        missing.append("deadline_date")
+    elif deadline != (raw_deadline or None):
+        repaired.append("deadline_date")
+
+    if truncated:
+        # Field yang belum sempat ditulis model: tidak diketahui, tanyakan lagi lewat follow-up
+        repaired.append("truncated")
+        missing.extend(field for field in TRUNCATED_FIELDS if field not in item and field not in missing)
+
+    clean = {
+        "category": category,
+        "deadline_date": deadline,
+        "priority_score": normalize_priority(item.get("priority_score"), category),
+        "summary_text": summary or None,
+        "action_items": normalize_action_items(item.get("action_items")),
+    }
+    return clean, missing, repaired
+
+
+def needs_followup(missing, repaired=()):
+    """
+    Follow-up untuk field wajib, dan untuk field apa pun yang hilang karena jawaban terpotong.
+    Deadline yang formatnya tidak dikenali ikut ditanyakan kalau follow-up memang dikirim;
+    kalau cuma itu yang kurang, dikosongkan saja.
+    """
+    if "truncated" in repaired and missing:
+        return True
+    return any(field in REQUIRED_FIELDS for field in missing)
+
+
+def merge(clean, followup, missing):
+    """Isi field yang kurang dari jawaban follow-up. Return (hasil, field_wajib_yang_masih_kurang)."""
+    followup = followup if isinstance(followup, dict) else {}
+    patched, still_missing, _ = validate({**clean, **{field: followup.get(field) for field in missing}})
+    if "deadline_date" in still_missing:
+        patched["deadline_date"] = None
+    return patched, [field for field in still_missing if field in REQUIRED_FIELDS]
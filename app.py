@@ -1,12 +1,19 @@
 import os
 import math
+import time
 from datetime import datetime, timedelta
-from flask import Flask, request, abort
-from linebot import LineBotApi, WebhookHandler
+from flask import Flask, request, abort, jsonify, Response
+from linebot import WebhookParser
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage
-from supabase import create_client, Client
 from dotenv import load_dotenv
+from clients import get_storage, get_line_bot_api
+from storage import STORAGE_BACKEND
+from metrics import registry
+from reply_cache import ReplyCache, fetch_version
+from event_pool import EventPool
+from search_index import SearchIndex
+from embedding_index import EmbeddingIndex, latest_per_thread
 
 load_dotenv()
 
@@ -18,12 +25,32 @@ LINE_SECRET = os.getenv("LINE_CHANNEL_SECRET")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not all([LINE_TOKEN, LINE_SECRET, SUPABASE_URL, SUPABASE_KEY]):
+if not all([LINE_TOKEN, LINE_SECRET]) or (STORAGE_BACKEND == "supabase" and not all([SUPABASE_URL, SUPABASE_KEY])):
     print("Warning: Environment variable")
 
-line_bot_api = LineBotApi(LINE_TOKEN)
-handler = WebhookHandler(LINE_SECRET)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Client bersama (clients.py): koneksi dipakai ulang & tiap panggilan tercatat di /metrics
+line_bot_api = get_line_bot_api()
+parser = WebhookParser(LINE_SECRET)
+storage = get_storage()
+
+# Cache balasan per kategori: keyword populer tidak perlu query database tiap chat
+REPLY_CACHE_TTL = int(os.getenv("REPLY_CACHE_TTL", "300"))
+
+CATEGORY_TITLES = {
+    "BENEFIT": "🎁 INFO SKKM & BENEFIT",
+    "TASK": "📌 DAFTAR TUGAS & UJIAN",
+    "URGENT": "🚨 INFO URGENT/PENTING",
+    "NOISE": "📰 BERITA & PENGUMUMAN",
+}
+
+# Event webhook diproses di background supaya LINE langsung dapat 200
+EVENT_WORKERS = int(os.getenv("EVENT_WORKERS", "4"))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "200"))
+# Reply token LINE cuma berlaku sebentar; lewat dari ini balasan dikirim via push
+REPLY_TOKEN_TTL = 50
+SEARCH_RESULT_LIMIT = 5
+SEARCH_MIN_CHARS = 3
+SIMILAR_PREFIX = "mirip "
 
 # 1. ROUTE WEBHOOK
 @app.route("/callback", methods=['POST'])
@@ -31,33 +58,166 @@ def callback():
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
     try:
-        handler.handle(body, signature)
+        events = parser.parse(body, signature)
     except InvalidSignatureError:
         abort(400)
+
+    # Antrian penuh -> 503 supaya LINE mengirim ulang webhook nanti (kalau redelivery aktif)
+    if not event_pool.submit(events):
+        print(f"⚠️ Antrian event penuh, {len(events)} event ditolak.")
+        abort(503)
     return 'OK'
 
-# 2. LOGIKA JAWAB PESAN
-@handler.add(MessageEvent, message=TextMessage)
+@app.route("/stats", methods=['GET'])
+def stats():
+    return jsonify({"events": event_pool.stats(), "reply_cache": reply_cache.stats()})
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """Format Prometheus: counter/histogram dari registry + gauge antrian event & cache."""
+    gauges = {f"event_pool_{k}": v for k, v in event_pool.stats().items()}
+    gauges.update({f"reply_cache_{k}": v for k, v in reply_cache.stats().items()})
+    gauges["embedding_index_size"] = len(embedding_index)
+    return Response(registry.render_prometheus(gauges), mimetype="text/plain; version=0.0.4")
+
+def dispatch_event(event):
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        with registry.timer("chat_reply"):
+            handle_message(event)
+
+def send_reply(event, messages):
+    """Balas pakai reply token kalau masih berlaku, kalau sudah basi pakai push ke user."""
+    age = time.time() - event.timestamp / 1000
+    if age < REPLY_TOKEN_TTL:
+        line_bot_api.reply_message(event.reply_token, messages)
+    else:
+        print(f"⏰ Reply token kedaluwarsa ({age:.0f} detik), kirim via push.")
+        line_bot_api.push_message(event.source.user_id, messages)
+
+event_pool = EventPool(dispatch_event, workers=EVENT_WORKERS, max_queue=EVENT_QUEUE_SIZE)
+
+# 2. SUSUN BALASAN PER KATEGORI (di-cache)
+def load_category_replies(category_filter):
+    """Query 14 hari terakhir + susun teks balasan. Return list teks (max 5 balon)."""
+    title = CATEGORY_TITLES[category_filter]
+
+    # 1. Hitung Tanggal 14 Hari Lalu
+    two_weeks_ago = (datetime.now() - timedelta(days=14)).isoformat()
+    
+    # 2. Query dengan Filter Waktu & Limit lebih besar (15)
+    data = storage.recent_by_category([category_filter], since=two_weeks_ago, limit=15)
+    
+    if not data:
+        return [f"📭 Tidak ada info {category_filter} dalam 14 hari terakhir."]
+
+    # Email 1 thread (open recruitment -> perpanjangan -> reminder) cukup tampil yang terbaru
+    threads, _ = latest_per_thread(data)
+    data = [dict(email, related_count=count) for email, count in threads]
+
+    # --- LOGIKA BATCHING (Pecah Pesan) ---
+    # LINE reply token bisa kirim max 5 balon chat sekaligus.
+    # Kita akan pecah: 1 balon chat isi max 5 email.
+    replies = []
+    BATCH_SIZE = 5
+    
+    # Loop per pecahan 5 data
+    for i in range(0, len(data), BATCH_SIZE):
+        batch = data[i : i + BATCH_SIZE]
+        current_part = (i // BATCH_SIZE) + 1
+        total_parts = math.ceil(len(data) / BATCH_SIZE)
+        
+        # Header per balon
+        reply_text = f"{title} (Part {current_part}/{total_parts})\n"
+        reply_text += "----------------\n"
+        
+        for idx, email in enumerate(batch, 1):
+            # Nomor urut global (misal 1, 2... lalu 6, 7...)
+            real_idx = i + idx
+            
+            reply_text += f"{real_idx}. {email['subject'][:40]}...\n"
+            reply_text += f"   📝 {email.get('summary_text', '-')}\n"
+            if email.get('deadline_date'):
+                reply_text += f"   📅 {email['deadline_date']}\n"
+            if email.get('related_count'):
+                reply_text += f"   🔗 +{email['related_count']} email terkait\n"
+            reply_text += "\n"
+        
+        # Masukkan text yang sudah jadi ke daftar kirim
+        replies.append(reply_text)
+
+    return replies
+
+# Index full-text lokal untuk pencarian bebas ("magang data science", "beasiswa 2025").
+# Di-sync dari storage saat start dan setiap versi data berubah (lihat cache_versions).
+search_index = SearchIndex()
+# Index embedding (summary_text) untuk "mirip ..." ikut diisi dari sync yang sama
+embedding_index = EmbeddingIndex()
+
+def sync_search_index():
+    try:
+        count = search_index.sync_from_db(storage, also_index=[embedding_index])
+        print(f"🔎 Index pencarian ter-sync ({count} email).")
+    except Exception as e:
+        print(f"⚠️ Gagal sync index pencarian: {e}")
+
+reply_cache = ReplyCache(
+    load_category_replies,
+    ttl=REPLY_CACHE_TTL,
+    version_fetcher=lambda: fetch_version(storage),
+    on_change=sync_search_index,
+)
+# Poller versi langsung jalan, jadi index pencarian sudah ter-sync sebelum chat pertama
+reply_cache.start_poller()
+
+def build_search_reply(query):
+    results = search_index.search(query, limit=SEARCH_RESULT_LIMIT)
+    if not results:
+        return f"🔎 Tidak ada email yang cocok dengan '{query}'.\nKetik 'help' untuk menu."
+    reply_text = f"🔎 HASIL PENCARIAN: {query}\n"
+    reply_text += "----------------\n"
+    for idx, email in enumerate(results, 1):
+        reply_text += f"{idx}. {(email['subject'] or '-')[:40]}...\n"
+        reply_text += f"   📝 {email.get('summary_text') or '-'}\n"
+        if email.get('deadline_date'):
+            reply_text += f"   📅 {email['deadline_date']}\n"
+        reply_text += "\n"
+    return reply_text
+
+def build_similar_reply(text):
+    """Email yang ringkasannya mirip dengan teks, dikelompokkan per thread (yang terbaru saja)."""
+    matches = embedding_index.similar_to_text(text, k=SEARCH_RESULT_LIMIT * 3)
+    emails = search_index.get_docs([email_id for email_id, _ in matches])
+    threads, _ = latest_per_thread(emails)
+    if not threads:
+        return f"🔗 Tidak ada email yang mirip dengan '{text}'.\nKetik 'help' untuk menu."
+    reply_text = f"🔗 EMAIL MIRIP: {text}\n"
+    reply_text += "----------------\n"
+    for idx, (email, related_count) in enumerate(threads[:SEARCH_RESULT_LIMIT], 1):
+        reply_text += f"{idx}. {(email['subject'] or '-')[:40]}...\n"
+        reply_text += f"   📝 {email.get('summary_text') or '-'}\n"
+        if email.get('deadline_date'):
+            reply_text += f"   📅 {email['deadline_date']}\n"
+        if related_count:
+            reply_text += f"   🔗 +{related_count} email terkait\n"
+        reply_text += "\n"
+    return reply_text
+
+# 3. LOGIKA JAWAB PESAN (dipanggil worker EventPool)
 def handle_message(event):
     user_msg = event.message.text.lower().strip()
     
     # --- LOGIKA KATEGORI ---
     category_filter = None
-    title = ""
     
     # Keyword Mapping
     if user_msg in ["skkm", "benefit", "lomba", "beasiswa", "poin"]:
         category_filter = "BENEFIT"
-        title = "🎁 INFO SKKM & BENEFIT"
     elif user_msg in ["tugas", "deadline", "pr", "task", "ujian"]:
         category_filter = "TASK"
-        title = "📌 DAFTAR TUGAS & UJIAN"
     elif user_msg in ["urgent", "penting", "darurat", "batal"]:
         category_filter = "URGENT"
-        title = "🚨 INFO URGENT/PENTING"
     elif user_msg in ["info", "berita", "news", "kabar", "pengumuman"]:
         category_filter = "NOISE" 
-        title = "📰 BERITA & PENGUMUMAN"
     elif user_msg == "help":
         help_text = (
             "🤖 **Menu Bot UMN**\n\n"
@@ -65,66 +225,30 @@ def handle_message(event):
             "- 'skkm'   : Info poin & lomba (2 minggu terakhir)\n"
             "- 'tugas'  : Deadline tugas (2 minggu terakhir)\n"
             "- 'urgent' : Info darurat\n"
-            "- 'info'   : Berita kampus"
+            "- 'info'   : Berita kampus\n\n"
+            "Atau ketik kata bebas untuk mencari, misal:\n"
+            "'magang data science', 'beasiswa 2025'\n\n"
+            "Ketik 'mirip <teks>' untuk email sejenis (1 thread = 1 baris)."
         )
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=help_text))
+        send_reply(event, TextSendMessage(text=help_text))
         return
 
-    # --- EKSEKUSI DATABASE ---
+    # --- AMBIL BALASAN (CACHE -> DATABASE) ---
     if category_filter:
-        # 1. Hitung Tanggal 14 Hari Lalu
-        two_weeks_ago = (datetime.now() - timedelta(days=14)).isoformat()
-        
-        # 2. Query dengan Filter Waktu & Limit lebih besar (15)
-        response = supabase.table("emails") \
-            .select("*") \
-            .eq("category", category_filter) \
-            .gte("received_at", two_weeks_ago) \
-            .order("received_at", desc=True) \
-            .limit(15) \
-            .execute()
-        
-        data = response.data
-        
-        if data:
-            # --- LOGIKA BATCHING (Pecah Pesan) ---
-            # LINE reply token bisa kirim max 5 balon chat sekaligus.
-            # Kita akan pecah: 1 balon chat isi max 5 email.
-            messages_to_send = []
-            BATCH_SIZE = 5
-            
-            # Loop per pecahan 5 data
-            for i in range(0, len(data), BATCH_SIZE):
-                batch = data[i : i + BATCH_SIZE]
-                current_part = (i // BATCH_SIZE) + 1
-                total_parts = math.ceil(len(data) / BATCH_SIZE)
-                
-                # Header per balon
-                reply_text = f"{title} (Part {current_part}/{total_parts})\n"
-                reply_text += "----------------\n"
-                
-                for idx, email in enumerate(batch, 1):
-                    # Nomor urut global (misal 1, 2... lalu 6, 7...)
-                    real_idx = i + idx
-                    
-                    reply_text += f"{real_idx}. {email['subject'][:40]}...\n"
-                    reply_text += f"   📝 {email.get('summary_text', '-')}\n"
-                    if email.get('deadline_date'):
-                        reply_text += f"   📅 {email['deadline_date']}\n"
-                    reply_text += "\n"
-                
-                # Masukkan text yang sudah jadi ke daftar kirim
-                messages_to_send.append(TextSendMessage(text=reply_text))
-            
-            # Kirim semua balon chat sekaligus (Max 5 balon)
-            line_bot_api.reply_message(event.reply_token, messages_to_send)
-            
-        else:
-            fallback_msg = f"📭 Tidak ada info {category_filter} dalam 14 hari terakhir."
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=fallback_msg))
+        replies = reply_cache.get(category_filter)
+        # Kirim semua balon chat sekaligus (Max 5 balon)
+        send_reply(event, [TextSendMessage(text=t) for t in replies])
     
+    # --- EMAIL MIRIP (INDEX EMBEDDING) ---
+    elif user_msg.startswith(SIMILAR_PREFIX) and len(user_msg) - len(SIMILAR_PREFIX) >= SEARCH_MIN_CHARS:
+        send_reply(event, TextSendMessage(text=build_similar_reply(user_msg[len(SIMILAR_PREFIX):])))
+
+    # --- PENCARIAN BEBAS (INDEX LOKAL) ---
+    elif len(user_msg) >= SEARCH_MIN_CHARS:
+        send_reply(event, TextSendMessage(text=build_search_reply(user_msg)))
+
     else:
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text="Maaf, ketik 'help' untuk menu."))
+        send_reply(event, TextSendMessage(text="Maaf, ketik 'help' untuk menu."))
 
 # Jalankan Server
 if __name__ == "__main__":
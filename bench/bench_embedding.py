@@ -0,0 +1,91 @@
+"""
+Benchmark index embedding (embedding_index.py) dengan email sintetis.
+
+    python bench/bench_embedding.py              # 100k email, 200 query
+    python bench/bench_embedding.py --size 10000 --queries 50
+
+Yang diukur: waktu embed + append ke memmap, latency top-k (1 query & batch),
+dan waktu latest_per_thread untuk ukuran list rekap/chatbot.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_index import EmbeddingIndex, embed_texts, latest_per_thread  # noqa: E402
+
+TOPICS = [
+    "open recruitment panitia", "beasiswa prestasi", "lomba karya tulis", "seminar nasional",
+    "kuis mingguan", "ujian tengah semester", "magang data science", "webinar karier",
+    "pendaftaran ukm", "workshop desain", "pembayaran uang kuliah", "jadwal bimbingan",
+]
+STAGES = ["dibuka", "perpanjangan deadline", "reminder terakhir", "pengumuman hasil"]
+FILLER = "mahasiswa wajib daftar lewat link form sebelum tanggal yang ditentukan poin skkm".split()
+
+
+def synthetic_summary(rng, i):
+    topic = rng.choice(TOPICS)
+    words = rng.sample(FILLER, 6)
+    return f"{topic} {rng.choice(STAGES)} angkatan {2020 + i % 6} " + " ".join(words)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--chunk", type=int, default=5000, help="Email per panggilan index_emails")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    emails = [
+        {"id": i, "summary_text": synthetic_summary(rng, i), "received_at": f"2026-01-{1 + i % 28:02d}T08:00:00"}
+        for i in range(args.size)
+    ]
+    # Subjek = topik (syarat thread: pengirim atau subjek sama, lihat latest_per_thread)
+    for email in emails:
+        email["subject"] = next(t for t in TOPICS if email["summary_text"].startswith(t)).title()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = EmbeddingIndex(os.path.join(tmp, "bench"))
+
+        start = time.perf_counter()
+        for i in range(0, len(emails), args.chunk):
+            index.index_emails(emails[i : i + args.chunk])
+        build = time.perf_counter() - start
+        print(f"Index {len(index):,} email: {build:.2f} s ({len(index) / build:,.0f} email/s)")
+
+        queries = [synthetic_summary(rng, i) for i in range(args.queries)]
+        _, single = timed(lambda: [index.similar_to_text(q, args.k) for q in queries])
+        print(f"Top-{args.k} per query: {single / len(queries) * 1000:.2f} ms")
+
+        vectors = embed_texts(queries)
+        _, batch = timed(lambda: index.search_vectors(vectors, args.k))
+        print(f"Top-{args.k} batch {len(queries)} query: {batch * 1000:.1f} ms total "
+              f"({batch / len(queries) * 1000:.3f} ms/query)")
+
+        # Buka ulang dari file (memmap) -> tidak perlu embed ulang
+        _, reopen = timed(lambda: EmbeddingIndex(os.path.join(tmp, "bench")))
+        print(f"Buka ulang index: {reopen * 1000:.1f} ms")
+
+    for size in (15, 100, 500):
+        sample = rng.sample(emails, min(size, len(emails)))
+        (threads, _), elapsed = timed(lambda: latest_per_thread(sample))
+        print(f"latest_per_thread({size}): {elapsed * 1000:.1f} ms -> {len(threads)} thread")
+
+    print(f"Ukuran matriks: {len(emails) * index.matrix.shape[1] * 4 / 1e6:.1f} MB (float32)")
+
+
+if __name__ == "__main__":
+    np.seterr(all="ignore")
+    main()
@@ -0,0 +1,163 @@
+"""
+Micro-benchmark ekstraksi teks HTML (ingest.clean_email_body) dengan newsletter kampus sintetis.
+
+    python bench/bench_html.py                  # 300 email per bentuk
+    python bench/bench_html.py --count 50 --limit 4000
+
+Dibandingkan: implementasi lama (BeautifulSoup html.parser, get_text seluruh dokumen) vs
+html_text.html_to_text (streaming, berhenti di budget) dengan backend lxml & html.parser.
+Bentuk korpus: newsletter ringan (sama dengan bench/fake_imap), newsletter gaya Mailchimp
+(CSS besar, tabel layout bertingkat, preheader tersembunyi), pengumuman Outlook/Word
+(span per kata, <o:p>), dan jadwal ujian berupa tabel ratusan baris.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bs4 import BeautifulSoup  # noqa: E402
+import html_text  # noqa: E402
+from fake_imap import _newsletter_html, PARAGRAPH, COURSES, EVENTS  # noqa: E402
+
+HIDDEN_MARKER = "preheader-tersembunyi"
+CSS_RULE = ".col-{i}{{width:100%!important;max-width:{w}px;font-family:Helvetica,Arial,sans-serif;color:#{c:06x}}}"
+
+
+def _paragraph(rng):
+    return PARAGRAPH.format(subject=f"{rng.choice(EVENTS)} {rng.randint(2025, 2026)}", day=rng.randint(1, 28),
+                            n=rng.randint(1, 999), batch=rng.choice([2022, 2023, 2024, 2025]))
+
+
+def mailchimp_html(rng):
+    """Newsletter kemahasiswaan: ~100-300KB, sebagian besar markup & CSS."""
+    css = "".join(CSS_RULE.format(i=i, w=rng.randint(200, 600), c=rng.randint(0, 0xFFFFFF)) for i in range(400))
+    media = "@media only screen and (max-width:480px){" + css[:6000] + "}"
+    articles = []
+    for i in range(rng.randint(10, 30)):
+        articles.append(
+            '<tr><td align="center" valign="top"><table border="0" cellpadding="0" cellspacing="0" width="100%">'
+            f'<tr><td class="col-{i}" style="padding:18px 18px 9px;color:#202020;font-family:Helvetica;'
+            'font-size:16px;line-height:150%;text-align:left;mso-line-height-rule:exactly">'
+            f'<h2 style="margin:0;font-size:22px">{rng.choice(EVENTS)} #{i}</h2>'
+            f'<img alt="{rng.choice(EVENTS)}" src="https://mcusercontent.com/{rng.randint(1, 9999)}.png" width="564">'
+            f'<p style="margin:10px 0">{_paragraph(rng)}</p>'
+            '<table border="0" cellpadding="0" cellspacing="0" style="border-collapse:separate!important">'
+            '<tr><td align="center" style="background:#0B4F8A;border-radius:4px">'
+            f'<a href="https://umn.ac.id/r/{rng.randint(1, 99999)}" style="color:#fff;text-decoration:none">'
+            'Daftar Sekarang</a></td></tr></table></td></tr></table></td></tr>'
+        )
+    return (
+        '<!DOCTYPE html><html xmlns:v="urn:schemas-microsoft-com:vml"><head><meta charset="UTF-8">'
+        f"<title>Newsletter Kemahasiswaan</title><style type=\"text/css\">{css}{media}</style>"
+        "<!--[if gte mso 9]><xml><o:OfficeDocumentSettings><o:AllowPNG/></o:OfficeDocumentSettings></xml><![endif]-->"
+        "<script>window.dataLayer=window.dataLayer||[];function gtag(){dataLayer.push(arguments)}</script></head>"
+        '<body style="margin:0;padding:0"><span class="mcnPreviewText" style="display:none!important;'
+        f'mso-hide:all">{HIDDEN_MARKER} Info terbaru minggu ini{"&#847;&zwnj;&nbsp;" * 120}</span>'
+        '<center><table align="center" border="0" cellpadding="0" cellspacing="0" height="100%" width="100%">'
+        '<tr><td align="center" valign="top"><table border="0" cellpadding="0" cellspacing="0" width="600">'
+        + "".join(articles) +
+        '</table></td></tr><tr><td style="font-size:12px;color:#656565">'
+        "Anda menerima email ini karena terdaftar sebagai mahasiswa UMN.<br>"
+        '<a href="https://umn.us1.list-manage.com/unsubscribe">Berhenti berlangganan</a> | '
+        "Jl. Scientia Boulevard, Gading Serpong</td></tr></table></center>"
+        '<img src="https://umn.us1.list-manage.com/track/open.php?u=1" height="1" width="1"></body></html>'
+    )
+
+
+def outlook_html(rng):
+    """Pengumuman prodi yang ditulis di Word/Outlook lalu di-forward: span per kata, <o:p>, CSS Mso."""
+    css = "".join(f"p.MsoNormal{i}, li.MsoNormal{i}{{margin:0cm;font-size:11.0pt;font-family:\"Calibri\",sans-serif}}"
+                  for i in range(150))
+    paragraphs = []
+    for _ in range(rng.randint(8, 20)):
+        words = _paragraph(rng).split()
+        spans = " ".join(f"<span style='font-size:11.0pt;font-family:\"Calibri\",sans-serif;color:#1F497D'>{w}</span>"
+                         for w in words)
+        paragraphs.append(f"<p class=MsoNormal>{spans}<o:p>&nbsp;</o:p></p>")
+    course = rng.choice(COURSES)
+    return (
+        "<html xmlns:o=\"urn:schemas-microsoft-com:office:office\"><head><meta name=Generator content=\"Microsoft Word 15\">"
+        f"<style><!-- {css} --></style></head><body lang=EN-US link=\"#0563C1\"><div class=WordSection1>"
+        f"<p class=MsoNormal><b>From:</b> Kaprodi Informatika<br><b>Subject:</b> Perubahan jadwal {course}<o:p></o:p></p>"
+        + "".join(paragraphs) +
+        "<p class=MsoNormal>Hormat kami,<o:p></o:p></p><p class=MsoNormal>Program Studi Informatika<o:p></o:p></p>"
+        "</div></body></html>"
+    )
+
+
+def schedule_html(rng):
+    """Jadwal UAS: tabel ratusan baris, tiap sel ber-style inline."""
+    rows = "".join(
+        f'<tr><td style="border:1px solid #ccc;padding:4px">{rng.choice(COURSES)}</td>'
+        f'<td style="border:1px solid #ccc;padding:4px">{rng.randint(1, 28)} Juni 2026</td>'
+        f'<td style="border:1px solid #ccc;padding:4px">{rng.randint(7, 17):02d}.00 WIB</td>'
+        f'<td style="border:1px solid #ccc;padding:4px">Ruang C{rng.randint(301, 320)}</td></tr>'
+        for _ in range(rng.randint(200, 500))
+    )
+    return (
+        "<html><head><style>table{border-collapse:collapse}td{font-family:Arial}</style></head><body>"
+        "<p>Berikut jadwal UAS semester genap. Wajib hadir 15 menit sebelum ujian.</p>"
+        f'<table width="100%"><tr><th>Mata Kuliah</th><th>Tanggal</th><th>Jam</th><th>Ruang</th></tr>{rows}</table>'
+        "<p>Terima kasih,<br>BAAK UMN</p></body></html>"
+    )
+
+
+def light_html(rng):
+    subject = f"Open Recruitment Panitia {rng.choice(EVENTS)} 2026"
+    return _newsletter_html(rng, subject, _paragraph(rng))
+
+
+SHAPES = {"ringan": light_html, "mailchimp": mailchimp_html, "outlook": outlook_html, "jadwal": schedule_html}
+
+
+def bs4_get_text(html, limit):
+    """Implementasi lama clean_email_body (limit diabaikan: seluruh dokumen di-parse)."""
+    return BeautifulSoup(html, "html.parser").get_text(separator="\n", strip=True)
+
+
+def run(fn, corpus, limit):
+    timings = []
+    outputs = []
+    for html in corpus:
+        start = time.perf_counter()
+        outputs.append(fn(html, limit))
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=300, help="Email per bentuk")
+    parser.add_argument("--limit", type=int, default=html_text.HTML_TEXT_CHAR_LIMIT, help="Budget karakter teks")
+    args = parser.parse_args()
+
+    implementations = {"bs4 (lama)": bs4_get_text}
+    for name in ("lxml", "html.parser"):
+        if name in html_text.BACKENDS:
+            implementations[f"stream {name}"] = lambda html, limit, name=name: html_text.html_to_text(html, limit, name)
+    if "lxml" not in html_text.BACKENDS:
+        print("ℹ️ lxml tidak terpasang, hanya backend html.parser yang diukur.")
+
+    print(f"{'bentuk':<10} {'implementasi':<18} {'KB/email':>9} {'ms/email':>9} {'p95 ms':>8} {'MB/s':>7} "
+          f"{'speedup':>8} {'teks':>7} {'bocor':>6}")
+    for shape, build in SHAPES.items():
+        rng = random.Random(42)
+        corpus = [build(rng) for _ in range(args.count)]
+        size = sum(len(html) for html in corpus)
+        baseline = None
+        for name, fn in implementations.items():
+            timings, outputs = run(fn, corpus, args.limit)
+            total = sum(timings)
+            baseline = baseline or total
+            # Teks preheader tersembunyi yang ikut terambil (masuk prompt AI percuma)
+            leaked = sum(HIDDEN_MARKER in text for text in outputs)
+            print(f"{shape:<10} {name:<18} {size / len(corpus) / 1024:>9.1f} {total / len(corpus) * 1000:>9.2f} "
+                  f"{timings[int(len(timings) * 0.95)] * 1000:>8.2f} {size / total / 1e6:>7.1f} "
+                  f"{baseline / total:>7.1f}x {sum(map(len, outputs)) // len(outputs):>7,} {leaked:>6}")
+
+
+if __name__ == "__main__":
+    main()
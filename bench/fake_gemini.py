@@ -0,0 +1,153 @@
+"""
+Stub Gemini untuk benchmark offline: menggantikan genai.GenerativeModel di proses yang sama.
+
+    import fake_gemini
+    fake_gemini.install(latency=0.05, rate_limit_ratio=0.02)
+
+Jawaban dibuat dari subjek email (kata kunci -> kategori), dengan jeda `latency` detik
+per request dan error 429 (ResourceExhausted, sama seperti SDK asli) dengan peluang
+`rate_limit_ratio`. Prompt batch ([EMAIL id=...]) dijawab berupa JSON array.
+Dengan `malformed_ratio`, sebagian jawaban dibuat cacat seperti jawaban model asli
+(teks tambahan, kutip tunggal, array terpotong, kategori/tanggal tidak baku, field hilang).
+"""
+import re
+import json
+import time
+import random
+import threading
+from datetime import date, timedelta
+import google.generativeai as genai
+from google.api_core.exceptions import ResourceExhausted
+
+BATCH_ITEM = re.compile(r"\[EMAIL id=([^\]]+)\]\s*- Pengirim: [^\n]*\n- Subjek: ([^\n]*)")
+SINGLE_SUBJECT = re.compile(r"- Subjek: ([^\n]*)")
+
+CATEGORY_KEYWORDS = [
+    ("URGENT", ("batal", "perubahan", "pindah ruang", "besok")),
+    ("BENEFIT", ("recruitment", "beasiswa", "lomba", "magang", "skkm", "webinar")),
+    ("TASK", ("tugas", "kuis", "ujian", "pengumpulan")),
+]
+
+
+class _Usage:
+    def __init__(self, prompt_tokens, completion_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = completion_tokens
+
+
+class _Response:
+    def __init__(self, text, prompt):
+        self.text = text
+        self.usage_metadata = _Usage(max(1, len(prompt) // 4), max(1, len(text) // 4))
+
+
+def classify_subject(subject):
+    lowered = subject.lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return category
+    return "NOISE"
+
+
+def fake_analysis(subject):
+    category = classify_subject(subject)
+    deadline = None
+    if category in ("BENEFIT", "TASK"):
+        deadline = (date.today() + timedelta(days=len(subject) % 14 + 1)).isoformat()
+    return {
+        "category": category,
+        "deadline_date": deadline,
+        "priority_score": {"URGENT": 5, "TASK": 4, "BENEFIT": 3}.get(category, 1),
+        "summary_text": f"Ringkasan: {subject}",
+        "action_items": ["Cek detail di email"],
+    }
+
+
+def _bad_category(payload, rng):
+    item = rng.choice(payload) if isinstance(payload, list) else payload
+    item["category"] = {"URGENT": "Penting", "TASK": "task", "BENEFIT": "Benefit!"}.get(item["category"], "noise")
+
+
+def _bad_date(payload, rng):
+    for item in payload if isinstance(payload, list) else [payload]:
+        if item["deadline_date"]:
+            year, month, day = item["deadline_date"].split("-")
+            item["deadline_date"] = f"{int(day)}/{month}/{year}"
+
+
+def _missing_summary(payload, rng):
+    item = rng.choice(payload) if isinstance(payload, list) else payload
+    del item["summary_text"]
+
+
+FIELD_DEFECTS = (_bad_category, _bad_date, _missing_summary)
+TEXT_DEFECTS = {
+    "trailing": lambda text: text + "\n\nSemoga membantu! Beri tahu kalau perlu format lain.",
+    "single_quotes": lambda text: text.replace('"', "'"),
+    "fence": lambda text: f"Berikut hasilnya:\n```json\n{text}\n```",
+    "truncated": lambda text: text[: int(len(text) * 0.8)],
+}
+
+
+def malform(payload, rng):
+    """Cacatkan 1 jawaban: field tidak baku atau teks JSON rusak. Return teks jawaban."""
+    kind = rng.choice([*FIELD_DEFECTS, *TEXT_DEFECTS])
+    if kind in TEXT_DEFECTS:
+        if kind == "truncated" and not isinstance(payload, list):
+            kind = "trailing"  # Objek tunggal terpotong tidak bisa diselamatkan; model asli jarang begitu
+        return TEXT_DEFECTS[kind](json.dumps(payload, ensure_ascii=False))
+    kind(payload, rng)
+    return json.dumps(payload, ensure_ascii=False)
+
+
+class FakeModelStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.rate_limited = 0
+        self.malformed = 0
+
+    def record(self, model_name, limited):
+        with self.lock:
+            self.calls[model_name] = self.calls.get(model_name, 0) + 1
+            self.rate_limited += int(limited)
+
+
+stats = FakeModelStats()
+
+
+def install(latency=0.05, rate_limit_ratio=0.0, retry_after=1, seed=42, malformed_ratio=0.0):
+    """Ganti genai.GenerativeModel dengan stub. Panggil sebelum request AI pertama."""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class FakeGenerativeModel:
+        def __init__(self, model_name, **kwargs):
+            self.model_name = model_name
+
+        def generate_content(self, prompt, generation_config=None, **kwargs):
+            with rng_lock:
+                limited = rng.random() < rate_limit_ratio
+                broken = rng.random() < malformed_ratio
+            stats.record(self.model_name, limited)
+            time.sleep(latency)
+            if limited:
+                raise ResourceExhausted(f"Quota exceeded for {self.model_name}. Please retry in {retry_after}s")
+
+            items = BATCH_ITEM.findall(prompt)
+            if items:
+                payload = [{"id": email_id, **fake_analysis(subject)} for email_id, subject in items]
+            else:
+                match = SINGLE_SUBJECT.search(prompt)
+                payload = fake_analysis(match.group(1) if match else "")
+            if broken:
+                with rng_lock:
+                    text = malform(payload, rng)
+                with stats.lock:
+                    stats.malformed += 1
+            else:
+                text = json.dumps(payload, ensure_ascii=False)
+            return _Response(text, prompt)
+
+    genai.GenerativeModel = FakeGenerativeModel
+    return stats
@@ -0,0 +1,376 @@
+"""
+Server IMAP4rev1 mini (tanpa SSL) untuk benchmark offline, berisi email kampus sintetis.
+
+Perintah yang didukung cukup untuk imaplib + imap_tools + imap_sync:
+CAPABILITY, LOGIN, SELECT/EXAMINE, STATUS, UID SEARCH (UID/SINCE/ALL),
+UID FETCH (BODY[HEADER], BODY[], BODYSTRUCTURE, BODY[x.y]<a.b>, FLAGS, RFC822.SIZE),
+UID STORE, EXPUNGE, NOOP, LOGOUT.
+
+Email dibuat malas per UID (deterministik dari seed), jadi inbox 100k tidak perlu
+disimpan di memori: campuran teks polos, multipart/alternative, newsletter HTML
+berat, lampiran PDF, dan sebagian pengirim yang masuk blacklist ingest.
+"""
+import re
+import base64
+import quopri
+import random
+import threading
+import socketserver
+from functools import lru_cache
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+UIDVALIDITY = 1
+INBOX_SPAN = timedelta(hours=12)   # Semua email jatuh di 12 jam terakhir (masuk window DAYS_BACK)
+ATTACHMENT_BYTES = 48 * 1024
+
+COURSES = ["Kalkulus", "Basis Data", "Jaringan Komputer", "Statistika", "Pemrograman Web", "Etika Profesi"]
+EVENTS = ["UMN Festival", "Techno Week", "Mobile Legends Cup", "Company Visit", "Seminar AI"]
+SUBJECTS = [
+    "Kelas {course} besok dibatalkan",
+    "Perubahan jadwal {course} minggu ini",
+    "Open Recruitment Panitia {event} 2026",
+    "Beasiswa Prestasi Semester Genap angkatan {batch}",
+    "Lomba karya tulis {event} (SKKM)",
+    "Lowongan magang data science batch {n}",
+    "Tugas {course} minggu ke-{n}",
+    "Kuis {course} dibuka",
+    "Newsletter Kampus Edisi {n}",
+    "Info parkir dan fasilitas gedung {n}",
+]
+SENDERS = ["bem@umn.ac.id", "akademik@umn.ac.id", "kemahasiswaan@umn.ac.id", "dosen.{course}@umn.ac.id",
+           "career@umn.ac.id", "info@umn.ac.id"]
+BLACKLISTED = [("noreply@elearning.umn.ac.id", "You have submitted Tugas {course}"),
+               ("do-not-reply@umn.ac.id", "Attendance {course} tercatat")]
+PARAGRAPH = (
+    "Halo mahasiswa, berikut informasi untuk {subject}. Pendaftaran dibuka sampai tanggal {day} "
+    "dan wajib diisi lewat link https://forms.umn.ac.id/{n}. Peserta mendapat poin SKKM dan sertifikat. "
+    "Syarat: mahasiswa aktif angkatan {batch}, IPK minimal 3.00. "
+)
+FOOTER = "\n\n--\nBiro Kemahasiswaan UMN\nJl. Scientia Boulevard, Gading Serpong\nJangan balas email ini."
+
+
+def _newsletter_html(rng, subject, text):
+    """HTML gaya newsletter: CSS inline/besar, script tracking, tabel layout, elemen tersembunyi."""
+    rows = "".join(
+        f'<tr><td style="padding:12px;font-family:Arial"><h3>{subject} #{i}</h3>'
+        f'<p>{text}</p><a href="https://umn.ac.id/berita/{rng.randint(1, 9999)}">Baca selengkapnya</a></td></tr>'
+        for i in range(rng.randint(4, 12))
+    )
+    return (
+        "<html><head><style>" + ".c{color:#333;margin:0 auto}" * 60 + "</style>"
+        "<script>window.dataLayer=[];function track(){return 1}</script></head>"
+        '<body><div style="display:none">preheader ' + "&nbsp;" * 80 + "</div>"
+        f'<table width="600" class="c">{rows}</table>'
+        '<img src="https://track.umn.ac.id/open.gif" width="1" height="1"></body></html>'
+    )
+
+
+class Part:
+    """Bagian MIME ringan (email.message terlalu lambat untuk membangun 100k email)."""
+
+    def __init__(self, maintype, subtype, body=b"", params=None, encoding="7BIT", filename=None, children=None):
+        self.maintype = maintype
+        self.subtype = subtype
+        self.body = body              # Sudah ter-encode (quoted-printable/base64)
+        self.params = params or []
+        self.encoding = encoding
+        self.filename = filename
+        self.children = children or []
+        self.boundary = None
+
+    def render(self):
+        """Header Content-* + body, dalam bentuk bytes CRLF."""
+        params = "".join(f'; {k}="{v}"' for k, v in self.params)
+        head = f"Content-Type: {self.maintype}/{self.subtype}{params}\r\n"
+        if not self.children:
+            head += f"Content-Transfer-Encoding: {self.encoding.lower()}\r\n"
+            if self.filename:
+                head += f'Content-Disposition: attachment; filename="{self.filename}"\r\n'
+            return head.encode() + b"\r\n" + self.body
+        delimiter = f"--{self.boundary}".encode()
+        parts = b"".join(delimiter + b"\r\n" + child.render() + b"\r\n" for child in self.children)
+        return head.encode() + b"\r\n" + parts + delimiter + b"--\r\n"
+
+
+def _text(subtype, content):
+    return Part("text", subtype, quopri.encodestring(content.encode("utf-8")).replace(b"\n", b"\r\n"),
+                params=[("charset", "utf-8")], encoding="QUOTED-PRINTABLE")
+
+
+def _multipart(subtype, children, boundary):
+    part = Part("multipart", subtype, children=children)
+    part.boundary = boundary
+    part.params = [("boundary", boundary)]
+    return part
+
+
+@lru_cache(maxsize=8)
+def _attachment_body(variant):
+    """Beberapa varian PDF saja (base64 48KB mahal kalau dibuat ulang per email)."""
+    data = b"%PDF-1.4\n" + random.Random(variant).randbytes(ATTACHMENT_BYTES)
+    return base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+
+class SyntheticInbox:
+    """Inbox N email; email ke-i (UID i) dibangun ulang deterministik kapan saja dibutuhkan."""
+
+    def __init__(self, size, seed=7, now=None):
+        self.size = size
+        self.seed = seed
+        self.now = now or datetime.now(timezone.utc)
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.message = lru_cache(maxsize=4096)(self._build)
+
+    def received_at(self, uid):
+        return self.now - INBOX_SPAN + INBOX_SPAN * uid / (self.size + 1)
+
+    def _build(self, uid):
+        """Return (Part root, raw bytes RFC822)."""
+        rng = random.Random(self.seed * 1_000_003 + uid)
+        values = {
+            "course": rng.choice(COURSES), "event": rng.choice(EVENTS), "n": rng.randint(1, 40),
+            "batch": rng.choice([2022, 2023, 2024, 2025]), "day": rng.randint(1, 28),
+        }
+        if rng.random() < 0.05:
+            sender, subject = (s.format(**values) for s in rng.choice(BLACKLISTED))
+        else:
+            subject = rng.choice(SUBJECTS).format(**values)
+            sender = rng.choice(SENDERS).format(course=values["course"].lower().replace(" ", ""))
+        text = PARAGRAPH.format(subject=subject, **values) * rng.randint(1, 4) + FOOTER
+        html = f"<html><body><p>{text}</p></body></html>"
+
+        shape = rng.random()
+        if shape < 0.3:
+            root = _text("plain", text)
+        elif shape < 0.55:
+            root = _multipart("alternative", [_text("plain", text), _text("html", html)], f"alt-{uid}")
+        elif shape < 0.8:
+            root = _text("html", _newsletter_html(rng, subject, text))
+        else:
+            alternative = _multipart("alternative", [_text("plain", text), _text("html", html)], f"alt-{uid}")
+            attachment = Part("application", "pdf", _attachment_body(uid % 8), encoding="BASE64",
+                              params=[("name", f"lampiran-{uid}.pdf")], filename=f"lampiran-{uid}.pdf")
+            root = _multipart("mixed", [alternative, attachment], f"mix-{uid}")
+
+        headers = (
+            f"From: {sender}\r\n"
+            "To: mahasiswa@student.umn.ac.id\r\n"
+            f"Subject: {subject}\r\n"
+            f"Date: {format_datetime(self.received_at(uid))}\r\n"
+            f"Message-ID: <bench-{uid}@umn.ac.id>\r\n"
+            "MIME-Version: 1.0\r\n"
+        )
+        return root, headers.encode() + root.render()
+
+
+# =========================================================
+# BODYSTRUCTURE & SECTION
+# =========================================================
+
+def _quote(value):
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _params(pairs):
+    return "(" + " ".join(f"{_quote(k.upper())} {_quote(v)}" for k, v in pairs) + ")" if pairs else "NIL"
+
+
+def bodystructure(part):
+    if part.children:
+        children = "".join(bodystructure(child) for child in part.children)
+        return f"({children} {_quote(part.subtype.upper())} {_params(part.params)} NIL NIL)"
+
+    disposition = f'("ATTACHMENT" {_params([("filename", part.filename)])})' if part.filename else "NIL"
+    head = f"{_quote(part.maintype.upper())} {_quote(part.subtype.upper())} {_params(part.params)} " \
+           f"NIL NIL {_quote(part.encoding)} {len(part.body)}"
+    if part.maintype == "text":
+        lines = part.body.count(b"\n") + 1
+        return f"({head} {lines} NIL {disposition} NIL)"
+    return f"({head} NIL {disposition} NIL)"
+
+
+def section_bytes(part, spec):
+    for index in spec.split("."):
+        if part.children:
+            part = part.children[int(index) - 1]
+        elif index != "1":
+            return b""
+    return part.body
+
+
+# =========================================================
+# SERVER
+# =========================================================
+
+def parse_uid_set(raw, max_uid):
+    uids = set()
+    for piece in raw.split(","):
+        if ":" in piece:
+            start, end = (max_uid if x == "*" else int(x) for x in piece.split(":", 1))
+            uids.update(range(min(start, end), max(start, end) + 1))
+        else:
+            uids.add(max_uid if piece == "*" else int(piece))
+    return sorted(uid for uid in uids if 1 <= uid <= max_uid)
+
+
+FETCH_BODY = re.compile(r"BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?", re.IGNORECASE)
+TOKEN = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+')
+
+
+class ImapHandler(socketserver.StreamRequestHandler):
+    inbox = None   # Diisi FakeImapServer
+    # Respon ditampung lalu di-flush per perintah (bukan 1 paket TCP per baris)
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+
+    def send(self, line):
+        self.wfile.write(line if isinstance(line, bytes) else line.encode() + b"\r\n")
+
+    def handle(self):
+        self.send("* OK [CAPABILITY IMAP4rev1 UIDPLUS] Fake IMAP siap")
+        self.wfile.flush()
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode("utf-8", errors="replace").strip().partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            if command == "LOGOUT":
+                self.send("* BYE Sampai jumpa")
+                self.send(f"{tag} OK LOGOUT selesai")
+                return
+            try:
+                handler = getattr(self, f"cmd_{command.lower()}", None)
+                if handler is None:
+                    self.send(f"{tag} BAD Perintah tidak dikenal")
+                    continue
+                handler(tag, args)
+            except Exception as e:   # Protokol tetap jalan walau 1 perintah gagal
+                self.send(f"{tag} NO {type(e).__name__}: {e}")
+            self.wfile.flush()
+
+    def cmd_capability(self, tag, args):
+        self.send("* CAPABILITY IMAP4rev1 UIDPLUS")
+        self.send(f"{tag} OK CAPABILITY selesai")
+
+    def cmd_noop(self, tag, args):
+        self.send(f"{tag} OK NOOP selesai")
+
+    def cmd_login(self, tag, args):
+        self.send(f"{tag} OK [CAPABILITY IMAP4rev1 UIDPLUS] LOGIN berhasil")
+
+    def cmd_select(self, tag, args):
+        size = self.inbox.size
+        self.send(f"* {size} EXISTS")
+        self.send("* 0 RECENT")
+        self.send("* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+        self.send(f"* OK [UIDVALIDITY {UIDVALIDITY}] UIDs valid")
+        self.send(f"* OK [UIDNEXT {size + 1}] Prediksi UID berikutnya")
+        self.send(f"{tag} OK [READ-WRITE] SELECT selesai")
+
+    cmd_examine = cmd_select
+
+    def cmd_status(self, tag, args):
+        folder = args.split(" (", 1)[0]
+        size = self.inbox.size
+        with self.inbox.lock:
+            unseen = size - len(self.inbox.seen)
+        self.send(f"* STATUS {folder} (MESSAGES {size} RECENT 0 UIDNEXT {size + 1} "
+                  f"UIDVALIDITY {UIDVALIDITY} UNSEEN {unseen})")
+        self.send(f"{tag} OK STATUS selesai")
+
+    def cmd_expunge(self, tag, args):
+        self.send(f"{tag} OK EXPUNGE selesai")
+
+    def cmd_uid(self, tag, args):
+        sub, _, rest = args.partition(" ")
+        getattr(self, f"uid_{sub.lower()}")(tag, rest)
+
+    def uid_search(self, tag, args):
+        tokens = [t for t in TOKEN.findall(args) if t not in ("(", ")")]
+        if tokens and tokens[0].upper() == "CHARSET":
+            tokens = tokens[2:]
+        uids = range(1, self.inbox.size + 1)
+        i = 0
+        while i < len(tokens):
+            key = tokens[i].upper()
+            if key == "UID":
+                allowed = set(parse_uid_set(tokens[i + 1], self.inbox.size))
+                uids = [u for u in uids if u in allowed]
+                i += 2
+            elif key == "SINCE":
+                since = datetime.strptime(tokens[i + 1].strip('"'), "%d-%b-%Y").replace(tzinfo=timezone.utc)
+                uids = [u for u in uids if self.inbox.received_at(u) >= since]
+                i += 2
+            else:
+                i += 1   # ALL dan kriteria lain: tidak menyaring
+        self.send("* SEARCH " + " ".join(map(str, uids)))
+        self.send(f"{tag} OK SEARCH selesai")
+
+    def uid_fetch(self, tag, args):
+        uid_set, _, items = args.partition(" ")
+        items_upper = items.upper()
+        body_match = FETCH_BODY.search(items)
+        for uid in parse_uid_set(uid_set, self.inbox.size):
+            root, raw = self.inbox.message(uid)
+            with self.inbox.lock:
+                seen = uid in self.inbox.seen
+                if body_match and ".PEEK" not in items_upper:
+                    self.inbox.seen.add(uid)
+            fields = [f"UID {uid}"]
+            if "FLAGS" in items_upper:
+                fields.append("FLAGS (\\Seen)" if seen else "FLAGS ()")
+            if "RFC822.SIZE" in items_upper:
+                fields.append(f"RFC822.SIZE {len(raw)}")
+            if "BODYSTRUCTURE" in items_upper:
+                fields.append(f"BODYSTRUCTURE {bodystructure(root)}")
+            prefix = f"* {uid} FETCH (" + " ".join(fields)
+            if not body_match:
+                self.send(prefix + ")")
+                continue
+            spec, start, length = body_match.groups()
+            if spec.upper() == "HEADER":
+                data = raw.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+            elif spec == "":
+                data = raw
+            else:
+                data = section_bytes(root, spec)
+            name = f"BODY[{spec.upper()}]"
+            if start is not None:
+                data = data[int(start) : int(start) + int(length)]
+                name += f"<{start}>"
+            self.send(f"{prefix} {name} {{{len(data)}}}".encode() + b"\r\n" + data + b")\r\n")
+        self.send(f"{tag} OK FETCH selesai")
+
+    def uid_store(self, tag, args):
+        uid_set, _, change = args.partition(" ")
+        uids = parse_uid_set(uid_set, self.inbox.size)
+        if "\\SEEN" in change.upper():
+            with self.inbox.lock:
+                if change.startswith("-"):
+                    self.inbox.seen.difference_update(uids)
+                else:
+                    self.inbox.seen.update(uids)
+        self.send(f"{tag} OK STORE selesai")
+
+
+class FakeImapServer:
+    """`with FakeImapServer(1000) as imap:` -> IMAP_HOST=imap.host, IMAP_PORT=imap.port, IMAP_SSL=0."""
+
+    def __init__(self, size, host="127.0.0.1", port=0, seed=7):
+        self.inbox = SyntheticInbox(size, seed)
+        handler = type("BoundImapHandler", (ImapHandler,), {"inbox": self.inbox})
+        self.server = socketserver.ThreadingTCPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-imap", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,87 @@
+"""
+Stub Messaging API LINE untuk benchmark offline (push, multicast, reply).
+
+Tiap panggilan dicatat (waktu tiba, jumlah balon, replyToken) supaya runner bisa
+menghitung latency chatbot dari webhook masuk sampai balasan sampai di "LINE".
+Arahkan bot ke sini dengan LINE_API_ENDPOINT=<url>.
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATS_PATH = "/_bench/stats"
+
+
+class LineLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}     # endpoint -> jumlah panggilan
+        self.bubbles = 0
+        self.recipients = 0
+        self.replies = {}   # replyToken -> waktu tiba (time.time())
+
+    def record(self, endpoint, payload):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            self.bubbles += len(payload.get("messages") or [])
+            to = payload.get("to")
+            self.recipients += len(to) if isinstance(to, list) else 1
+            if payload.get("replyToken"):
+                self.replies[payload["replyToken"]] = time.time()
+
+    def snapshot(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "bubbles": self.bubbles,
+                    "recipients": self.recipients, "replies": dict(self.replies)}
+
+
+def _make_handler(log, latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Header & body ditulis terpisah; tanpa ini Nagle + delayed ACK menambah ~40ms per request
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-Line-Request-Id", "bench")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == STATS_PATH:
+                return self._reply(200, log.snapshot())
+            self._reply(404, {"message": "Not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if latency:
+                time.sleep(latency)
+            # /v2/bot/message/push -> "message/push"
+            log.record(self.path.split("/v2/bot/", 1)[-1], payload)
+            self._reply(200, {})
+
+    return Handler
+
+
+class FakeLine:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.log = LineLog()
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self.log, latency))
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-line", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,293 @@
+"""
+Stub PostgREST (Supabase) in-memory untuk benchmark offline.
+
+Cukup untuk query yang dipakai bot: select dengan filter eq/neq/gt/gte/lt/lte/in/is,
+order, limit/offset, insert/upsert (Prefer resolution=...), PATCH dan
+rpc/claim_pending_emails. Semua tabel disimpan di dict, dikunci 1 lock global.
+"""
+import json
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+# Kolom unik per tabel: dipakai untuk on_conflict dan lookup cepat eq/in (tanpa scan 100k baris)
+UNIQUE_COLUMNS = {
+    "emails": ("id", "email_uid"),
+    "subscribers": ("id", "line_user_id"),
+    "cache_versions": ("key",),
+}
+DEFAULTS = {
+    "emails": lambda: {
+        "id": str(uuid.uuid4()), "is_notified": False, "created_at": _now(),
+        "processing_by": None, "lease_expires_at": None,
+        "target_faculties": None, "target_batches": None,
+        "urgency_score": None, "queue_at": None,
+    },
+    "subscribers": lambda: {"active": True, "created_at": _now()},
+    "deliveries": lambda: {"delivered_at": _now()},
+}
+OPERATORS = ("eq", "neq", "gt", "gte", "lt", "lte", "in", "is")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _as_text(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def _split_list(raw):
+    """Isi `in.(a,"b,c",d)` -> ["a", "b,c", "d"]."""
+    values, current, quoted = [], "", False
+    for char in raw:
+        if char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            values.append(current)
+            current = ""
+        else:
+            current += char
+    values.append(current)
+    return values
+
+
+def _sort_key(value):
+    """Urutan gaya Postgres: angka sebagai angka, timestamp sebagai waktu, NULL dipisah."""
+    if value is None:
+        return (1, 0, "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value, "")
+    parsed = _parse_time(value)
+    if parsed is not None:
+        return (0, parsed.timestamp(), "")
+    return (0, 0, _as_text(value))
+
+
+def _parse_time(value):
+    if not isinstance(value, str) or len(value) < 10 or value[4:5] != "-":
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _compare(stored, op, raw):
+    if op == "eq":
+        return _as_text(stored) == raw
+    if op == "neq":
+        return _as_text(stored) != raw
+    if op == "in":
+        return _as_text(stored) in _split_list(raw.strip("()"))
+    if op == "is":
+        return _as_text(stored) == raw.lower()
+    if stored is None:
+        return False
+    left, right = _sort_key(stored), _sort_key(_parse_number(raw))
+    return {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}[op]
+
+
+def _parse_number(raw):
+    try:
+        return int(raw)
+    except ValueError:
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+
+
+class Database:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.indexes = {}   # (tabel, kolom) -> {teks_nilai: baris}
+        self.requests = 0
+
+    def rows(self, table):
+        return self.tables.setdefault(table, [])
+
+    def _index(self, table, column):
+        return self.indexes.setdefault((table, column), {})
+
+    def _candidates(self, table, filters):
+        """Pakai index kolom unik kalau ada filter eq/in di kolom itu."""
+        for column, op, raw in filters:
+            if column in UNIQUE_COLUMNS.get(table, ()) and op in ("eq", "in"):
+                index = self._index(table, column)
+                keys = [raw] if op == "eq" else _split_list(raw.strip("()"))
+                return [index[k] for k in keys if k in index]
+        return self.rows(table)
+
+    def select(self, table, filters, order=None, limit=None, offset=0):
+        rows = [row for row in self._candidates(table, filters)
+                if all(_compare(row.get(c), op, raw) for c, op, raw in filters)]
+        for column, desc in reversed(order or []):
+            rows.sort(key=lambda row: _sort_key(row.get(column)), reverse=desc)
+        rows = rows[offset:]
+        return rows[:limit] if limit is not None else rows
+
+    def insert(self, table, payload, on_conflict=None, resolution=None):
+        defaults = DEFAULTS.get(table, dict)
+        conflict = tuple(on_conflict.split(",")) if on_conflict else UNIQUE_COLUMNS.get(table, ())[:1]
+        if len(conflict) == 1 and conflict[0] in UNIQUE_COLUMNS.get(table, ()):
+            # Kolom unik ber-index: tidak perlu bangun dict dari seluruh tabel
+            index = self._index(table, conflict[0])
+            existing = {}
+            lookup = lambda key: existing.get(key) or index.get(key[0])
+        else:
+            existing = {tuple(_as_text(r.get(c)) for c in conflict): r for r in self.rows(table)}
+            lookup = existing.get
+        written = []
+        for item in payload:
+            key = tuple(_as_text(item.get(c)) for c in conflict) if conflict else None
+            current = lookup(key) if key is not None else None
+            if current is not None:
+                if resolution == "merge-duplicates":
+                    current.update(item)
+                    written.append(current)
+                continue
+            row = {**defaults(), **item}
+            self.rows(table).append(row)
+            for column in UNIQUE_COLUMNS.get(table, ()):
+                if row.get(column) is not None:
+                    self._index(table, column)[_as_text(row[column])] = row
+            if key is not None:
+                existing[key] = row
+            written.append(row)
+        return written
+
+    def update(self, table, filters, values):
+        rows = self.select(table, filters)
+        for row in rows:
+            row.update(values)
+        return rows
+
+    def claim_pending_emails(self, p_worker_id, p_limit, p_lease_seconds):
+        now = datetime.now(timezone.utc)
+        free = [
+            row for row in self.rows("emails")
+            if row.get("category") == "PENDING_AI"
+            and (not row.get("lease_expires_at") or _parse_time(row["lease_expires_at"]) < now)
+        ]
+        free.sort(key=lambda row: _sort_key(row.get("queue_at") or row.get("received_at")))
+        expires = (now + timedelta(seconds=p_lease_seconds)).isoformat()
+        for row in free[:p_limit]:
+            row.update({"processing_by": p_worker_id, "lease_expires_at": expires})
+        return free[:p_limit]
+
+
+def _make_handler(db, latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Header & body ditulis terpisah; tanpa ini Nagle + delayed ACK menambah ~40ms per request
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _parse(self):
+            parts = urlsplit(self.path)
+            resource = parts.path.split("/rest/v1/", 1)[-1].strip("/")
+            filters, order, limit, offset, params = [], [], None, 0, {}
+            for key, value in parse_qsl(parts.query, keep_blank_values=True):
+                if key in ("select", "columns"):
+                    continue
+                if key == "order":
+                    for entry in value.split(","):
+                        bits = entry.split(".")
+                        order.append((bits[0], len(bits) > 1 and bits[1] == "desc"))
+                elif key == "limit":
+                    limit = int(value)
+                elif key == "offset":
+                    offset = int(value)
+                elif key == "on_conflict":
+                    params["on_conflict"] = value
+                else:
+                    op, _, raw = value.partition(".")
+                    if op in OPERATORS:
+                        filters.append((key, op, raw))
+            rng = self.headers.get("Range")
+            if rng and "-" in rng:
+                start, end = rng.split("-", 1)
+                offset, limit = int(start), int(end) - int(start) + 1
+            return resource, filters, order, limit, offset, params
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"null")
+
+        def _serve(self, method):
+            if latency:
+                time.sleep(latency)
+            resource, filters, order, limit, offset, params = self._parse()
+            prefer = self.headers.get("Prefer") or ""
+            payload = self._body() if method in ("POST", "PATCH") else None
+            with db.lock:
+                db.requests += 1
+                if resource.startswith("rpc/"):
+                    fn = getattr(db, resource[4:], None)
+                    if fn is None:
+                        return self._reply(404, {"message": f"function {resource[4:]} not found"})
+                    return self._reply(200, fn(**payload))
+                if method == "GET":
+                    return self._reply(200, db.select(resource, filters, order, limit, offset))
+                if method == "POST":
+                    items = payload if isinstance(payload, list) else [payload]
+                    resolution = next((p.split("=", 1)[1] for p in prefer.split(",")
+                                       if p.strip().startswith("resolution=")), None)
+                    rows = db.insert(resource, items, params.get("on_conflict"), resolution)
+                    return self._reply(201, rows if "return=representation" in prefer else [])
+                if method == "PATCH":
+                    rows = db.update(resource, filters, payload)
+                    return self._reply(200, rows if "return=representation" in prefer else [])
+            return self._reply(405, {"message": "method not allowed"})
+
+        def do_GET(self):
+            self._serve("GET")
+
+        def do_HEAD(self):
+            self._serve("GET")
+
+        def do_POST(self):
+            self._serve("POST")
+
+        def do_PATCH(self):
+            self._serve("PATCH")
+
+    return Handler
+
+
+class FakePostgrest:
+    """`with FakePostgrest() as db:` -> SUPABASE_URL = db.url (key bebas, asal berbentuk JWT a.b.c)."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.db = Database()
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self.db, latency))
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-postgrest", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
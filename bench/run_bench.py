@@ -0,0 +1,344 @@
+"""
+Benchmark end-to-end offline: pipeline (ingest -> AI -> notify) dan chatbot (app.py)
+melawan stub lokal untuk IMAP, Gemini, Supabase (PostgREST) dan LINE.
+
+    python bench/run_bench.py                          # inbox 10, 1k, 100k
+    python bench/run_bench.py --sizes 1000 --llm-latency 0.2 --rate-limit-ratio 0.05
+    python bench/run_bench.py --sizes 1000 --subscribers 200 --json hasil.json
+    python bench/run_bench.py --sizes 1000 --storage sqlite   # backend SQLite lokal
+
+Tiap ukuran inbox jalan di subprocess baru (modul bot membaca env saat import) dengan
+state lokal (cache AI, index, state IMAP) di direktori sementara. Server palsu jalan di
+proses runner supaya tidak berebut GIL dengan bot; stub Gemini dipasang di dalam proses
+bot (SDK Gemini tidak bisa diarahkan ke server lokal).
+
+Yang diukur:
+- emails/minute end-to-end: seluruh inbox lewat pipeline.run_pipeline() (IMAP -> DB -> AI -> LINE)
+- latency chatbot p50/p99: webhook bertanda tangan ke app.py sampai balasan tiba di stub LINE
+"""
+import os
+import sys
+import json
+import time
+import hmac
+import base64
+import hashlib
+import shutil
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+LINE_SECRET = "bench-channel-secret"
+LINE_USER_ID = "Ubenchuser"
+CHAT_MESSAGES = [
+    "skkm", "tugas", "urgent", "info", "beasiswa angkatan 2024", "magang data science",
+    "mirip lomba karya tulis", "kuis basis data", "help",
+]
+CHAT_TIMEOUT = 60
+INDEX_WAIT_TIMEOUT = 600
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# =========================================================
+# PROSES BOT (CHILD)
+# =========================================================
+
+def _webhook_body(text, reply_token, number):
+    event = {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": LINE_USER_ID},
+        "webhookEventId": f"bench{number}",
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": reply_token,
+        "message": {"id": str(number), "type": "text", "text": text, "quoteToken": f"q{number}"},
+    }
+    return json.dumps({"destination": "Ubenchbot", "events": [event]})
+
+
+def _line_stats(endpoint):
+    with urllib.request.urlopen(endpoint + "/_bench/stats") as response:
+        return json.load(response)
+
+
+def _wait_for_index(app):
+    """Poller reply_cache mengisi index pencarian di background; tunggu sampai ukurannya stabil."""
+    deadline = time.monotonic() + INDEX_WAIT_TIMEOUT
+    last = -1
+    while time.monotonic() < deadline:
+        size = len(app.embedding_index)
+        if size and size == last:
+            return size
+        last = size
+        time.sleep(1)
+    return last
+
+
+def bench_chat(count, rate):
+    """Kirim `count` webhook dengan laju tetap `rate`/detik, ukur sampai reply tiba di stub LINE."""
+    import app
+
+    indexed = _wait_for_index(app)
+    client = app.app.test_client()
+    endpoint = os.environ["LINE_API_ENDPOINT"]
+    sent = {}
+    rejected = 0
+    started = time.monotonic()
+    for i in range(count):
+        # Open-loop: jadwal kirim tetap, antrian di EventPool ikut terukur
+        time.sleep(max(0.0, started + i / rate - time.monotonic()))
+        token = f"bench-reply-{i}"
+        body = _webhook_body(CHAT_MESSAGES[i % len(CHAT_MESSAGES)], token, i)
+        signature = base64.b64encode(hmac.new(LINE_SECRET.encode(), body.encode(), hashlib.sha256).digest())
+        sent[token] = time.time()
+        response = client.post("/callback", data=body, headers={
+            "X-Line-Signature": signature.decode(), "Content-Type": "application/json",
+        })
+        if response.status_code != 200:
+            rejected += 1
+
+    deadline = time.monotonic() + CHAT_TIMEOUT
+    replies = {}
+    while time.monotonic() < deadline:
+        replies = _line_stats(endpoint)["replies"]
+        if all(token in replies for token in sent):
+            break
+        time.sleep(0.2)
+
+    latencies = [(replies[token] - sent_at) * 1000 for token, sent_at in sent.items() if token in replies]
+    return {
+        "messages": count,
+        "indexed_emails": indexed,
+        "rejected": rejected,
+        "missing": count - len(latencies),
+        "p50_ms": percentile(latencies, 0.5),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": max(latencies) if latencies else None,
+    }
+
+
+def run_child(args):
+    sys.path.insert(0, BENCH_DIR)
+    import fake_gemini
+    gemini_stats = fake_gemini.install(latency=args.llm_latency, rate_limit_ratio=args.rate_limit_ratio,
+                                       malformed_ratio=args.malformed_ratio)
+
+    import pipeline
+    import notify
+    # Rekap BENEFIT/TASK ikut diukur, bukan hanya di tanggal kelipatan 5
+    notify.FORCE_RECAP = True
+
+    started = time.monotonic()
+    error = None
+    try:
+        pipeline.run_pipeline()
+    except SystemExit as e:
+        error = str(e)
+    wall = time.monotonic() - started
+
+    with open(os.environ["RUN_REPORT_PATH"]) as f:
+        report = json.load(f)
+
+    result = {
+        "size": args.size,
+        "wall_seconds": round(wall, 2),
+        "emails_per_minute": round(args.size / wall * 60, 1) if wall else None,
+        "inserted": report.get("inserted"),
+        "spam": report.get("spam"),
+        "classified": report.get("saved"),
+        "stage_busy_seconds": report.get("stage_busy_seconds"),
+        "urgent_notify_median_seconds": report.get("urgent_notify_median_seconds"),
+        "llm_requests": sum(gemini_stats.calls.values()),
+        "llm_rate_limited": gemini_stats.rate_limited,
+        "llm_malformed": gemini_stats.malformed,
+        "llm_requests_saved": report.get("llm_requests_saved"),
+        "error": error,
+    }
+    if args.chat_messages:
+        result["chat"] = bench_chat(args.chat_messages, args.chat_rate)
+
+    with open(args.child, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+# =========================================================
+# RUNNER (PARENT)
+# =========================================================
+
+def _seed_subscribers(db, count):
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [
+        {"id": i, "line_user_id": f"Ubench{i}", "categories": ["URGENT", "BENEFIT", "TASK"],
+         "faculty": None, "batch": [None, 2022, 2023, 2024, 2025][i % 5], "active": True, "created_at": now}
+        for i in range(1, count + 1)
+    ]
+    with db.lock:
+        db.insert("subscribers", rows)
+    return rows
+
+
+def _seed_sqlite_subscribers(path, rows):
+    from storage import SQLiteStorage
+
+    sqlite = SQLiteStorage(path)
+    with sqlite.lock:
+        sqlite.conn.executemany(
+            "INSERT INTO subscribers (id, line_user_id, categories, batch, active, created_at) VALUES (?, ?, ?, ?, 1, ?)",
+            [(r["id"], r["line_user_id"], json.dumps(r["categories"]), r["batch"], r["created_at"]) for r in rows],
+        )
+        sqlite.conn.commit()
+    sqlite.conn.close()
+
+
+def _bot_env(workdir, imap, postgrest, line, args):
+    from rate_limiter import DEFAULT_LIMITS
+
+    env = dict(os.environ)
+    env.update({
+        "EMAIL_USER": "mahasiswa@student.umn.ac.id",
+        "EMAIL_PASS": "bench",
+        "IMAP_HOST": imap.host,
+        "IMAP_PORT": str(imap.port),
+        "IMAP_SSL": "0",
+        "SUPABASE_URL": postgrest.url,
+        "SUPABASE_KEY": "bench.bench.bench",
+        "GEMINI_API_KEY": "bench",
+        "LINE_CHANNEL_ACCESS_TOKEN": "bench",
+        "LINE_CHANNEL_SECRET": LINE_SECRET,
+        "LINE_USER_ID": LINE_USER_ID,
+        "LINE_API_ENDPOINT": line.url,
+        # Kuota tidak jadi batas: yang diukur kode bot, bukan free tier
+        "AI_RATE_LIMITS": ";".join(f"{model}:100000:1000000000" for model in DEFAULT_LIMITS),
+        "AI_CACHE_PATH": os.path.join(workdir, "ai_cache.db"),
+        "MODEL_STATE_PATH": os.path.join(workdir, "model_state.json"),
+        "PRECLASSIFIER_PATH": os.path.join(workdir, "preclassifier_model.npz"),
+        "SEARCH_INDEX_PATH": os.path.join(workdir, "search_index.db"),
+        "EMBEDDING_INDEX_PATH": os.path.join(workdir, "embeddings"),
+        "IMAP_STATE_PATH": os.path.join(workdir, "imap_state.json"),
+        "RUN_REPORT_PATH": os.path.join(workdir, "run_report.json"),
+        "STORAGE_BACKEND": args.storage,
+        "SQLITE_PATH": os.path.join(workdir, "emails.db"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def run_size(size, args):
+    from fake_imap import FakeImapServer
+    from fake_postgrest import FakePostgrest
+    from fake_line import FakeLine
+
+    with tempfile.TemporaryDirectory(prefix="emailbot-bench-") as workdir, \
+            FakeImapServer(size) as imap, \
+            FakePostgrest(latency=args.db_latency) as postgrest, \
+            FakeLine(latency=args.line_latency) as line:
+        subscribers = _seed_subscribers(postgrest.db, args.subscribers)
+        if args.storage == "sqlite":
+            _seed_sqlite_subscribers(os.path.join(workdir, "emails.db"), subscribers)
+        result_path = os.path.join(workdir, "result.json")
+        log_path = os.path.join(workdir, "bot.log")
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child", result_path, "--size", str(size),
+            "--llm-latency", str(args.llm_latency), "--rate-limit-ratio", str(args.rate_limit_ratio),
+            "--malformed-ratio", str(args.malformed_ratio),
+            "--chat-messages", str(args.chat_messages), "--chat-rate", str(args.chat_rate),
+        ]
+        print(f"▶️ Inbox {size} email...", flush=True)
+        with open(log_path, "w") as log:
+            code = subprocess.call(command, cwd=workdir, env=_bot_env(workdir, imap, postgrest, line, args),
+                                   stdout=log, stderr=subprocess.STDOUT)
+        if code != 0 or not os.path.exists(result_path):
+            with open(log_path) as log:
+                print("".join(log.readlines()[-40:]))
+            raise SystemExit(f"Benchmark inbox {size} gagal (exit {code}).")
+
+        if args.log_dir:
+            os.makedirs(args.log_dir, exist_ok=True)
+            shutil.copy(log_path, os.path.join(args.log_dir, f"bot-{size}.log"))
+        with open(result_path) as f:
+            result = json.load(f)
+        line_log = line.log.snapshot()
+        result["db_requests"] = postgrest.db.requests
+        result["line_push_calls"] = sum(v for k, v in line_log["calls"].items() if k != "message/reply")
+        result["line_bubbles"] = line_log["bubbles"]
+        return result
+
+
+def _fmt(value, digits=0):
+    return "-" if value is None else f"{value:,.{digits}f}"
+
+
+def print_table(results):
+    print("\n" + "=" * 96)
+    print(f"{'inbox':>8} {'wall s':>8} {'email/min':>10} {'masuk DB':>9} {'klasifikasi':>11} "
+          f"{'LLM req':>8} {'429':>5} {'DB req':>8} {'push':>6} {'chat p50':>9} {'chat p99':>9}")
+    print("-" * 96)
+    for r in results:
+        chat = r.get("chat") or {}
+        print(f"{r['size']:>8,} {_fmt(r['wall_seconds'], 1):>8} {_fmt(r['emails_per_minute']):>10} "
+              f"{_fmt(r['inserted']):>9} {_fmt(r['classified']):>11} {r['llm_requests']:>8,} "
+              f"{r['llm_rate_limited']:>5,} {r['db_requests']:>8,} {r['line_push_calls']:>6,} "
+              f"{_fmt(chat.get('p50_ms'), 1):>7}ms {_fmt(chat.get('p99_ms'), 1):>7}ms")
+    print("=" * 96)
+    for r in results:
+        busy = ", ".join(f"{k} {v:.1f}s" for k, v in (r.get("stage_busy_seconds") or {}).items())
+        print(f"   {r['size']:>8,}: sibuk per stage -> {busy or '-'}")
+        if r.get("urgent_notify_median_seconds") is not None:
+            print(f"            median ingest -> URGENT terkirim: {r['urgent_notify_median_seconds']} detik")
+        if r.get("llm_malformed"):
+            print(f"            jawaban AI cacat: {r['llm_malformed']}, request LLM dihemat: {r.get('llm_requests_saved')}")
+        if r.get("error"):
+            print(f"            ⚠️ {r['error']}")
+        if (r.get("chat") or {}).get("missing"):
+            print(f"            ⚠️ {r['chat']['missing']} balasan chat tidak sampai dalam {CHAT_TIMEOUT} detik")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,1000,100000", help="Ukuran inbox, dipisah koma")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Detik per request Gemini palsu")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.02, help="Peluang request Gemini kena 429")
+    parser.add_argument("--malformed-ratio", type=float, default=0.0,
+                        help="Peluang jawaban Gemini palsu cacat (JSON rusak / field tidak baku)")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Detik tambahan per request PostgREST")
+    parser.add_argument("--line-latency", type=float, default=0.01, help="Detik per panggilan API LINE")
+    parser.add_argument("--storage", choices=["supabase", "sqlite"], default="supabase",
+                        help="Backend storage bot (sqlite = file lokal, stub PostgREST tidak dipakai)")
+    parser.add_argument("--subscribers", type=int, default=0, help="Isi tabel subscribers (0 = mode LINE_USER_ID)")
+    parser.add_argument("--chat-messages", type=int, default=200, help="Jumlah chat untuk ukur latency")
+    parser.add_argument("--chat-rate", type=float, default=20, help="Chat per detik")
+    parser.add_argument("--json", help="Simpan hasil mentah ke file JSON")
+    parser.add_argument("--log-dir", help="Simpan output bot (bot-<ukuran>.log) ke direktori ini")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        results.append(run_size(size, args))
+        print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Hasil tersimpan: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+
+# --- KONFIGURASI CIRCUIT BREAKER ---
+# State tiap model disimpan ke file supaya run berikutnya (GitHub Actions / daemon)
+# tidak buang request ke model yang kuota hariannya sudah habis.
+STATE_PATH = os.getenv("MODEL_STATE_PATH", "model_state.json")
+FAILURE_THRESHOLD = 3     # Gagal berturut-turut sebelum model "dibuka" (diistirahatkan)
+OPEN_COOLDOWN = 60        # Detik istirahat pertama, dobel tiap probe gagal
+OPEN_COOLDOWN_MAX = 3600
+EWMA_ALPHA = 0.2          # Bobot data terbaru untuk rata-rata error rate & latency
+BAD_ERROR_RATE = 0.5      # Model dengan error rate di atas ini dipindah ke urutan belakang
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Kuota harian Gemini di-reset tengah malam waktu Pasifik
+QUOTA_RESET_TZ = "America/Los_Angeles"
+
+
+def next_quota_reset(now=None):
+    """Epoch detik untuk reset kuota harian berikutnya."""
+    now = now or time.time()
+    try:
+        from zoneinfo import ZoneInfo
+        tz = ZoneInfo(QUOTA_RESET_TZ)
+        local = datetime.fromtimestamp(now, tz)
+        midnight = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight.timestamp()
+    except Exception:
+        return now + 24 * 3600
+
+
+def is_daily_quota_error(error):
+    message = str(error)
+    return "PerDay" in message or "per day" in message.lower()
+
+
+class ModelHealth:
+    def __init__(self, data=None):
+        data = data or {}
+        self.state = data.get("state", CLOSED)
+        self.open_until = data.get("open_until", 0.0)
+        self.cooldown = data.get("cooldown", OPEN_COOLDOWN)
+        self.failures = data.get("failures", 0)
+        self.error_rate = data.get("error_rate", 0.0)
+        self.latency = data.get("latency", 0.0)
+        self.probe_in_flight = False
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "open_until": self.open_until,
+            "cooldown": self.cooldown,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate, 4),
+            "latency": round(self.latency, 3),
+        }
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per model untuk rantai MODELS_TO_TRY.
+    closed    = sehat, dipakai normal
+    open      = diistirahatkan sampai open_until (kuota habis / error beruntun)
+    half_open = masa istirahat selesai, 1 request probe boleh lewat untuk cek pulih
+    """
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.models = {}
+        self.stats = {
+            "calls": 0,
+            "primary_success": 0,
+            "fallback_success": 0,
+            "skipped_open": 0,
+            "probes": 0,
+            "probe_recovered": 0,
+            "opened": 0,
+        }
+        self._load()
+
+    # --- PERSISTENSI ---
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            self.models = {name: ModelHealth(data) for name, data in raw.items()}
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.models = {}
+
+    def save(self):
+        with self.lock:
+            data = {name: health.to_dict() for name, health in self.models.items()}
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Gagal simpan state model: {e}")
+
+    def _get(self, name):
+        if name not in self.models:
+            self.models[name] = ModelHealth()
+        return self.models[name]
+
+    # --- PEMILIHAN MODEL ---
+    def available(self, models):
+        """
+        Urutkan model yang boleh dicoba: sesuai prioritas, model open dilewati,
+        model dengan error rate tinggi dipindah ke belakang.
+        """
+        now = time.time()
+        healthy, degraded = [], []
+        with self.lock:
+            for name in models:
+                health = self._get(name)
+                if health.state == OPEN:
+                    if now < health.open_until:
+                        self.stats["skipped_open"] += 1
+                        continue
+                    health.state = HALF_OPEN
+                if health.state == HALF_OPEN and health.probe_in_flight:
+                    continue
+                if health.error_rate > BAD_ERROR_RATE:
+                    degraded.append(name)
+                else:
+                    healthy.append(name)
+        return healthy + degraded
+
+    def before_call(self, name):
+        """Return False kalau model half-open sedang diprobe oleh worker lain."""
+        with self.lock:
+            health = self._get(name)
+            if health.state == OPEN and time.time() < health.open_until:
+                return False
+            if health.state in (OPEN, HALF_OPEN):
+                if health.probe_in_flight:
+                    return False
+                health.state = HALF_OPEN
+                health.probe_in_flight = True
+                self.stats["probes"] += 1
+            return True
+
+    # --- HASIL PANGGILAN ---
+    def record_success(self, name, latency, is_primary):
+        with self.lock:
+            health = self._get(name)
+            if health.state == HALF_OPEN:
+                self.stats["probe_recovered"] += 1
+                print(f"   💚 {name} pulih, dipakai lagi.")
+            health.state = CLOSED
+            health.probe_in_flight = False
+            health.failures = 0
+            health.cooldown = OPEN_COOLDOWN
+            health.error_rate = (1 - EWMA_ALPHA) * health.error_rate
+            health.latency = latency if not health.latency else \
+                (1 - EWMA_ALPHA) * health.latency + EWMA_ALPHA * latency
+            self.stats["calls"] += 1
+            self.stats["primary_success" if is_primary else "fallback_success"] += 1
+
+    def record_failure(self, name, error, latency=None):
+        with self.lock:
+            health = self._get(name)
+            health.failures += 1
+            health.error_rate = (1 - EWMA_ALPHA) * health.error_rate + EWMA_ALPHA
+            if latency is not None:
+                health.latency = (1 - EWMA_ALPHA) * health.latency + EWMA_ALPHA * latency
+            self.stats["calls"] += 1
+
+            was_probe = health.state == HALF_OPEN
+            health.probe_in_flight = False
+
+            if is_daily_quota_error(error):
+                # Kuota harian habis: tidak ada gunanya dicoba sampai reset
+                health.state = OPEN
+                health.open_until = next_quota_reset()
+                self.stats["opened"] += 1
+                reset_at = datetime.fromtimestamp(health.open_until).strftime("%d/%m %H:%M")
+                print(f"   🔌 {name} kuota harian habis, diistirahatkan sampai {reset_at}.")
+            elif was_probe or health.failures >= FAILURE_THRESHOLD:
+                if was_probe:
+                    health.cooldown = min(health.cooldown * 2, OPEN_COOLDOWN_MAX)
+                health.state = OPEN
+                health.open_until = time.time() + health.cooldown
+                self.stats["opened"] += 1
+                print(f"   🔌 {name} diistirahatkan {health.cooldown:.0f} detik.")
+
+    def report(self):
+        s = self.stats
+        print("\n🔌 Circuit Breaker Model:")
+        print(f"   - Sukses model utama : {s['primary_success']}")
+        print(f"   - Sukses via cadangan: {s['fallback_success']}")
+        print(f"   - Skip (model open)  : {s['skipped_open']}")
+        print(f"   - Probe / pulih      : {s['probes']} / {s['probe_recovered']}")
+        for name, health in self.models.items():
+            print(
+                f"   - {name}: {health.state}, error {health.error_rate * 100:.0f}%, "
+                f"latency {health.latency:.1f}s"
+            )
+
+
+# Satu breaker global per proses
+breaker = CircuitBreaker()
@@ -0,0 +1,84 @@
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+from supabase import create_client, Client
+from metrics import registry
+
+load_dotenv()
+
+# Client dibuat sekali per proses lalu dipakai bersama oleh semua modul
+# (ingest, process, notify, daemon), jadi koneksi HTTP-nya juga dipakai ulang.
+
+def _count_supabase_request(response):
+    request = response.request
+    # /rest/v1/emails -> "emails", /rest/v1/rpc/claim_pending_emails -> "claim_pending_emails"
+    resource = request.url.path.rstrip("/").rsplit("/", 1)[-1]
+    registry.inc("supabase_requests_total", method=request.method, resource=resource, status=response.status_code)
+
+@lru_cache(maxsize=None)
+def get_supabase() -> Client:
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    # Hitung round-trip PostgREST lewat event hook httpx (semua .execute() lewat sini)
+    session = getattr(client.postgrest, "session", None)
+    if session is not None:
+        hooks = session.event_hooks
+        session.event_hooks = {**hooks, "response": [*hooks.get("response", []), _count_supabase_request]}
+    return client
+
+@lru_cache(maxsize=None)
+def get_storage():
+    """Repository tabel bot (lihat storage.py); backend dipilih lewat STORAGE_BACKEND."""
+    import storage
+    if storage.STORAGE_BACKEND == "sqlite":
+        return storage.SQLiteStorage(storage.SQLITE_PATH)
+    return storage.SupabaseStorage(get_supabase())
+
+# Pool koneksi HTTP ke API LINE; cukup besar untuk semua thread pengirim notify (PUSH_WORKERS)
+LINE_POOL_SIZE = int(os.getenv("LINE_POOL_SIZE", "16"))
+# Kosong = API LINE asli. Bisa diarahkan ke stub lokal (bench/) misal http://127.0.0.1:8091
+LINE_API_ENDPOINT = os.getenv("LINE_API_ENDPOINT")
+
+def _session_http_client():
+    """RequestsHttpClient bawaan SDK membuka koneksi baru tiap request; versi ini pakai 1 Session."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+
+    def track(method, url, response):
+        # https://api.line.me/v2/bot/message/push -> "message/push"
+        endpoint = url.split("/v2/bot/", 1)[-1].split("?", 1)[0]
+        registry.inc("line_api_calls_total", method=method, endpoint=endpoint, status=response.status_code)
+        return RequestsHttpResponse(response)
+
+    class SessionHttpClient(RequestsHttpClient):
+        def __init__(self, timeout=RequestsHttpClient.DEFAULT_TIMEOUT):
+            super().__init__(timeout=timeout)
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=LINE_POOL_SIZE, pool_maxsize=LINE_POOL_SIZE)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+
+        def get(self, url, headers=None, params=None, stream=False, timeout=None):
+            response = self.session.get(url, headers=headers, params=params, stream=stream,
+                                        timeout=timeout or self.timeout)
+            return track("GET", url, response)
+
+        def post(self, url, headers=None, data=None, timeout=None):
+            response = self.session.post(url, headers=headers, data=data, timeout=timeout or self.timeout)
+            return track("POST", url, response)
+
+        def put(self, url, headers=None, data=None, timeout=None):
+            response = self.session.put(url, headers=headers, data=data, timeout=timeout or self.timeout)
+            return track("PUT", url, response)
+
+        def delete(self, url, headers=None, data=None, timeout=None):
+            response = self.session.delete(url, headers=headers, data=data, timeout=timeout or self.timeout)
+            return track("DELETE", url, response)
+
+    return SessionHttpClient
+
+@lru_cache(maxsize=None)
+def get_line_bot_api():
+    from linebot import LineBotApi
+    kwargs = {"endpoint": LINE_API_ENDPOINT} if LINE_API_ENDPOINT else {}
+    return LineBotApi(os.getenv("LINE_CHANNEL_ACCESS_TOKEN"), http_client=_session_http_client(), **kwargs)
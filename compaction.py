@@ -0,0 +1,180 @@
+import os
+import re
+import threading
+from rate_limiter import estimate_tokens
+
+# --- KONFIGURASI KOMPAKSI BODY ---
+# Body email dipadatkan sebelum masuk prompt: balasan yang dikutip, signature dan
+# footer dibuang, lalu kalimat yang paling informatif (tanggal, link, instruksi)
+# dipilih sampai budget token habis.
+AI_BODY_TOKEN_BUDGET = int(os.getenv("AI_BODY_TOKEN_BUDGET", "500"))
+
+# Awal balasan yang dikutip: semua teks setelah ini adalah email lama.
+# (Forward sengaja tidak dipotong: isi forward justru pengumumannya, termasuk From:/Dari: di header-nya.)
+FORWARD_MARKER = re.compile(
+    r"^\s*(-{2,}\s*(Forwarded message|Pesan (yang )?diteruskan|Pesan terusan)\s*-{2,}|Begin forwarded message:)",
+    re.IGNORECASE,
+)
+FORWARD_HEADER = re.compile(r"^\s*(From|Dari|Date|Tanggal|Sent|Subject|Subjek|To|Kepada|Cc):", re.IGNORECASE)
+QUOTE_HEADERS = [
+    re.compile(r"^\s*On .{5,200} wrote:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*Pada .{5,200} menulis:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*-{2,}\s*(Original Message|Pesan Asli)\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^\s*From:\s.+$", re.IGNORECASE),
+    re.compile(r"^\s*Dari:\s.+$", re.IGNORECASE),
+]
+SIGNATURE_START = re.compile(
+    r"^\s*(--\s*|best regards,?|kind regards,?|regards,?|salam,?|hormat kami,?|hormat saya,?|"
+    r"terima kasih,?|thanks,?|thank you,?|sent from my \w+)\s*$",
+    re.IGNORECASE,
+)
+FOOTER_LINE = re.compile(
+    r"(unsubscribe|berhenti berlangganan|this e-?mail (was|is) sent|email ini dikirim|"
+    r"do not reply|jangan membalas|disclaimer|confidential|privileged|©|copyright|"
+    r"all rights reserved|jl\.? scientia|gading serpong|view (this email )?in (your )?browser)",
+    re.IGNORECASE,
+)
+
+URL_PATTERN = re.compile(r"(https?://\S+|www\.\S+|bit\.ly/\S+|s\.id/\S+)", re.IGNORECASE)
+DATE_PATTERNS = [
+    re.compile(r"\b\d{1,2}[/-]\d{1,2}([/-]\d{2,4})?\b"),
+    re.compile(r"\b\d{1,2}\s+(jan|feb|mar|apr|mei|may|jun|jul|agu|aug|sep|okt|oct|nov|des|dec)\w*", re.IGNORECASE),
+    re.compile(r"\b(senin|selasa|rabu|kamis|jumat|sabtu|minggu|besok|hari ini|monday|tuesday|"
+               r"wednesday|thursday|friday|saturday|sunday|tomorrow)\b", re.IGNORECASE),
+    re.compile(r"\b(deadline|batas|paling lambat|tenggat|pukul|jam \d|wib)\b", re.IGNORECASE),
+]
+ACTION_PATTERN = re.compile(
+    r"\b(daftar|mendaftar|registrasi|register|kumpul|kumpulkan|submit|isi|mengisi|klik|kirim|"
+    r"upload|unggah|hadir|wajib|segera|batal|dibatalkan|diganti|pindah|syarat|persyaratan|"
+    r"skkm|beasiswa|magang|lomba|honor|sertifikat|angkatan|prodi)\b",
+    re.IGNORECASE,
+)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+MIN_REPLY_CHARS = 80  # Header kutipan baru dianggap valid kalau sudah ada balasan di atasnya
+# Baris footer asli pendek dan tanpa tanggal; baris panjang / bertanggal adalah isi pengumuman
+# ("Kuliah tamu di Gading Serpong, Rabu 5 Juni") dan tidak pernah dibuang.
+FOOTER_MAX_CHARS = 200
+
+
+def strip_quoted_replies(text):
+    """Buang baris kutipan '>' dan semua teks setelah header balasan (header forward dipertahankan)."""
+    kept = []
+    kept_chars = 0
+    in_forward_header = False
+    for line in text.splitlines():
+        if FORWARD_MARKER.match(line):
+            in_forward_header = True
+        elif in_forward_header and line.strip() and not FORWARD_HEADER.match(line):
+            in_forward_header = False
+        if not in_forward_header and kept_chars >= MIN_REPLY_CHARS and \
+                any(pattern.match(line) for pattern in QUOTE_HEADERS):
+            break
+        if line.lstrip().startswith(">"):
+            continue
+        kept.append(line)
+        kept_chars += len(line.strip())
+    return "\n".join(kept)
+
+
+def is_footer_line(line):
+    return len(line) <= FOOTER_MAX_CHARS and FOOTER_LINE.search(line) is not None and \
+        not any(pattern.search(line) for pattern in DATE_PATTERNS)
+
+
+def strip_signature_and_footer(text):
+    """Potong signature dan buang baris footer, keduanya hanya di paruh belakang email."""
+    lines = text.splitlines()
+    half = len(lines) // 2
+    cut = len(lines)
+    for i in range(half, len(lines)):
+        if SIGNATURE_START.match(lines[i]):
+            cut = i
+            break
+    return "\n".join(line for i, line in enumerate(lines[:cut]) if i < half or not is_footer_line(line))
+
+
+def score_sentence(sentence, position):
+    score = 0.0
+    if URL_PATTERN.search(sentence):
+        score += 3
+    score += 2 * sum(1 for pattern in DATE_PATTERNS if pattern.search(sentence))
+    score += len(ACTION_PATTERN.findall(sentence))
+    # Kalimat pembuka biasanya menjelaskan konteks email
+    if position < 2:
+        score += 2
+    return score
+
+
+def compact_text(text, token_budget):
+    """
+    Padatkan teks sampai muat di token_budget. Urutan kalimat asli dipertahankan.
+    Kutipan/signature/footer hanya dibuang kalau teks masih punya baris asli: body_snippet
+    di DB sudah 1 baris (dipadatkan saat ingest), jadi di situ hanya pemilihan kalimat.
+    """
+    if not text:
+        return ""
+    cleaned = text
+    if "\n" in text.strip():
+        cleaned = strip_signature_and_footer(strip_quoted_replies(text))
+        if not cleaned.strip():
+            cleaned = text  # Semua baris terlihat seperti kutipan/footer: lebih aman kirim aslinya
+    if estimate_tokens(cleaned) <= token_budget:
+        return cleaned.strip()
+
+    sentences = [s.strip() for s in SENTENCE_SPLIT.split(cleaned) if s and s.strip()]
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (score_sentence(sentences[i], i), -i),
+        reverse=True,
+    )
+
+    chosen = set()
+    used = 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > token_budget:
+            continue
+        chosen.add(i)
+        used += cost
+
+    if not chosen:
+        # Satu kalimat saja sudah melebihi budget: potong kalimat terbaik
+        return sentences[ranked[0]][: token_budget * 4]
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+class CompactionStats:
+    """Total token body sebelum & sesudah kompaksi untuk 1 run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def add(self, before, after):
+        with self.lock:
+            self.count += 1
+            self.tokens_before += before
+            self.tokens_after += after
+
+    def report(self, label="Kompaksi body"):
+        if not self.count:
+            return
+        saved = self.tokens_before - self.tokens_after
+        pct = saved / self.tokens_before * 100 if self.tokens_before else 0
+        print(f"\n✂️ {label}:")
+        print(f"   - Email          : {self.count}")
+        print(f"   - Token sebelum  : {self.tokens_before}")
+        print(f"   - Token sesudah  : {self.tokens_after}")
+        print(f"   - Hemat          : {saved} token ({pct:.0f}%)")
+
+
+stats = CompactionStats()
+
+
+def compact_body(text, token_budget=AI_BODY_TOKEN_BUDGET, run_stats=None):
+    """compact_text + catat token sebelum/sesudah ke `run_stats` (default: stats prompt AI)."""
+    result = compact_text(text, token_budget)
+    (run_stats or stats).add(estimate_tokens(text), estimate_tokens(result))
+    return result
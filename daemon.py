@@ -0,0 +1,76 @@
+import time
+import socket
+import imaplib
+from datetime import date, timedelta
+from imap_tools.errors import MailboxLoginError
+
+# Import modul batch = pakai ulang fungsi + client yang sama (1 Supabase client, 1 LINE client,
+# 1 konfigurasi Gemini + rate limiter + cache untuk seluruh umur daemon)
+import ingest
+import process
+import notify
+
+# --- KONFIGURASI DAEMON ---
+# Gmail memutus IDLE setelah ±29 menit, jadi IDLE diperbarui lebih cepat dari itu
+IDLE_TIMEOUT = 9 * 60
+RECONNECT_BACKOFF_START = 5
+RECONNECT_BACKOFF_MAX = 300
+
+
+def handle_new_mail(mailbox):
+    """Ambil email baru -> klasifikasi -> push URGENT ke LINE, langsung saat itu juga."""
+    start_date = date.today() - timedelta(days=ingest.DAYS_BACK)
+    # Daemon selalu incremental (hanya UID baru sejak terakhir dilihat).
+    # Email baru langsung di-lease atas nama daemon supaya worker process.py tidak ikut mengklaim.
+    inserted, _, _ = ingest.ingest_mailbox(
+        mailbox, start_date, mode="incremental", extra_fields=process.lease_fields()
+    )
+    if not inserted:
+        return
+
+    print(f"📨 {len(inserted)} email baru, langsung diproses AI...")
+    saved_emails = process.classify_emails(inserted)
+
+    urgents = [email for email in saved_emails if email.get("category") == "URGENT"]
+    if urgents:
+        print(f"🚨 {len(urgents)} URGENT, kirim ke LINE sekarang!")
+        notify.notify_emails(urgents, title_prefix="PERINGATAN URGENT")
+
+
+def run_daemon():
+    print("👂 Daemon IMAP IDLE dimulai (Ctrl+C untuk berhenti)...")
+    backoff = RECONNECT_BACKOFF_START
+
+    while True:
+        try:
+            with ingest.open_mailbox() as mailbox:
+                print("✅ Terhubung ke IMAP, menunggu email baru...")
+                backoff = RECONNECT_BACKOFF_START
+
+                # Kejar email yang masuk selama daemon mati / reconnect
+                handle_new_mail(mailbox)
+
+                while True:
+                    responses = mailbox.idle.wait(timeout=IDLE_TIMEOUT)
+                    if responses:
+                        handle_new_mail(mailbox)
+
+        except KeyboardInterrupt:
+            print("\n👋 Daemon dihentikan.")
+            break
+        except MailboxLoginError as e:
+            # Password salah tidak akan sembuh dengan reconnect cepat
+            print(f"❌ Login IMAP gagal: {e}")
+            backoff = RECONNECT_BACKOFF_MAX
+        except (imaplib.IMAP4.abort, imaplib.IMAP4.error, socket.error, OSError) as e:
+            print(f"⚠️ Koneksi IMAP terputus: {e}")
+        except Exception as e:
+            print(f"❌ Error daemon: {e}")
+
+        print(f"🔁 Reconnect dalam {backoff} detik...")
+        time.sleep(backoff)
+        backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
+
+
+if __name__ == "__main__":
+    run_daemon()
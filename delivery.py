@@ -0,0 +1,241 @@
+import os
+import re
+import time
+import uuid
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+from linebot.models import TextSendMessage
+from linebot.exceptions import LineBotApiError
+from rate_limiter import TokenBucket
+from timeutil import parse_time
+
+# --- KONFIGURASI PENGIRIMAN LINE ---
+MAX_MESSAGES_PER_PUSH = 5       # Maks balon per panggilan push/multicast
+MULTICAST_MAX_RECIPIENTS = 500  # Batas LINE per panggilan multicast
+PUSH_MAX_ATTEMPTS = 4
+PUSH_BACKOFF_START = 1          # Detik, dikali 2 setiap gagal
+PUSH_BACKOFF_MAX = 30
+PUSH_WORKERS = int(os.getenv("PUSH_WORKERS", "8"))
+PUSH_RATE_PER_SECOND = float(os.getenv("PUSH_RATE_PER_SECOND", "50"))
+
+# --- SUBSCRIBER ---
+DEFAULT_CATEGORIES = ["URGENT", "BENEFIT", "TASK"]
+# Subscriber baru ikut dapat email beberapa hari sebelum dia daftar (bukan seluruh arsip)
+NEW_SUBSCRIBER_BACKFILL_DAYS = 3
+WRITE_CHUNK_SIZE = 1000
+
+BATCH_PATTERN = re.compile(r"angkatan\s*(20\d{2})", re.IGNORECASE)
+
+
+# =========================================================
+# KIRIM DENGAN RETRY
+# =========================================================
+
+def is_retryable_push_error(e):
+    status = getattr(e, "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+def is_already_accepted(e):
+    """409 = retry_key ini sudah diterima LINE di percobaan sebelumnya (respons-nya saja yang hilang)."""
+    return getattr(e, "status_code", None) == 409
+
+
+def send_with_retry(send_fn, label="Push"):
+    """
+    Panggil send_fn(). Error 429/5xx dan gangguan jaringan (koneksi putus, timeout) diulang
+    dengan backoff eksponensial; 4xx lain & error tak terduga langsung gagal (tidak raise).
+    send_fn harus memakai 1 retry_key yang sama di semua percobaan, supaya pesan tidak terkirim dobel.
+    """
+    backoff = PUSH_BACKOFF_START
+    for attempt in range(1, PUSH_MAX_ATTEMPTS + 1):
+        try:
+            send_fn()
+            return True
+        except LineBotApiError as e:
+            if is_already_accepted(e):
+                print(f"   ✅ {label} ternyata sudah diterima LINE (retry_key sama), tidak dikirim ulang.")
+                return True
+            if not is_retryable_push_error(e) or attempt == PUSH_MAX_ATTEMPTS:
+                print(f"   ❌ {label} gagal (percobaan {attempt}): {e}")
+                return False
+            retry_after = (getattr(e, "headers", None) or {}).get("Retry-After")
+            wait = float(retry_after) if retry_after and str(retry_after).isdigit() else backoff
+            print(f"   ⏳ {label} gagal ({e.status_code}), coba lagi dalam {wait:.0f} detik...")
+        except (RequestsConnectionError, Timeout) as e:
+            if attempt == PUSH_MAX_ATTEMPTS:
+                print(f"   ❌ {label} gagal (percobaan {attempt}, jaringan): {e}")
+                return False
+            wait = backoff
+            print(f"   ⏳ {label} gagal (jaringan: {type(e).__name__}), coba lagi dalam {wait:.0f} detik...")
+        except Exception as e:
+            print(f"   ❌ {label} gagal (percobaan {attempt}): {e}")
+            return False
+        time.sleep(wait)
+        backoff = min(backoff * 2, PUSH_BACKOFF_MAX)
+    return False
+
+
+class PushThrottle:
+    """Batas panggilan API LINE per detik, dipakai bersama semua thread pengirim."""
+
+    def __init__(self, rate_per_second=PUSH_RATE_PER_SECOND):
+        self.bucket = TokenBucket(rate_per_second, per_seconds=1.0)
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                wait = self.bucket.wait_time(1, time.monotonic())
+                if wait <= 0:
+                    self.bucket.consume(1)
+                    return
+            time.sleep(wait)
+
+
+# =========================================================
+# SUBSCRIBER & STATE PENGIRIMAN
+# (tabel subscribers & deliveries dibaca lewat storage: active_subscribers, delivered_pairs)
+# =========================================================
+
+def email_audience(email):
+    """
+    Target email: (set fakultas | None, set angkatan | None). None = untuk semua.
+    Pakai kolom target_faculties / target_batches kalau ada, angkatan juga bisa
+    terbaca dari teks ("angkatan 2023").
+    """
+    faculties = email.get("target_faculties") or None
+    batches = email.get("target_batches") or None
+    if batches is None:
+        text = f"{email.get('subject') or ''} {email.get('summary_text') or ''}"
+        batches = BATCH_PATTERN.findall(text) or None
+    return (
+        {str(f).upper() for f in faculties} if faculties else None,
+        {int(b) for b in batches} if batches else None,
+    )
+
+
+def subscriber_matches(subscriber, email, audience):
+    if email.get("category") not in (subscriber.get("categories") or DEFAULT_CATEGORIES):
+        return False
+    faculties, batches = audience
+    if faculties and subscriber.get("faculty") and subscriber["faculty"].upper() not in faculties:
+        return False
+    if batches and subscriber.get("batch") and int(subscriber["batch"]) not in batches:
+        return False
+    joined = parse_time(subscriber.get("created_at"))
+    received = parse_time(email.get("received_at"))
+    if joined and received and received < joined - timedelta(days=NEW_SUBSCRIBER_BACKFILL_DAYS):
+        return False
+    return True
+
+
+def record_deliveries(storage, pairs):
+    rows = list(pairs)
+    saved = 0
+    for i in range(0, len(rows), WRITE_CHUNK_SIZE):
+        chunk = rows[i : i + WRITE_CHUNK_SIZE]
+        try:
+            storage.record_deliveries(chunk)
+            saved += len(chunk)
+        except Exception as e:
+            print(f"   ⚠️ Gagal simpan status kirim: {e}")
+    if rows:
+        print(f"   💾 {saved}/{len(rows)} status kirim (subscriber x email) tersimpan.")
+
+
+def plan_digests(subscribers, emails, delivered):
+    """
+    Kelompokkan subscriber yang isi digest-nya identik.
+    Return {tuple(email_id, ...): [subscriber, ...]}, urutan email mengikuti `emails`.
+    """
+    audiences = [(email, email_audience(email)) for email in emails]
+    digests = {}
+    for subscriber in subscribers:
+        email_ids = tuple(
+            email["id"] for email, audience in audiences
+            if (subscriber["id"], email["id"]) not in delivered
+            and subscriber_matches(subscriber, email, audience)
+        )
+        if email_ids:
+            digests.setdefault(email_ids, []).append(subscriber)
+    return digests
+
+
+# =========================================================
+# FAN-OUT
+# =========================================================
+
+def _send_digest(line_bot_api, throttle, recipients, bubbles):
+    """
+    Kirim 1 digest (list (teks, [email_id])) ke recipients, 5 balon per panggilan.
+    Multicast kalau penerima > 1. Return list email_id yang balonnya terkirim.
+    """
+    sent_ids = []
+    for i in range(0, len(bubbles), MAX_MESSAGES_PER_PUSH):
+        chunk = bubbles[i : i + MAX_MESSAGES_PER_PUSH]
+        messages = [TextSendMessage(text=text) for text, _ in chunk]
+        # 1 retry_key per panggilan logis, dipakai ulang tiap percobaan
+        retry_key = str(uuid.uuid4())
+        throttle.acquire()
+        if len(recipients) == 1:
+            ok = send_with_retry(
+                lambda: line_bot_api.push_message(recipients[0], messages, retry_key=retry_key), "Push"
+            )
+        else:
+            ok = send_with_retry(
+                lambda: line_bot_api.multicast(recipients, messages, retry_key=retry_key), "Multicast"
+            )
+        if ok:
+            sent_ids.extend(email_id for _, ids in chunk for email_id in ids)
+    return sent_ids
+
+
+def fan_out(storage, line_bot_api, subscribers, emails, render_fn):
+    """
+    Kirim email ke semua subscriber yang cocok. Tiap digest unik dirender sekali
+    (render_fn(list_email) -> list (teks_balon, [email_id])), lalu dikirim paralel.
+    Return set email_id yang terkirim ke minimal 1 subscriber.
+    """
+    if not subscribers or not emails:
+        return set()
+
+    started = time.monotonic()
+    delivered = storage.delivered_pairs([email["id"] for email in emails])
+    digests = plan_digests(subscribers, emails, delivered)
+    by_id = {email["id"]: email for email in emails}
+
+    jobs = []
+    for email_ids, group in digests.items():
+        bubbles = render_fn([by_id[i] for i in email_ids])
+        for i in range(0, len(group), MULTICAST_MAX_RECIPIENTS):
+            jobs.append((group[i : i + MULTICAST_MAX_RECIPIENTS], bubbles))
+
+    recipients_total = sum(len(group) for group in digests.values())
+    print(f"   📡 {recipients_total} subscriber, {len(digests)} digest unik, {len(jobs)} job kirim...")
+
+    throttle = PushThrottle()
+
+    def run_job(job):
+        group, bubbles = job
+        sent_ids = _send_digest(line_bot_api, throttle, [s["line_user_id"] for s in group], bubbles)
+        return [(s["id"], email_id) for s in group for email_id in sent_ids]
+
+    pairs = []
+    try:
+        with ThreadPoolExecutor(max_workers=PUSH_WORKERS) as pool:
+            futures = [pool.submit(run_job, job) for job in jobs]
+            for future in as_completed(futures):
+                # 1 job error tidak boleh menggagalkan job lain
+                try:
+                    pairs.extend(future.result())
+                except Exception as e:
+                    print(f"   ❌ Job kirim gagal: {e}")
+    finally:
+        # Yang sudah terkirim selalu dicatat, supaya tidak dikirim ulang di run berikutnya
+        record_deliveries(storage, pairs)
+    elapsed = time.monotonic() - started
+    print(f"   ✅ Fan-out selesai dalam {elapsed:.1f} detik ({len(pairs)} pengiriman email).")
+    return {email_id for _, email_id in pairs}
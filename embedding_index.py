@@ -0,0 +1,250 @@
+import os
+import re
+import zlib
+import threading
+import numpy as np
+from timeutil import parse_time
+
+# --- KONFIGURASI EMBEDDING INDEX ---
+# Vektor hashed n-gram dari summary_text, disimpan di matriks NumPy memory-mapped,
+# dipakai untuk cari email mirip & mengelompokkan email 1 "thread" pengumuman
+# (open recruitment -> perpanjangan deadline -> reminder).
+INDEX_PATH = os.getenv("EMBEDDING_INDEX_PATH", "embeddings")
+DIM = 256
+CHAR_NGRAM = 4
+INITIAL_CAPACITY = 1024
+SEARCH_CHUNK_ROWS = 65536   # Baris per blok perkalian matriks saat search
+# Hashed n-gram 256 dimensi: ringkasan 2 pengumuman yang tidak berhubungan bisa > 0.6
+# (gaya bahasa & kata "pendaftaran"/"mahasiswa" sama), jadi ambangnya tinggi dan
+# email juga wajib 1 pengirim atau 1 subjek (setelah prefix Re/Fwd/Reminder dibuang).
+THREAD_SIMILARITY = float(os.getenv("THREAD_SIMILARITY", "0.75"))
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+SENDER_ADDRESS = re.compile(r"[\w.+-]+@[\w.-]+")
+SUBJECT_TAG = re.compile(r"\[[^\]]*\]|\([^)]*\)")
+SUBJECT_PREFIX = re.compile(
+    r"^\s*(fwd|fw|re|reminder|pengingat|perpanjangan|extended|extension|update|last call|"
+    r"h-\d+|info|penting)\b\s*[:\-!]*\s*",
+    re.IGNORECASE,
+)
+
+
+# =========================================================
+# VEKTORISASI (HASHED N-GRAM)
+# =========================================================
+
+def _features(text):
+    words = WORD_PATTERN.findall((text or "").lower())
+    feats = list(words)
+    for word in words:
+        padded = f"#{word}#"
+        feats.extend(padded[i : i + CHAR_NGRAM] for i in range(max(1, len(padded) - CHAR_NGRAM + 1)))
+    return feats
+
+
+def embed_texts(texts):
+    """Return matriks (n, DIM) float32, tiap baris sudah dinormalisasi L2."""
+    matrix = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        feats = _features(text)
+        if not feats:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in feats), dtype=np.uint32, count=len(feats))
+        idx = (hashes % DIM).astype(np.int64)
+        # Sign hashing mengurangi bias tabrakan hash
+        signs = np.where((hashes >> 31) & 1, -1.0, 1.0).astype(np.float32)
+        np.add.at(matrix[row], idx, signs)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _email_text(email):
+    return email.get("summary_text") or email.get("subject") or ""
+
+
+def _timestamp(value):
+    parsed = parse_time(value)
+    return parsed.timestamp() if parsed else 0.0
+
+
+# =========================================================
+# PENGELOMPOKAN THREAD (TANPA INDEX, UNTUK LIST KECIL)
+# =========================================================
+
+def subject_key(subject):
+    """'Fwd: [UMN] Reminder: Open Recruitment Panitia!' -> 'open recruitment panitia'."""
+    text = SUBJECT_TAG.sub(" ", subject or "")
+    previous = None
+    while previous != text:
+        previous = text
+        text = SUBJECT_PREFIX.sub("", text)
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+
+def _sender_key(sender):
+    match = SENDER_ADDRESS.search((sender or "").lower())
+    return match.group(0) if match else None
+
+
+def _same_source(a, b):
+    """Syarat tambahan 1 thread: pengirim sama, atau subjek (ternormalisasi) sama."""
+    sender = _sender_key(a.get("sender"))
+    if sender and sender == _sender_key(b.get("sender")):
+        return True
+    subject = subject_key(a.get("subject"))
+    return bool(subject) and subject == subject_key(b.get("subject"))
+
+
+def latest_per_thread(emails, threshold=THREAD_SIMILARITY):
+    """
+    Kelompokkan email yang isinya mirip lalu ambil yang paling baru per thread.
+    Email diproses dari yang terbaru; tiap email masuk ke thread yang email terbarunya (anchor)
+    punya cosine >= threshold DAN pengirim/subjek yang sama (dibanding ke anchor, bukan berantai,
+    supaya thread tidak melebar).
+    Return (list (email_terbaru, jumlah_email_terkait), list (email_lama, email_terbaru_thread-nya)).
+    Urutan input dipertahankan berdasarkan posisi email terbaru tiap thread.
+    """
+    if len(emails) < 2:
+        return [(email, 0) for email in emails], []
+
+    vectors = embed_texts([_email_text(e) for e in emails])
+    similarity = vectors @ vectors.T
+    newest_first = sorted(range(len(emails)), key=lambda i: _timestamp(emails[i].get("received_at")), reverse=True)
+
+    anchors = []          # Index email terbaru tiap thread
+    related = {}          # anchor -> jumlah email lama yang ikut thread-nya
+    superseded = []
+    for i in newest_first:
+        match = None
+        if anchors:
+            # Anchor paling mirip (di atas ambang) yang juga lolos syarat pengirim/subjek
+            scores = similarity[i, anchors]
+            for best in np.argsort(-scores):
+                if scores[best] < threshold:
+                    break
+                if _same_source(emails[i], emails[anchors[best]]):
+                    match = anchors[best]
+                    break
+        if match is not None:
+            related[match] += 1
+            superseded.append((emails[i], emails[match]))
+            continue
+        anchors.append(i)
+        related[i] = 0
+
+    kept = [(emails[i], related[i]) for i in sorted(anchors)]
+    return kept, superseded
+
+
+# =========================================================
+# INDEX MEMORY-MAPPED
+# =========================================================
+
+class EmbeddingIndex:
+    """
+    Matriks embedding di file `<path>.f32` (memmap) + metadata di `<path>.meta.npz`.
+    Kapasitas file digandakan saat penuh, jadi append tetap murah sampai ratusan ribu email.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.matrix_path = f"{path}.f32"
+        self.meta_path = f"{path}.meta.npz"
+        self.lock = threading.Lock()
+
+        self.ids = []
+        self.times = np.zeros(0, dtype=np.float64)
+        if os.path.exists(self.meta_path) and os.path.exists(self.matrix_path):
+            meta = np.load(self.meta_path)
+            self.ids = meta["ids"].tolist()
+            self.times = meta["times"].astype(np.float64)
+            capacity = os.path.getsize(self.matrix_path) // (DIM * 4)
+            self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(capacity, DIM))
+        else:
+            self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="w+", shape=(INITIAL_CAPACITY, DIM))
+        self.row_of = {email_id: row for row, email_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _ensure_capacity(self, needed):
+        capacity = self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self.matrix.flush()
+        del self.matrix
+        with open(self.matrix_path, "r+b") as f:
+            f.truncate(capacity * DIM * 4)
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(capacity, DIM))
+
+    def index_emails(self, emails):
+        """Tambah/update embedding untuk list email (key: id). Return jumlah yang diproses."""
+        emails = [e for e in emails if _email_text(e)]
+        if not emails:
+            return 0
+        vectors = embed_texts([_email_text(e) for e in emails])
+        with self.lock:
+            new_ids = [str(e["id"]) for e in emails if str(e["id"]) not in self.row_of]
+            self._ensure_capacity(len(self.ids) + len(new_ids))
+            times = list(self.times)
+            for email, vector in zip(emails, vectors):
+                email_id = str(email["id"])
+                row = self.row_of.get(email_id)
+                if row is None:
+                    row = len(self.ids)
+                    self.ids.append(email_id)
+                    self.row_of[email_id] = row
+                    times.append(0.0)
+                self.matrix[row] = vector
+                times[row] = _timestamp(email.get("received_at"))
+            self.times = np.asarray(times, dtype=np.float64)
+            self.matrix.flush()
+            np.savez(self.meta_path, ids=np.array(self.ids), times=self.times)
+        return len(emails)
+
+    def search_vectors(self, queries, k=5):
+        """
+        Top-k cosine untuk banyak query sekaligus (matriks (q, DIM)).
+        Return list per query: [(email_id, skor), ...] urut skor tertinggi.
+        """
+        with self.lock:
+            n = len(self.ids)
+            if n == 0:
+                return [[] for _ in range(len(queries))]
+            k = min(k, n)
+            best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+            best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+            for start in range(0, n, SEARCH_CHUNK_ROWS):
+                block = np.asarray(self.matrix[start : min(n, start + SEARCH_CHUNK_ROWS)])
+                scores = queries @ block.T
+                rows = np.broadcast_to(np.arange(start, start + block.shape[0]), scores.shape)
+                # Gabung kandidat blok ini dengan top-k sebelumnya, lalu potong lagi ke k
+                best_scores = np.concatenate([best_scores, scores], axis=1)
+                best_rows = np.concatenate([best_rows, rows], axis=1)
+                if best_scores.shape[1] > k:
+                    top = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                    best_scores = np.take_along_axis(best_scores, top, axis=1)
+                    best_rows = np.take_along_axis(best_rows, top, axis=1)
+            order = np.argsort(-best_scores, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            best_rows = np.take_along_axis(best_rows, order, axis=1)
+            return [
+                [(self.ids[r], float(s)) for r, s in zip(rows_q, scores_q)]
+                for rows_q, scores_q in zip(best_rows.tolist(), best_scores.tolist())
+            ]
+
+    def similar_to_text(self, text, k=5):
+        return self.search_vectors(embed_texts([text]), k)[0]
+
+    def similar_to_email(self, email_id, k=5):
+        """Email paling mirip dengan email tertentu (email itu sendiri tidak ikut)."""
+        with self.lock:
+            row = self.row_of.get(str(email_id))
+            if row is None:
+                return []
+            query = np.asarray(self.matrix[row : row + 1])
+        results = self.search_vectors(query, k + 1)[0]
+        return [(i, s) for i, s in results if i != str(email_id)][:k]
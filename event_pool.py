@@ -0,0 +1,96 @@
+import time
+import queue
+import threading
+from collections import deque
+
+
+class EventPool:
+    """
+    Antrian event webhook + pool worker thread.
+    Webhook cukup `submit()` lalu langsung balas 200; event diproses di background
+    secara paralel oleh `workers` thread.
+    """
+
+    def __init__(self, handle_fn, workers=4, max_queue=200, latency_window=1000):
+        self.handle_fn = handle_fn
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.threads = []
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.wait_times = deque(maxlen=latency_window)     # Detik antri sebelum diproses
+        self.handle_times = deque(maxlen=latency_window)   # Detik proses 1 event
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"event-worker-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, events):
+        """
+        Masukkan semua event ke antrian, atau tidak sama sekali. Return False kalau tidak muat.
+        Tidak pernah memblok: cek sisa tempat + put_nowait dilakukan di bawah 1 lock, jadi 2 webhook
+        yang datang bersamaan tidak bisa sama-sama lolos cek lalu menunggu di put().
+        (Worker hanya mengambil dari antrian, jadi tempat yang sudah dicek tidak bisa berkurang.)
+        """
+        self.start()
+        now = time.monotonic()
+        with self.lock:
+            if self.queue.qsize() + len(events) > self.queue.maxsize:
+                self.rejected += len(events)
+                return False
+            for event in events:
+                self.queue.put_nowait((event, now))
+            self.accepted += len(events)
+        return True
+
+    def _worker(self):
+        while True:
+            event, enqueued_at = self.queue.get()
+            started = time.monotonic()
+            try:
+                self.handle_fn(event)
+                ok = True
+            except Exception as e:
+                print(f"❌ Gagal proses event: {e}")
+                ok = False
+            finished = time.monotonic()
+            with self.lock:
+                self.processed += 1
+                self.failed += 0 if ok else 1
+                self.wait_times.append(started - enqueued_at)
+                self.handle_times.append(finished - started)
+            self.queue.task_done()
+
+    @staticmethod
+    def _percentile(values, pct):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    def stats(self):
+        with self.lock:
+            waits = list(self.wait_times)
+            handles = list(self.handle_times)
+            return {
+                "queue_depth": self.queue.qsize(),
+                "workers": self.workers,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+                "wait_p50_ms": round(self._percentile(waits, 0.5) * 1000, 1),
+                "wait_p99_ms": round(self._percentile(waits, 0.99) * 1000, 1),
+                "handle_p50_ms": round(self._percentile(handles, 0.5) * 1000, 1),
+                "handle_p99_ms": round(self._percentile(handles, 0.99) * 1000, 1),
+            }
@@ -0,0 +1,205 @@
+import os
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:  # lxml opsional; tanpa itu pakai parser bawaan Python
+    etree = None
+
+# --- KONFIGURASI EKSTRAKSI HTML ---
+# Teks diambil sambil parsing (tanpa membangun pohon DOM) dan parsing berhenti begitu
+# budget karakter habis. Budget sengaja lebih besar dari BODY_CHAR_LIMIT di ingest:
+# kompaksi masih memilih kalimat penting (deadline/link) dari bagian bawah email.
+HTML_TEXT_CHAR_LIMIT = int(os.getenv("HTML_TEXT_CHAR_LIMIT", "10000"))
+FEED_CHUNK_SIZE = 8192  # Karakter HTML per feed(); cek budget di antara potongan
+
+# Isinya tidak pernah tampil sebagai teks
+SKIP_TAGS = {"style", "script", "noscript", "template", "title", "svg", "object", "iframe"}
+# Elemen yang memulai baris baru (kompaksi membaca per baris: footer, signature, kutipan)
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "center", "dd", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "td", "th",
+    "tr", "ul",
+}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+             "param", "source", "track", "wbr"}
+HIDDEN_STYLES = ("display:none", "visibility:hidden", "mso-hide:all")
+# Elemen yang otomatis tertutup oleh tag pembuka tertentu (aturan HTML), dipakai untuk
+# elemen tersembunyi yang tidak ditutup: <p style="display:none">x<p>berikutnya
+AUTO_CLOSED_BY = {
+    "p": BLOCK_TAGS, "li": {"li"}, "dt": {"dt", "dd"}, "dd": {"dt", "dd"},
+    "td": {"td", "th", "tr"}, "th": {"td", "th", "tr"}, "tr": {"tr"}, "option": {"option"},
+}
+# Karakter tak terlihat yang dipakai preheader newsletter untuk mengisi ruang
+INVISIBLE_CHARS = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff\u034f\u00ad"), None)
+
+
+def _last_index(tags, tag):
+    return len(tags) - 1 - tags[::-1].index(tag)
+
+
+def _is_hidden(attrs):
+    if "hidden" in attrs:
+        return True
+    style = attrs.get("style")
+    if not style:
+        return False
+    style = style.replace(" ", "").lower()
+    return any(hidden in style for hidden in HIDDEN_STYLES)
+
+
+class _TextCollector:
+    """
+    Penerima event parser (start/end/data), dipakai lxml (parser target) maupun html.parser.
+    Spasi dipadatkan per baris, baris kosong dibuang, berhenti menerima teks saat budget habis.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lines = []
+        self.fragments = []   # Potongan teks baris yang sedang dibangun (inline: <b>, <a>, ...)
+        self.size = 0         # Karakter baris jadi (+ newline)
+        self.pending = 0      # Karakter mentah di fragments
+        self.open_tags = []   # Elemen terbuka di luar bagian yang dilewati
+        self.skip_tag = None  # Tag yang isinya sedang dilewati (style/script/tersembunyi)
+        self.skip_open = []   # Elemen terbuka di dalam skip_tag
+        self.full = False
+
+    def start(self, tag, attrs):
+        if self.skip_tag:
+            # html.parser tidak melengkapi tag penutup: <p hidden> berakhir saat blok berikutnya dibuka
+            if tag in AUTO_CLOSED_BY.get(self.skip_tag, ()) and not any(t in BLOCK_TAGS for t in self.skip_open):
+                self.skip_tag = None
+            else:
+                if tag not in VOID_TAGS:
+                    self.skip_open.append(tag)
+                return
+        if tag in SKIP_TAGS or _is_hidden(attrs):
+            if tag not in VOID_TAGS:
+                self.skip_tag, self.skip_open = tag, []
+            return
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+        if tag in BLOCK_TAGS:
+            self.break_line()
+
+    def end(self, tag):
+        if self.skip_tag:
+            if tag in self.skip_open:
+                del self.skip_open[_last_index(self.skip_open, tag):]
+                return
+            if tag == self.skip_tag:
+                self.skip_tag = None
+                return
+            if tag not in self.open_tags:
+                return  # Tag penutup nyasar di dalam bagian tersembunyi
+            # Parent elemen tersembunyi ditutup: elemen itu pasti sudah berakhir
+            self.skip_tag = None
+        if tag in self.open_tags:
+            del self.open_tags[_last_index(self.open_tags, tag):]
+        if tag in BLOCK_TAGS:
+            self.break_line()
+
+    def data(self, text):
+        if self.skip_tag or self.full:
+            return
+        self.fragments.append(text)
+        self.pending += len(text)
+        if self.size + self.pending >= self.limit:
+            # Ukuran mentah >= ukuran setelah spasi dipadatkan; padatkan dulu baru cek lagi
+            self.break_line()
+            self.full = self.size >= self.limit
+
+    def break_line(self):
+        if not self.fragments:
+            return
+        line = " ".join("".join(self.fragments).translate(INVISIBLE_CHARS).split())
+        self.fragments = []
+        self.pending = 0
+        if line:
+            self.lines.append(line)
+            self.size += len(line) + 1
+
+    def close(self):
+        self.break_line()
+        return "\n".join(self.lines)[: self.limit]
+
+
+def _extract_lxml(html, limit):
+    collector = _TextCollector(limit)
+    parser = etree.HTMLParser(target=_LxmlTarget(collector), no_network=True, remove_comments=True)
+    for i in range(0, len(html), FEED_CHUNK_SIZE):
+        parser.feed(html[i : i + FEED_CHUNK_SIZE])
+        if collector.full:
+            break
+    try:
+        parser.close()
+    except etree.XMLSyntaxError:
+        pass  # Dokumen kosong / rusak: pakai teks yang sudah terkumpul
+    return collector.close()
+
+
+class _LxmlTarget:
+    def __init__(self, collector):
+        self.collector = collector
+
+    def start(self, tag, attrib):
+        self.collector.start(tag, attrib)
+
+    def end(self, tag):
+        self.collector.end(tag)
+
+    def data(self, text):
+        self.collector.data(text)
+
+    def close(self):
+        return None
+
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+        if tag in VOID_TAGS:
+            # <br> / <img> tidak punya tag penutup di HTML
+            self.collector.end(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in VOID_TAGS:
+            self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+def _extract_stdlib(html, limit):
+    collector = _TextCollector(limit)
+    parser = _StdlibParser(collector)
+    for i in range(0, len(html), FEED_CHUNK_SIZE):
+        parser.feed(html[i : i + FEED_CHUNK_SIZE])
+        if collector.full:
+            break
+    else:
+        parser.close()
+    return collector.close()
+
+
+BACKENDS = {"html.parser": _extract_stdlib}
+if etree is not None:
+    BACKENDS["lxml"] = _extract_lxml
+DEFAULT_BACKEND = "lxml" if etree is not None else "html.parser"
+
+
+def html_to_text(html, limit=HTML_TEXT_CHAR_LIMIT, backend=DEFAULT_BACKEND):
+    """Teks bacaan dari HTML email: tanpa style/script/elemen tersembunyi, max `limit` karakter."""
+    if not html:
+        return ""
+    return BACKENDS[backend](html, limit)
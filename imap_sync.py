@@ -0,0 +1,237 @@
+import os
+import re
+import json
+import base64
+import quopri
+from metrics import registry
+
+# --- KONFIGURASI SYNC INCREMENTAL ---
+# State per mailbox: UIDVALIDITY + UID terakhir yang sudah dilihat.
+# Kalau UIDVALIDITY berubah (mailbox di-reset server), state dianggap tidak valid.
+STATE_PATH = os.getenv("IMAP_STATE_PATH", "imap_state.json")
+MAX_BODY_BYTES = 65536   # Ambil max 64KB per bagian teks (yang dipakai cuma 2500 karakter)
+FETCH_CHUNK_SIZE = 100   # Jumlah UID per perintah FETCH
+
+LITERAL_MARKER = re.compile(rb"\{\d+\}\s*$")
+TOKEN_PATTERN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+
+OPEN = object()
+CLOSE = object()
+
+
+# =========================================================
+# STATE (UIDVALIDITY + HIGH-WATER MARK)
+# =========================================================
+
+def load_state():
+    try:
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(state):
+    tmp_path = STATE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def state_key(user, folder):
+    return f"{user}:{folder}"
+
+
+# =========================================================
+# PARSER RESPONSE IMAP (BODYSTRUCTURE & BODY[...])
+# =========================================================
+
+def _tokenize_bytes(chunk):
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(chunk):
+        tok = match.group(0)
+        if tok == b"(":
+            tokens.append(OPEN)
+        elif tok == b")":
+            tokens.append(CLOSE)
+        elif tok.startswith(b'"'):
+            tokens.append(re.sub(rb"\\(.)", rb"\1", tok[1:-1]).decode("utf-8", errors="replace"))
+        elif tok.upper() == b"NIL":
+            tokens.append(None)
+        else:
+            tokens.append(tok.decode("ascii", errors="replace"))
+    return tokens
+
+
+def _tokenize(data):
+    """imaplib mengembalikan campuran bytes & tuple (prefix, literal). Gabung jadi 1 stream token."""
+    tokens = []
+    for item in data:
+        if isinstance(item, tuple):
+            prefix, literal = item[0], item[1]
+            tokens.extend(_tokenize_bytes(LITERAL_MARKER.sub(b"", prefix)))
+            tokens.append(bytes(literal))
+        elif isinstance(item, bytes):
+            tokens.extend(_tokenize_bytes(item))
+    return tokens
+
+
+def _build_lists(tokens):
+    root = []
+    stack = [root]
+    for tok in tokens:
+        if tok is OPEN:
+            new_list = []
+            stack[-1].append(new_list)
+            stack.append(new_list)
+        elif tok is CLOSE:
+            if len(stack) > 1:
+                stack.pop()
+        else:
+            stack[-1].append(tok)
+    return root
+
+
+def parse_fetch_response(data):
+    """
+    Parse hasil `UID FETCH`. Return dict {uid: {NAMA_ITEM: nilai}}.
+    Contoh: {"345": {"UID": "345", "BODYSTRUCTURE": [...], "BODY[1]<0>": b"..."}}
+    """
+    results = {}
+    for item in _build_lists(_tokenize(data)):
+        if not isinstance(item, list):
+            continue  # Nomor urut pesan
+        fields = {}
+        for i in range(0, len(item) - 1, 2):
+            if isinstance(item[i], str):
+                fields[item[i].upper()] = item[i + 1]
+        if "UID" in fields:
+            results[fields["UID"]] = fields
+    return results
+
+
+def _params_dict(params):
+    if not isinstance(params, list):
+        return {}
+    return {
+        str(params[i]).upper(): params[i + 1]
+        for i in range(0, len(params) - 1, 2)
+    }
+
+
+def find_text_parts(structure, prefix=""):
+    """
+    Cari bagian text/plain & text/html (bukan lampiran) dari BODYSTRUCTURE.
+    Return list (part_spec, subtype, encoding, charset).
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    # Multipart: anak-anaknya berupa list di depan, diikuti subtype (string)
+    if isinstance(structure[0], list):
+        parts = []
+        for idx, child in enumerate(structure, 1):
+            if not isinstance(child, list):
+                break
+            spec = f"{prefix}.{idx}" if prefix else str(idx)
+            parts.extend(find_text_parts(child, spec))
+        return parts
+
+    body_type = str(structure[0] or "").upper()
+    subtype = str(structure[1] or "").upper() if len(structure) > 1 else ""
+    if body_type != "TEXT" or subtype not in ("PLAIN", "HTML"):
+        return []
+
+    params = _params_dict(structure[2] if len(structure) > 2 else None)
+    # Lampiran .txt/.html tetap lampiran, jangan diambil
+    if "NAME" in params:
+        return []
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and str(disposition[0] or "").upper() == "ATTACHMENT":
+        return []
+
+    encoding = structure[5] if len(structure) > 5 else None
+    return [(prefix or "1", subtype, encoding, params.get("CHARSET"))]
+
+
+def decode_part(raw, encoding, charset):
+    encoding = str(encoding or "7BIT").upper()
+    if encoding == "BASE64":
+        compact = re.sub(rb"\s+", b"", raw)
+        # Partial fetch bisa memotong di tengah blok base64
+        compact = compact[: len(compact) // 4 * 4]
+        try:
+            raw = base64.b64decode(compact)
+        except ValueError:
+            return ""
+    elif encoding == "QUOTED-PRINTABLE":
+        raw = quopri.decodestring(raw)
+    try:
+        return raw.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+# =========================================================
+# FETCH BODY TANPA LAMPIRAN
+# =========================================================
+
+def _response_size(data):
+    size = 0
+    for item in data or []:
+        if isinstance(item, tuple):
+            size += sum(len(part) for part in item if isinstance(part, bytes))
+        elif isinstance(item, bytes):
+            size += len(item)
+    return size
+
+
+def _uid_fetch(client, uids, items):
+    typ, data = client.uid("FETCH", ",".join(uids), items)
+    kind = "structure" if "BODYSTRUCTURE" in items else "body"
+    registry.inc("imap_bytes_total", _response_size(data), kind=kind)
+    if typ != "OK":
+        raise RuntimeError(f"UID FETCH gagal: {typ}")
+    return parse_fetch_response(data)
+
+
+def fetch_text_bodies(client, uids):
+    """
+    Ambil isi teks untuk daftar UID tanpa men-download lampiran.
+    1. FETCH BODYSTRUCTURE -> cari nomor bagian text/plain (atau text/html kalau tidak ada).
+    2. FETCH BODY.PEEK[bagian] secara bulk, dikelompokkan per nomor bagian.
+    Return dict {uid: (text, html)}.
+    """
+    chosen = {}
+    for i in range(0, len(uids), FETCH_CHUNK_SIZE):
+        chunk = uids[i : i + FETCH_CHUNK_SIZE]
+        for uid, fields in _uid_fetch(client, chunk, "(BODYSTRUCTURE)").items():
+            parts = find_text_parts(fields.get("BODYSTRUCTURE"))
+            plain = [p for p in parts if p[1] == "PLAIN"]
+            html = [p for p in parts if p[1] == "HTML"]
+            # Sama seperti sebelumnya: utamakan teks polos, HTML hanya cadangan
+            if plain:
+                chosen[uid] = plain[0]
+            elif html:
+                chosen[uid] = html[0]
+
+    by_spec = {}
+    for uid, part in chosen.items():
+        by_spec.setdefault(part[0], []).append(uid)
+
+    bodies = {uid: ("", "") for uid in uids}
+    for spec, spec_uids in by_spec.items():
+        for i in range(0, len(spec_uids), FETCH_CHUNK_SIZE):
+            chunk = spec_uids[i : i + FETCH_CHUNK_SIZE]
+            response = _uid_fetch(client, chunk, f"(BODY.PEEK[{spec}]<0.{MAX_BODY_BYTES}>)")
+            for uid, fields in response.items():
+                raw = next(
+                    (v for k, v in fields.items() if k.startswith("BODY[") and v is not None),
+                    b"",
+                )
+                if isinstance(raw, str):
+                    raw = raw.encode("utf-8")
+                _, subtype, encoding, charset = chosen[uid]
+                text = decode_part(raw, encoding, charset)
+                bodies[uid] = (text, "") if subtype == "PLAIN" else ("", text)
+    return bodies
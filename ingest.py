@@ -2,9 +2,14 @@ import os
 import sys
 from datetime import date, timedelta
 from dotenv import load_dotenv
-from imap_tools import MailBox, AND
-from supabase import create_client, Client
-from bs4 import BeautifulSoup  # Library pembersih HTML
+from imap_tools import MailBox, MailBoxUnencrypted, AND, U, MailMessageFlags
+import imap_sync
+import urgency
+import html_text
+from compaction import compact_body, CompactionStats
+from clients import get_storage
+from storage import STORAGE_BACKEND
+from metrics import registry
 
 # 1. Load Environment Variables
 load_dotenv()
@@ -14,28 +19,252 @@ email_pass = os.getenv("EMAIL_PASS")
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
 
-if not all([email_user, email_pass, supabase_url, supabase_key]):
+if not all([email_user, email_pass]) or (STORAGE_BACKEND == "supabase" and not all([supabase_url, supabase_key])):
     print("❌ Error: Pastikan semua kunci di .env sudah diisi!")
     sys.exit()
 
-print("🔌 Menghubungkan ke Supabase...")
-supabase: Client = create_client(supabase_url, supabase_key)
+print(f"🔌 Menghubungkan ke storage ({STORAGE_BACKEND})...")
+storage = get_storage()
 
 # --- KONFIGURASI ---
+IMAP_HOST = os.getenv("IMAP_HOST", "imap.gmail.com")
+IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
+# IMAP_SSL=0 hanya untuk server lokal (misal server palsu di bench/)
+IMAP_SSL = os.getenv("IMAP_SSL", "1") != "0"
 # Menambahkan "no-reply" ke daftar blacklist
 IGNORED_SENDERS = ["noreply@elearning.umn.ac.id", "do-not-reply", "google-classroom", "no-reply"]
 IGNORED_SUBJECTS = ["You have submitted", "Submission receipt", "Attendance"]
-FETCH_LIMIT = 12 #Limit Email Reader
+FETCH_LIMIT = int(os.getenv("FETCH_LIMIT", "12")) #Limit Email Reader
 DAYS_BACK = 1
+# "incremental" = hanya UID baru sejak run terakhir (default), "window" = cara lama (DAYS_BACK + FETCH_LIMIT)
+INGEST_MODE = os.getenv("INGEST_MODE", "incremental")
+INSERT_CHUNK_SIZE = 500  # Jumlah baris per request insert
+BODY_CHAR_LIMIT = 2500   # Panjang maksimal body_snippet di DB
+
+# Token body sebelum/sesudah kompaksi untuk run ini
+compaction_stats = CompactionStats()
 
 def clean_email_body(html_content):
-    """Fungsi untuk membuang tag HTML dan menyisakan teks bacaan saja."""
-    if not html_content:
-        return ""
-    soup = BeautifulSoup(html_content, "html.parser")
-    # get_text dengan separator spasi agar kata-kata tidak menempel
-    text = soup.get_text(separator="\n", strip=True)
-    return text
+    """
+    Fungsi untuk membuang tag HTML dan menyisakan teks bacaan saja.
+    Streaming (lxml kalau terpasang): style/script/elemen tersembunyi dilewati dan
+    parsing berhenti setelah html_text.HTML_TEXT_CHAR_LIMIT karakter teks.
+    """
+    return html_text.html_to_text(html_content)
+
+def open_mailbox():
+    """Login IMAP pakai EMAIL_USER/EMAIL_PASS. Dipakai sebagai context manager (`with open_mailbox() as mailbox`)."""
+    mailbox = MailBox(IMAP_HOST, IMAP_PORT) if IMAP_SSL else MailBoxUnencrypted(IMAP_HOST, IMAP_PORT)
+    return mailbox.login(email_user, email_pass)
+
+def is_blacklisted(sender, subject):
+    return any(blocked in sender.lower() for blocked in IGNORED_SENDERS) or \
+           any(blocked in subject for blocked in IGNORED_SUBJECTS)
+
+def build_email_row(msg, text, html):
+    """Ubah pesan IMAP jadi 1 baris tabel emails (status PENDING_AI)."""
+    # --- 3. PEMBERSIHAN DATA (HTML CLEANING) ---
+    # Prioritas 1: Ambil text (Biasanya sudah polos)
+    # Prioritas 2: Ambil html lalu ambil teksnya (html_text.py)
+    raw_body = text if text else clean_email_body(html)
+
+    # Padatkan dulu (buang kutipan balasan, signature, footer; pilih kalimat penting)
+    # supaya deadline/link di bagian bawah email tidak ikut terpotong
+    compacted = compact_body(raw_body, BODY_CHAR_LIMIT // 4, compaction_stats)
+    
+    # Bersihkan spasi ganda & enter berlebihan
+    clean_body = " ".join(compacted.split()) 
+    
+    # Potong max 2500 karakter (jaga-jaga)
+    body_final = clean_body[:BODY_CHAR_LIMIT]
+    
+    return {
+        "email_uid": msg.uid,
+        "sender": msg.from_,
+        "subject": msg.subject,
+        "body_snippet": body_final, 
+        "received_at": msg.date.isoformat(),
+        "category": "PENDING_AI",
+        "summary_text": "Menunggu antrian AI...",
+        # Skor urgensi lokal + posisi antrian AI (lihat urgency.py)
+        **urgency.urgency_fields(msg.from_, msg.subject, msg.date),
+    }
+
+def bulk_insert_emails(rows):
+    """
+    Simpan semua email baru sekaligus (per chunk). Konflik di email_uid diabaikan oleh storage,
+    jadi kalau ada proses lain yang insert duluan, baris itu dilewati (bukan error).
+    Return (baris_yang_masuk, jumlah_gagal).
+    """
+    inserted = []
+    count_failed = 0
+    for i in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[i : i + INSERT_CHUNK_SIZE]
+        try:
+            rows_inserted = storage.insert_emails(chunk)
+            for row in rows_inserted:
+                print(f"   ✅ INSERT: {row['subject'][:30]}...")
+            inserted.extend(rows_inserted)
+        except Exception as e:
+            print(f"   ❌ Gagal simpan DB ({len(chunk)} email): {e}")
+            count_failed += len(chunk)
+    return inserted, count_failed
+
+def fetch_window(mailbox, start_date):
+    """Mode lama: cari email sejak start_date, download full, max FETCH_LIMIT."""
+    print(f"🔎 Mencari email sejak {start_date} (Max {FETCH_LIMIT} email)...")
+    
+    # Kriteria Filter Server:
+    # 1. date_gte = Tanggal lebih besar atau sama dengan start_date (3 hari lalu)
+    criteria = AND(date_gte=start_date)
+    
+    # Fetch email
+    emails = mailbox.fetch(criteria, reverse=True, limit=FETCH_LIMIT, mark_seen=True)
+
+    candidates = []
+    count_skipped_spam = 0
+    for msg in emails:
+        registry.inc("imap_bytes_total", msg.size, kind="full")
+        if is_blacklisted(msg.from_, msg.subject):
+            print(f"   🚫 Skip Blacklist: {msg.subject[:30]}...")
+            count_skipped_spam += 1
+            continue
+        candidates.append((msg, msg.text, msg.html))
+    return candidates, count_skipped_spam, None
+
+def list_new_uids(mailbox, start_date):
+    """
+    Cari UID di atas high-water mark run sebelumnya (sync awal: sejak start_date).
+    Return (uids, cursor); cursor dipakai advance_state() setelah email tersimpan.
+    """
+    folder = mailbox.folder.get()
+    status = mailbox.folder.status(folder)
+    uidvalidity = str(status["UIDVALIDITY"])
+    state = imap_sync.load_state()
+    key = imap_sync.state_key(email_user, folder)
+    entry = state.get(key)
+
+    if entry and entry.get("uidvalidity") == uidvalidity:
+        last_uid = int(entry["last_uid"])
+        print(f"🔎 Sync incremental: UID > {last_uid}...")
+        # Catatan IMAP: "N:*" selalu mengembalikan UID terbesar walau < N, jadi difilter lagi
+        uids = [u for u in mailbox.uids(AND(uid=U(str(last_uid + 1), "*"))) if int(u) > last_uid]
+    else:
+        if entry:
+            print("⚠️ UIDVALIDITY berubah, sync ulang dari tanggal...")
+        print(f"🔎 Sync awal: email sejak {start_date}...")
+        last_uid = 0
+        uids = mailbox.uids(AND(date_gte=start_date))
+
+    cursor = {"state": state, "key": key, "uidvalidity": uidvalidity,
+              "last_uid": last_uid, "uidnext": int(status["UIDNEXT"])}
+    return uids, cursor
+
+def advance_state(cursor, uids):
+    """State IMAP baru setelah `uids` diproses. None kalau tidak ada yang perlu disimpan."""
+    state, key, uidvalidity = cursor["state"], cursor["key"], cursor["uidvalidity"]
+    if not uids:
+        entry = state.get(key)
+        if entry is None or entry.get("uidvalidity") != uidvalidity:
+            # Inbox kosong di window awal: mulai dari UID terakhir saat ini
+            state[key] = {"uidvalidity": uidvalidity, "last_uid": cursor["uidnext"] - 1}
+            return state
+        return None
+    state[key] = {"uidvalidity": uidvalidity, "last_uid": max(cursor["last_uid"], *(int(u) for u in uids))}
+    return state
+
+def fetch_uid_chunk(mailbox, uids):
+    """
+    Header 1 potong UID -> filter blacklist -> download bagian teks saja (lampiran tidak diambil).
+    Return (candidates, count_skipped_spam).
+    """
+    passed = []
+    count_skipped_spam = 0
+    for msg in mailbox.fetch(AND(uid=uids), headers_only=True, mark_seen=False, bulk=True):
+        registry.inc("imap_bytes_total", msg.size, kind="header")
+        if is_blacklisted(msg.from_, msg.subject):
+            print(f"   🚫 Skip Blacklist: {msg.subject[:30]}...")
+            count_skipped_spam += 1
+            continue
+        passed.append(msg)
+
+    bodies = imap_sync.fetch_text_bodies(mailbox.client, [msg.uid for msg in passed])
+    candidates = [(msg, *bodies.get(msg.uid, ("", ""))) for msg in passed]
+    return candidates, count_skipped_spam
+
+def fetch_incremental(mailbox, start_date):
+    """
+    Mode incremental: hanya UID di atas high-water mark run sebelumnya.
+    Header di-fetch duluan, blacklist dicek dari header, lalu hanya bagian
+    text/plain atau text/html yang di-download (lampiran tidak pernah diambil).
+    Return (candidates, count_skipped_spam, state_baru).
+    """
+    uids, cursor = list_new_uids(mailbox, start_date)
+    if not uids:
+        return [], 0, advance_state(cursor, uids)
+
+    print(f"   📨 {len(uids)} email baru, ambil header dulu...")
+
+    candidates = []
+    count_skipped_spam = 0
+    for i in range(0, len(uids), imap_sync.FETCH_CHUNK_SIZE):
+        chunk_candidates, chunk_spam = fetch_uid_chunk(mailbox, uids[i : i + imap_sync.FETCH_CHUNK_SIZE])
+        candidates.extend(chunk_candidates)
+        count_skipped_spam += chunk_spam
+
+    # Sama seperti mode lama: semua email yang sudah dibaca bot ditandai seen
+    mailbox.flag(uids, MailMessageFlags.SEEN, True)
+
+    return candidates, count_skipped_spam, advance_state(cursor, uids)
+
+def store_candidates(candidates, extra_fields=None):
+    """
+    Bersihkan + simpan kandidat email ke DB (cek duplikat UID dulu, lalu bulk insert).
+    Return (baris_baru_di_db, jumlah_duplikat, jumlah_gagal).
+    """
+    count_skipped_db = 0
+
+    # --- CEK DUPLIKAT DB (1 query untuk semua UID) ---
+    existing_uids = storage.find_existing_uids([msg.uid for msg, _, _ in candidates])
+    
+    new_rows = []
+    for msg, text, html in candidates:
+        if msg.uid in existing_uids:
+            print(f"   ⏩ Skip Duplikat DB: {msg.subject[:30]}...")
+            count_skipped_db += 1
+            continue
+        row = build_email_row(msg, text, html)
+        if extra_fields:
+            row.update(extra_fields)
+        new_rows.append(row)
+
+    # --- BULK INSERT ---
+    inserted, count_failed = bulk_insert_emails(new_rows)
+    return inserted, count_skipped_db, count_failed
+
+def ingest_mailbox(mailbox, start_date, mode=None, extra_fields=None):
+    """
+    Ambil email baru dari mailbox yang sudah login, lalu simpan ke DB.
+    Dipakai oleh run harian (process_emails) dan daemon IDLE.
+    `extra_fields` ditambahkan ke tiap baris baru (misal kolom lease milik daemon).
+    Return (baris_baru_di_db, jumlah_spam, jumlah_duplikat).
+    """
+    # --- 1. FETCH + FILTER BLACKLIST ---
+    with registry.timer("imap_fetch"):
+        if (mode or INGEST_MODE) == "window":
+            candidates, count_skipped_spam, new_state = fetch_window(mailbox, start_date)
+        else:
+            candidates, count_skipped_spam, new_state = fetch_incremental(mailbox, start_date)
+
+    # --- 2. CEK DUPLIKAT + SIMPAN ---
+    with registry.timer("store"):
+        inserted, count_skipped_db, count_failed = store_candidates(candidates, extra_fields)
+
+    # High-water mark hanya maju kalau semua email baru sudah aman di DB
+    if new_state is not None and count_failed == 0:
+        imap_sync.save_state(new_state)
+
+    return inserted, count_skipped_spam, count_skipped_db
 
 def process_emails():
     print("📩 Sedang login ke Email...")
@@ -45,77 +274,22 @@ def process_emails():
     start_date = today - timedelta(days=DAYS_BACK)
     
     try:
-        with MailBox('imap.gmail.com').login(email_user, email_pass) as mailbox:
-            print(f"🔎 Mencari email sejak {start_date} (Max {FETCH_LIMIT} email)...")
-            
-            # Kriteria Filter Server:
-            # 1. date_gte = Tanggal lebih besar atau sama dengan start_date (3 hari lalu)
-            criteria = AND(date_gte=start_date)
-            
-            # Fetch email
-            emails = mailbox.fetch(criteria, reverse=True, limit=FETCH_LIMIT, mark_seen=True)
-            
-            count_processed = 0
-            count_skipped_db = 0
-            count_skipped_spam = 0
-            
-            for msg in emails:
-                email_uid = msg.uid
-                subject = msg.subject
-                sender = msg.from_
-
-                # --- 1. FILTER BLACKLIST ---
-                if any(blocked in sender.lower() for blocked in IGNORED_SENDERS) or \
-                   any(blocked in subject for blocked in IGNORED_SUBJECTS):
-                    print(f"   🚫 Skip Blacklist: {subject[:30]}...")
-                    count_skipped_spam += 1
-                    continue
-
-                # --- 2. CEK DUPLIKAT DB ---
-                existing = supabase.table("emails").select("id").eq("email_uid", email_uid).execute()
-                if existing.data:
-                    print(f"   ⏩ Skip Duplikat DB: {subject[:30]}...")
-                    count_skipped_db += 1
-                    continue
-                
-                # --- 3. PEMBERSIHAN DATA (HTML CLEANING) ---
-                # Prioritas 1: Ambil msg.text (Biasanya sudah polos)
-                # Prioritas 2: Ambil msg.html lalu bersihkan pakai BeautifulSoup
-                raw_body = msg.text if msg.text else clean_email_body(msg.html)
-                
-                # Bersihkan spasi ganda & enter berlebihan
-                clean_body = " ".join(raw_body.split()) 
-                
-                # Potong max 2500 karakter
-                body_final = clean_body[:2500]
-                
-                new_email = {
-                    "email_uid": email_uid,
-                    "sender": sender,
-                    "subject": subject,
-                    "body_snippet": body_final, 
-                    "received_at": msg.date.isoformat(),
-                    "category": "PENDING_AI",
-                    "summary_text": "Menunggu antrian AI..."
-                }
-                
-                # --- 4. INSERT ---
-                try:
-                    supabase.table("emails").insert(new_email).execute()
-                    print(f"   ✅ INSERT: {subject[:30]}...")
-                    count_processed += 1
-                except Exception as e:
-                    print(f"   ❌ Gagal simpan DB: {e}")
+        with open_mailbox() as mailbox:
+            inserted, count_skipped_spam, count_skipped_db = ingest_mailbox(mailbox, start_date)
 
             print("\n" + "="*30)
             print(f"📊 Laporan Selesai:")
-            print(f"   - Masuk DB (Bersih) : {count_processed}")
+            print(f"   - Masuk DB (Bersih) : {len(inserted)}")
             print(f"   - Dibuang (Spam)    : {count_skipped_spam}")
             print(f"   - Dibuang (Duplikat): {count_skipped_db}")
             print("="*30)
+            compaction_stats.report("Kompaksi body (ingest)")
+            registry.write_run_report("ingest", extra={
+                "inserted": len(inserted), "spam": count_skipped_spam, "duplicates": count_skipped_db,
+            })
 
     except Exception as e:
         print(f"❌ Error IMAP: {e}")
 
 if __name__ == "__main__":
-    process_emails()
\ No newline at end of file
+    process_emails()
@@ -0,0 +1,224 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# --- KONFIGURASI METRICS ---
+# Semua modul mencatat ke 1 registry per proses (global `registry`).
+# Batch run menulis laporan JSON; app.py menyajikan format Prometheus di /metrics.
+RUN_REPORT_PATH = os.getenv("RUN_REPORT_PATH", "run_report.json")
+PROFILE_PATH = os.getenv("PROFILE_PATH", "run_profile.prof")
+METRIC_PREFIX = "emailbot_"
+# Batas bucket histogram latency (detik)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HELP = {
+    "stage_seconds": "Latency per stage pipeline",
+    "imap_bytes_total": "Byte yang di-download dari IMAP",
+    "llm_calls_total": "Panggilan LLM per model dan hasil",
+    "llm_tokens_total": "Token LLM per model (prompt/completion)",
+    "llm_fallback_total": "Jawaban LLM yang datang dari model cadangan (bukan MODELS_TO_TRY[0])",
+    "supabase_requests_total": "Round-trip HTTP ke Supabase",
+    "line_api_calls_total": "Panggilan HTTP ke API LINE",
+    "ai_output_repairs_total": "Field/JSON output AI yang diperbaiki lokal",
+    "llm_requests_saved_total": "Request LLM yang tidak perlu dikirim berkat perbaikan lokal",
+    "llm_followup_total": "Request follow-up kecil untuk field AI yang kurang",
+    "urgent_notify_seconds": "Email masuk DB sampai notifikasi URGENT terkirim",
+}
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """Perkiraan kuantil dari bucket (batas atas bucket yang memuat kuantil)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            if running >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class MetricsRegistry:
+    """Counter & histogram berlabel, aman dipakai dari banyak thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}     # name -> {label_key: value}
+        self.histograms = {}   # name -> {label_key: Histogram}
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            key = _key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            key = _key(labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """`with registry.timer("ai"):` -> catat durasi ke histogram stage_seconds."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.monotonic() - started, stage=stage, **labels)
+
+    def snapshot(self):
+        """Dict siap JSON: counter per label + ringkasan histogram (count, sum, p50, p95, max)."""
+        with self.lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self.counters.items()
+            }
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "count": h.count,
+                        "sum": round(h.sum, 4),
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "max": round(h.max, 4),
+                    }
+                    for key, h in series.items()
+                ]
+                for name, series in self.histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self, gauges=None):
+        """Format teks Prometheus. `gauges`: dict {nama: nilai} tambahan (misal kedalaman antrian)."""
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                full = METRIC_PREFIX + name
+                if name in HELP:
+                    lines.append(f"# HELP {full} {HELP[name]}")
+                lines.append(f"# TYPE {full} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                full = METRIC_PREFIX + name
+                if name in HELP:
+                    lines.append(f"# HELP {full} {HELP[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, h in sorted(series.items()):
+                    running = 0
+                    for bound, count in zip(h.buckets, h.counts):
+                        running += count
+                        lines.append(f"{full}_bucket{_format_labels(key, [('le', bound)])} {running}")
+                    lines.append(f"{full}_bucket{_format_labels(key, [('le', '+Inf')])} {h.count}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {h.sum}")
+                    lines.append(f"{full}_count{_format_labels(key)} {h.count}")
+        for name, value in sorted((gauges or {}).items()):
+            full = METRIC_PREFIX + name
+            lines.append(f"# TYPE {full} gauge")
+            lines.append(f"{full} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_run_report(self, name, path=RUN_REPORT_PATH, extra=None):
+        """Tulis laporan JSON untuk 1 batch run (pipeline / process / notify)."""
+        report = {
+            "run": name,
+            "started_at": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            **(extra or {}),
+            **self.snapshot(),
+        }
+        try:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2, default=str)
+            print(f"🧾 Laporan run tersimpan: {path}")
+        except OSError as e:
+            print(f"⚠️ Gagal tulis laporan run: {e}")
+        return report
+
+
+registry = MetricsRegistry()
+
+
+_profiling = threading.Event()
+
+
+def _dump_profile(profiler, path, top):
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+    print(out.getvalue())
+    print(f"🔬 Profil tersimpan: {path} (buka dengan `python -m pstats {path}` / snakeviz)")
+
+
+def run_profiled(fn, path=PROFILE_PATH, top=25):
+    """Jalankan fn() di bawah cProfile, simpan .prof lalu print fungsi dengan waktu kumulatif terbesar."""
+    profiler = cProfile.Profile()
+    _profiling.set()
+    try:
+        return profiler.runcall(fn)
+    finally:
+        _profiling.clear()
+        _dump_profile(profiler, path, top)
+
+
+def profile_thread(fn, name, path=PROFILE_PATH, top=15):
+    """
+    cProfile hanya melihat thread pemanggil. Bungkus target thread dengan ini supaya
+    saat run_profiled aktif, thread tersebut punya profil sendiri (<path>.<name>.prof).
+    """
+    def wrapper(*args, **kwargs):
+        if not _profiling.is_set():
+            return fn(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            base, ext = os.path.splitext(path)
+            _dump_profile(profiler, f"{base}.{name}{ext}", top)
+    return wrapper
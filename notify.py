@@ -1,13 +1,16 @@
 import os
 import sys
-import math
-import time
-from datetime import datetime
+import uuid
+import statistics
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from linebot import LineBotApi
 from linebot.models import TextSendMessage
-from linebot.exceptions import LineBotApiError
+from clients import get_storage, get_line_bot_api
+from storage import STORAGE_BACKEND
+from embedding_index import latest_per_thread
+import delivery
+from timeutil import parse_time
+from metrics import registry
 
 # --- KONFIGURASI TESTING ---
 # Change to True if you want to force sending Benefit/Task Recap NOW
@@ -19,14 +22,17 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 LINE_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
+# Mode 1 penerima (lama). Kalau tabel subscribers berisi, notifikasi di-fan-out ke semua subscriber.
 LINE_USER_ID = os.getenv("LINE_USER_ID")
+# Mode subscriber: email kandidat diambil dari N hari terakhir, status kirim per subscriber di tabel deliveries
+DELIVERY_LOOKBACK_DAYS = int(os.getenv("DELIVERY_LOOKBACK_DAYS", "14"))
 
-if not all([SUPABASE_URL, SUPABASE_KEY, LINE_TOKEN, LINE_USER_ID]):
+if not LINE_TOKEN or (STORAGE_BACKEND == "supabase" and not all([SUPABASE_URL, SUPABASE_KEY])):
     print("❌ Error: Pastikan kunci SUPABASE dan LINE lengkap di .env")
     sys.exit()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-line_bot_api = LineBotApi(LINE_TOKEN)
+storage = get_storage()
+line_bot_api = get_line_bot_api()
 
 def get_indo_date():
     """Helper untuk format tanggal Indonesia (Contoh: 8 Januari 2026)"""
@@ -37,88 +43,199 @@ def get_indo_date():
     now = datetime.now()
     return f"{now.day} {months[now.month - 1]} {now.year}"
 
+# --- BATAS LINE MESSAGING API ---
+LINE_TEXT_LIMIT = 5000          # Maks karakter per balon teks
+
 def mark_as_notified(email_ids):
     if not email_ids: return
     try:
-        supabase.table("emails").update({"is_notified": True}).in_("id", email_ids).execute()
+        storage.mark_notified(email_ids)
         print(f"   💾 DB Updated: {len(email_ids)} email ditandai 'sent'.")
     except Exception as e:
         print(f"   ⚠️ Gagal update DB: {e}")
 
-def send_batched_messages(email_list, title_prefix="REKAP"):
-    BATCH_SIZE = 5
-    total_emails = len(email_list)
-    total_batches = math.ceil(total_emails / BATCH_SIZE)
-    date_str = get_indo_date()
+# Detik dari email masuk DB (created_at) sampai URGENT-nya terkirim, untuk laporan run
+urgent_latencies = []
 
-    print(f"   📦 Mengirim {total_emails} email dalam {total_batches} batch...")
+def record_urgent_latency(email_list, sent_ids):
+    now = datetime.now(timezone.utc)
+    sent_ids = set(sent_ids)
+    for email in email_list:
+        if email.get("category") != "URGENT" or email['id'] not in sent_ids:
+            continue
+        created = parse_time(email.get("created_at"))
+        if created:
+            seconds = max((now - created).total_seconds(), 0.0)
+            urgent_latencies.append(seconds)
+            registry.observe("urgent_notify_seconds", seconds)
 
-    final_summary_msg = f"📋 **DAFTAR JUDUL & DEADLINE**\n📅 {date_str}\n"
-    final_summary_msg += "----------------------------\n"
+def urgent_latency_median():
+    return round(statistics.median(urgent_latencies), 2) if urgent_latencies else None
 
-    for i in range(0, total_emails, BATCH_SIZE):
-        batch = email_list[i : i + BATCH_SIZE]
-        current_batch_num = (i // BATCH_SIZE) + 1
-        
-        # Menambahkan Tanggal di bawah Judul
-        message_text = f"📢 **{title_prefix} (Bagian {current_batch_num}/{total_batches})**\n"
-        message_text += f"🗓️ {date_str}\n\n"
-        
-        batch_ids = []
+def line_length(text):
+    """Panjang teks versi LINE (UTF-16): emoji di luar BMP dihitung 2 karakter."""
+    return len(text.encode("utf-16-le")) // 2
 
-        for idx, email in enumerate(batch, 1):
-            real_number = i + idx
-            
-            icon = "🎁" if email['category'] == 'BENEFIT' else "📌"
-            if email['category'] == 'URGENT': icon = "🚨"
+def truncate_line(text, limit):
+    if line_length(text) <= limit:
+        return text
+    # Potong bertahap (1 karakter bisa bernilai 2 unit UTF-16), sisakan 1 unit untuk "…"
+    while line_length(text) > limit - 1:
+        text = text[: len(text) - max(1, (line_length(text) - limit + 2) // 2)]
+    return text + "…"
 
-            actions = email.get('action_items')
-            saran_text = "-"
-            if actions and isinstance(actions, list) and len(actions) > 0:
-                saran_text = actions[0]
-            
-            # Format Pesan
-            message_text += f"{real_number}. {icon} **{email['subject'][:40]}...**\n"
-            message_text += f"   📝 {email.get('summary_text', '-')}\n"
-            message_text += f"   👉 **Saran:** {saran_text}\n\n"
-            
-            # Pesan Terakhir
-            final_summary_msg += f"{real_number}. {email['subject'][:50]}\n"
-            if email.get('deadline_date'):
-                final_summary_msg += f"   📅 Deadline: {email['deadline_date']}\n"
-            
-            batch_ids.append(email['id'])
+def pack_entries(entries, header_budget):
+    """
+    Susun entry (teks, email_id) ke balon sebanyak mungkin tanpa melewati LINE_TEXT_LIMIT.
+    Return list balon, tiap balon = list entry.
+    """
+    budget = LINE_TEXT_LIMIT - header_budget
+    bubbles, current, used = [], [], 0
+    for text, email_id in entries:
+        text = truncate_line(text, budget)
+        size = line_length(text)
+        if current and used + size > budget:
+            bubbles.append(current)
+            current, used = [], 0
+        current.append((text, email_id))
+        used += size
+    if current:
+        bubbles.append(current)
+    return bubbles
+
+def format_email_entry(number, email):
+    icon = "🎁" if email['category'] == 'BENEFIT' else "📌"
+    if email['category'] == 'URGENT': icon = "🚨"
+
+    actions = email.get('action_items')
+    saran_text = "-"
+    if actions and isinstance(actions, list) and len(actions) > 0:
+        saran_text = actions[0]
+
+    text = f"{number}. {icon} **{email['subject'][:40]}...**\n"
+    text += f"   📝 {email.get('summary_text', '-')}\n"
+    text += f"   👉 **Saran:** {saran_text}\n\n"
+    return text
+
+def format_summary_entry(number, email):
+    text = f"{number}. {email['subject'][:50]}\n"
+    if email.get('deadline_date'):
+        text += f"   📅 Deadline: {email['deadline_date']}\n"
+    return text
+
+def render_bubbles(email_list, title_prefix="REKAP"):
+    """
+    Susun daftar email + ringkasan akhir jadi balon LINE (dipadatkan sesuai batas karakter).
+    Return list (teks_balon, [email_id di balon itu]).
+    """
+    date_str = get_indo_date()
+
+    # Header tiap balon dirender setelah packing (total bagian baru diketahui setelahnya)
+    header_template = f"📢 **{title_prefix} (Bagian {{}}/{{}})**\n🗓️ {date_str}\n\n"
+    detail_bubbles = pack_entries(
+        [(format_email_entry(n, email), email['id']) for n, email in enumerate(email_list, 1)],
+        header_budget=line_length(header_template.format(999, 999)),
+    )
+    total_parts = len(detail_bubbles)
+    bubbles = [
+        (header_template.format(part, total_parts) + "".join(text for text, _ in entries),
+         [email_id for _, email_id in entries])
+        for part, entries in enumerate(detail_bubbles, 1)
+    ]
+
+    summary_header = f"📋 **DAFTAR JUDUL & DEADLINE**\n📅 {date_str}\n----------------------------\n"
+    summary_footer = "\n---------------------------- 🔥"
+    summary_bubbles = pack_entries(
+        [(format_summary_entry(n, email), None) for n, email in enumerate(email_list, 1)],
+        header_budget=line_length(summary_header + summary_footer),
+    )
+    bubbles += [
+        (summary_header + "".join(text for text, _ in entries) + summary_footer, [])
+        for entries in summary_bubbles
+    ]
+    return bubbles
+
+def send_batched_messages(email_list, title_prefix="REKAP"):
+    """
+    Mode 1 penerima: kirim ke LINE_USER_ID, maks 5 balon per push.
+    Email ditandai is_notified sekali di akhir (hanya yang push-nya berhasil). Return list id terkirim.
+    """
+    bubbles = render_bubbles(email_list, title_prefix)
+    size = delivery.MAX_MESSAGES_PER_PUSH
+    pushes = [bubbles[i : i + size] for i in range(0, len(bubbles), size)]
+    print(f"   📦 Mengirim {len(email_list)} email dalam {len(bubbles)} balon / {len(pushes)} push...")
 
-        try:
-            line_bot_api.push_message(LINE_USER_ID, TextSendMessage(text=message_text))
-            print(f"   ✅ Batch {current_batch_num} terkirim.")
-            mark_as_notified(batch_ids)
-            time.sleep(1) 
-        except LineBotApiError as e:
-            print(f"   ❌ Gagal kirim Batch {current_batch_num}: {e}")
+    sent_ids = []
+    for number, push in enumerate(pushes, 1):
+        messages = [TextSendMessage(text=text) for text, _ in push]
+        # 1 retry_key per set balon, dipakai ulang tiap percobaan -> LINE tidak mengirim dobel
+        retry_key = str(uuid.uuid4())
+        if delivery.send_with_retry(lambda: line_bot_api.push_message(LINE_USER_ID, messages, retry_key=retry_key)):
+            print(f"   ✅ Push {number}/{len(pushes)} terkirim ({len(push)} balon).")
+            sent_ids.extend(email_id for _, ids in push for email_id in ids)
+        else:
+            print(f"   ❌ Push {number}/{len(pushes)} gagal, email di dalamnya dicoba lagi run berikutnya.")
+
+    mark_as_notified(sent_ids)
+    return sent_ids
 
-    # Kirim Pesan Terakhir
+def get_subscribers():
     try:
-        final_summary_msg += "\n---------------------------- 🔥"
-        line_bot_api.push_message(LINE_USER_ID, TextSendMessage(text=final_summary_msg))
-        print("   ✅ Pesan Ringkasan Akhir terkirim.")
-    except LineBotApiError as e:
-        print(f"   ❌ Gagal kirim Ringkasan Akhir: {e}")
+        return storage.active_subscribers()
+    except Exception as e:
+        print(f"   ⚠️ Gagal baca tabel subscribers, pakai LINE_USER_ID: {e}")
+        return []
+
+def notify_emails(email_list, title_prefix="REKAP", subscribers=None):
+    """
+    Kirim email ke semua subscriber yang cocok (fan-out), atau ke LINE_USER_ID kalau belum ada subscriber.
+    Return list id email yang terkirim.
+    """
+    if subscribers is None:
+        subscribers = get_subscribers()
+    if not subscribers:
+        if not LINE_USER_ID:
+            print("   ❌ Tidak ada subscriber dan LINE_USER_ID kosong, notifikasi dilewati.")
+            return []
+        with registry.timer("notify", mode="single"):
+            sent_ids = send_batched_messages(email_list, title_prefix)
+        record_urgent_latency(email_list, sent_ids)
+        return sent_ids
+
+    with registry.timer("notify", mode="fanout"):
+        sent_ids = delivery.fan_out(
+            storage, line_bot_api, subscribers, email_list,
+            render_fn=lambda emails: render_bubbles(emails, title_prefix),
+        )
+    # is_notified tetap diisi (= sudah terkirim ke minimal 1 subscriber) untuk kompatibilitas
+    sent_ids = [email['id'] for email in email_list if email['id'] in sent_ids]
+    mark_as_notified(sent_ids)
+    record_urgent_latency(email_list, sent_ids)
+    return sent_ids
+
+def fetch_candidates(categories, subscribers, order_by="received_at"):
+    """
+    Email yang perlu dikirim. Mode 1 penerima: is_notified=False.
+    Mode subscriber: semua email DELIVERY_LOOKBACK_DAYS terakhir (filter per subscriber di delivery).
+    """
+    if subscribers:
+        since = (datetime.now() - timedelta(days=DELIVERY_LOOKBACK_DAYS)).isoformat()
+        return storage.recent_by_category(categories, since=since, order_by=order_by)
+    return storage.recent_by_category(categories, unnotified_only=True, order_by=order_by)
 
 def process_notifications():
     print("📢 Memulai Script Notifikasi...")
     today_date = datetime.now().day
+    subscribers = get_subscribers()
+    if subscribers:
+        print(f"👥 Mode subscriber: {len(subscribers)} penerima aktif.")
 
     # 1. HANDLING URGENT (Selalu dicek tiap hari)
-    urgents = supabase.table("emails") \
-        .select("*") \
-        .eq("category", "URGENT") \
-        .eq("is_notified", False) \
-        .execute().data
+    urgents = fetch_candidates(["URGENT"], subscribers)
 
     if urgents:
         print(f"\n🚨 Ditemukan {len(urgents)} URGENT!")
-        send_batched_messages(urgents, title_prefix="PERINGATAN URGENT")
+        notify_emails(urgents, title_prefix="PERINGATAN URGENT", subscribers=subscribers)
     else:
         print("\n✅ Tidak ada info urgent baru.")
 
@@ -132,15 +249,18 @@ def process_notifications():
         else:
             print(f"\n🎁 Hari ini tanggal {today_date} (Jadwal Rekap).")
         
-        recaps = supabase.table("emails") \
-            .select("*") \
-            .in_("category", ["BENEFIT", "TASK"]) \
-            .eq("is_notified", False) \
-            .order("priority_score", desc=True) \
-            .execute().data
+        recaps = fetch_candidates(["BENEFIT", "TASK"], subscribers, order_by="priority_score")
             
         if recaps:
-            send_batched_messages(recaps, title_prefix="REKAP INFO KAMPUS")
+            # 1 thread pengumuman (recruitment, perpanjangan, reminder) cukup dikirim yang terbaru;
+            # email lama di thread itu ditandai terkirim HANYA kalau email terbarunya benar-benar
+            # terkirim (push gagal -> semuanya tetap menunggu rekap berikutnya)
+            threads, superseded = latest_per_thread(recaps)
+            if superseded:
+                print(f"   🔗 {len(superseded)} email digabung ke thread yang lebih baru.")
+            sent_ids = set(notify_emails([email for email, _ in threads], title_prefix="REKAP INFO KAMPUS",
+                                         subscribers=subscribers))
+            mark_as_notified([old['id'] for old, newest in superseded if newest['id'] in sent_ids])
         else:
             print("   💤 Database kosong atau semua email sudah pernah dikirim (is_notified=True).")
             print("   💡 Tips: Set 'is_notified' jadi FALSE di Supabase kalau mau test kirim ulang.")
@@ -148,5 +268,9 @@ def process_notifications():
         print(f"\n🗓️ Hari ini tgl {today_date}. Bukan jadwal rekap (Tunggu tgl 5/10/15/..).")
         print("   Info BENEFIT/TASK disimpan di database dulu.")
 
+    if urgent_latencies:
+        print(f"\n⏱️ Median ingest -> notifikasi URGENT: {urgent_latency_median()} detik ({len(urgent_latencies)} email).")
+
 if __name__ == "__main__":
     process_notifications()
+    registry.write_run_report("notify", extra={"urgent_notify_median_seconds": urgent_latency_median()})
@@ -0,0 +1,254 @@
+import os
+import time
+import argparse
+import queue
+import threading
+from datetime import date, timedelta
+from imap_tools import MailMessageFlags
+
+# Satu proses untuk ingest -> AI -> notify: SDK cukup di-import sekali dan
+# semua modul memakai client yang sama (clients.get_storage / get_line_bot_api).
+import imap_sync
+import ingest
+import process
+import notify
+import urgency
+from metrics import registry, run_profiled, profile_thread
+
+# --- KONFIGURASI PIPELINE ---
+# Email mengalir per potongan kecil lewat antrian berukuran terbatas, jadi AI sudah mulai
+# bekerja saat IMAP masih download, dan URGENT terkirim sebelum seluruh inbox selesai.
+PIPELINE_CHUNK_SIZE = int(os.getenv("PIPELINE_CHUNK_SIZE", "25"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+BACKLOG_POLL_SECONDS = 0.5   # Selama antrian kosong, AI mengerjakan backlog PENDING_AI lama
+# Email tersimpan yang menunggu AI ditampung di heap urgensi (bukan FIFO) sampai batas ini;
+# lewat dari itu stage store kena backpressure seperti biasa
+PRIORITY_BUFFER_SIZE = PIPELINE_CHUNK_SIZE * PIPELINE_QUEUE_SIZE
+
+_DONE = object()   # Penanda akhir stream
+
+
+class StageTimer:
+    """Catat waktu sibuk tiap stage (bukan waktu menunggu antrian)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.busy = {}
+
+    def track(self, stage, started):
+        elapsed = time.monotonic() - started
+        with self.lock:
+            self.busy[stage] = self.busy.get(stage, 0.0) + elapsed
+        registry.observe("stage_seconds", elapsed, stage=f"pipeline_{stage}")
+
+    def report(self, wall):
+        print("\n⏱️ Waktu sibuk per stage:")
+        for stage, seconds in self.busy.items():
+            print(f"   - {stage:<9}: {seconds:.1f} detik")
+        print(f"   Total wall-clock {wall:.1f} detik (jumlah semua stage {sum(self.busy.values()):.1f} detik)")
+
+
+class Channel:
+    """Antrian terbatas antar stage. Kalau stage penerima berhenti, pengirim tidak ikut macet."""
+
+    def __init__(self, size=PIPELINE_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=size)
+        self.closed = threading.Event()
+
+    def put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+
+def _run_stage(name, fn, inbox, outbox, errors):
+    """
+    Jalankan 1 stage di thread sendiri. Saat selesai (atau error) inbox ditutup supaya
+    stage sebelumnya berhenti mengirim, dan outbox diberi penanda akhir untuk stage berikutnya.
+    """
+    def target():
+        try:
+            fn()
+        except Exception as e:
+            print(f"❌ Stage {name} error: {e}")
+            errors.append((name, e))
+        finally:
+            if inbox is not None:
+                inbox.closed.set()
+            if outbox is not None:
+                outbox.put(_DONE)
+    thread = threading.Thread(target=profile_thread(target, name), name=f"pipeline-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def run_pipeline():
+    print("🚀 Pipeline: IMAP -> bersihkan & simpan -> AI -> notifikasi")
+    started = time.monotonic()
+    start_date = date.today() - timedelta(days=ingest.DAYS_BACK)
+    timer = StageTimer()
+    errors = []
+    fetched = Channel()      # (msg, text, html) per potongan
+    stored = Channel()       # Baris baru di DB (PENDING_AI)
+    classified = Channel()   # Baris yang sudah diklasifikasi
+    totals = {"spam": 0, "dup": 0, "inserted": 0, "failed": 0, "claimed": 0, "saved": 0}
+    sync = {"state": None, "complete": False}
+
+    # --- STAGE 1: IMAP FETCH ---
+    def fetch_stage():
+        with ingest.open_mailbox() as mailbox:
+            t = time.monotonic()
+            if ingest.INGEST_MODE == "window":
+                candidates, spam, _ = ingest.fetch_window(mailbox, start_date)
+                totals["spam"] += spam
+                timer.track("fetch", t)
+                for i in range(0, len(candidates), PIPELINE_CHUNK_SIZE):
+                    if not fetched.put(candidates[i : i + PIPELINE_CHUNK_SIZE]):
+                        return
+                return
+
+            uids, cursor = ingest.list_new_uids(mailbox, start_date)
+            timer.track("fetch", t)
+            print(f"   📨 {len(uids)} email baru di IMAP.")
+            for i in range(0, len(uids), PIPELINE_CHUNK_SIZE):
+                t = time.monotonic()
+                chunk = uids[i : i + PIPELINE_CHUNK_SIZE]
+                candidates, spam = ingest.fetch_uid_chunk(mailbox, chunk)
+                mailbox.flag(chunk, MailMessageFlags.SEEN, True)
+                totals["spam"] += spam
+                timer.track("fetch", t)
+                if candidates and not fetched.put(candidates):
+                    return
+            sync["state"] = ingest.advance_state(cursor, uids)
+            sync["complete"] = True
+
+    # --- STAGE 2: BERSIHKAN + SIMPAN ---
+    def store_stage():
+        while True:
+            candidates = fetched.get()
+            if candidates is _DONE:
+                return
+            t = time.monotonic()
+            # Baris baru langsung di-lease atas nama pipeline supaya worker process.py lain tidak ikut klaim
+            inserted, dup, failed = ingest.store_candidates(candidates, extra_fields=process.lease_fields())
+            totals["inserted"] += len(inserted)
+            totals["dup"] += dup
+            totals["failed"] += failed
+            timer.track("store", t)
+            if inserted and not stored.put(inserted):
+                return
+
+    # --- STAGE 3: KLASIFIKASI AI ---
+    def classify(rows):
+        t = time.monotonic()
+        saved = process.classify_emails(rows)
+        totals["claimed"] += len(rows)
+        totals["saved"] += len(saved)
+        timer.track("ai", t)
+        return classified.put(saved) if saved else True
+
+    def ai_stage():
+        pending = urgency.UrgencyQueue()
+        backlog_open = True
+        stream_open = True
+        while stream_open or pending:
+            # Pindahkan potongan yang sudah tersimpan ke heap; hanya menunggu kalau heap kosong
+            while stream_open and len(pending) < PRIORITY_BUFFER_SIZE:
+                timeout = 0 if pending else (BACKLOG_POLL_SECONDS if backlog_open else None)
+                try:
+                    rows = stored.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if rows is _DONE:
+                    stream_open = False
+                else:
+                    pending.push(rows)
+            if pending:
+                # Paling mendesak dulu (URGENT kandidat tidak antre di belakang newsletter)
+                if not classify(pending.pop(PIPELINE_CHUNK_SIZE)):
+                    return
+            elif stream_open and backlog_open:
+                # Menunggu IMAP: sambil kerjakan email PENDING_AI dari run sebelumnya
+                backlog = process.claim_pending_emails(PIPELINE_CHUNK_SIZE)
+                if not backlog:
+                    backlog_open = False
+                elif not classify(backlog):
+                    return
+        while backlog_open:
+            backlog = process.claim_pending_emails(PIPELINE_CHUNK_SIZE)
+            if not backlog or not classify(backlog):
+                break
+
+    # --- STAGE 4: NOTIFIKASI ---
+    def notify_stage():
+        while True:
+            saved = classified.get()
+            if saved is _DONE:
+                break
+            urgents = [email for email in saved if email.get("category") == "URGENT"]
+            if urgents:
+                t = time.monotonic()
+                print(f"🚨 {len(urgents)} URGENT, kirim ke LINE sekarang!")
+                notify.notify_emails(urgents, title_prefix="PERINGATAN URGENT")
+                timer.track("notify", t)
+        # Sisa URGENT yang belum terkirim + rekap BENEFIT/TASK (sesuai jadwal)
+        t = time.monotonic()
+        notify.process_notifications()
+        timer.track("notify", t)
+
+    threads = [
+        _run_stage("fetch", fetch_stage, None, fetched, errors),
+        _run_stage("store", store_stage, fetched, stored, errors),
+        _run_stage("ai", ai_stage, stored, classified, errors),
+        _run_stage("notify", notify_stage, classified, None, errors),
+    ]
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        print("\n👋 Pipeline dihentikan.")
+        return
+
+    # High-water mark hanya maju kalau semua UID terambil dan semua email baru aman di DB
+    if sync["complete"] and sync["state"] is not None and totals["failed"] == 0:
+        imap_sync.save_state(sync["state"])
+
+    wall = time.monotonic() - started
+    print("\n" + "=" * 30)
+    print("📊 Laporan Pipeline:")
+    print(f"   - Masuk DB (Bersih) : {totals['inserted']}")
+    print(f"   - Dibuang (Spam)    : {totals['spam']}")
+    print(f"   - Dibuang (Duplikat): {totals['dup']}")
+    print(f"   - Gagal simpan      : {totals['failed']}")
+    print("=" * 30)
+    ingest.compaction_stats.report("Kompaksi body (ingest)")
+    if totals["claimed"]:
+        process.report_run(totals["saved"], totals["claimed"], wall)
+    timer.report(wall)
+    registry.write_run_report("pipeline", extra={
+        **totals,
+        "urgent_notify_median_seconds": notify.urgent_latency_median(),
+        "llm_requests_saved": process.ai_schema.stats.net_saved(),
+        "stage_busy_seconds": {stage: round(seconds, 3) for stage, seconds in timer.busy.items()},
+        "errors": [f"{name}: {e}" for name, e in errors],
+    })
+    if errors:
+        raise SystemExit(f"Pipeline selesai dengan error di stage: {', '.join(name for name, _ in errors)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest -> AI -> notify dalam 1 proses.")
+    parser.add_argument("--profile", action="store_true", help="Jalankan di bawah cProfile")
+    args = parser.parse_args()
+    if args.profile:
+        run_profiled(run_pipeline)
+    else:
+        run_pipeline()
@@ -0,0 +1,227 @@
+import os
+import re
+import sys
+import zlib
+import numpy as np
+
+# --- KONFIGURASI PRE-CLASSIFIER ---
+# Model lokal (TF-IDF hashed + Naive Bayes) yang dilatih dari label AI di tabel emails.
+# Email yang diprediksi dengan sangat yakin langsung diberi label tanpa panggil Gemini.
+MODEL_PATH = os.getenv("PRECLASSIFIER_PATH", "preclassifier_model.npz")
+CONFIDENCE_THRESHOLD = float(os.getenv("PRECLASSIFIER_THRESHOLD", "0.97"))
+# Kategori yang boleh diputuskan lokal. Default hanya NOISE, karena hasil lokal
+# tidak punya summary/deadline seperti hasil AI.
+AUTO_CATEGORIES = [
+    c.strip().upper() for c in os.getenv("PRECLASSIFIER_CATEGORIES", "NOISE").split(",") if c.strip()
+]
+TRAIN_CATEGORIES = ["URGENT", "BENEFIT", "TASK", "NOISE"]
+# Hanya label dari Gemini yang dipakai training (kolom label_source diisi process.py).
+# Hasil cache / pre-classifier sendiri tidak ikut, supaya model tidak belajar dari tebakannya sendiri.
+TRAIN_LABEL_SOURCE = "llm"
+MIN_TRAINING_ROWS = 50
+HOLDOUT_RATIO = 0.2
+
+HASH_BITS = 18
+N_FEATURES = 1 << HASH_BITS
+NB_ALPHA = 0.1
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+# =========================================================
+# FITUR (HASHED TF-IDF)
+# =========================================================
+
+def _tokens(sender, subject, body_text):
+    """Token dengan prefix per field: domain pengirim, kata subjek, kata body."""
+    tokens = []
+    domain = re.search(r"@([\w.-]+)", sender or "")
+    if domain:
+        tokens.append("d:" + domain.group(1).lower())
+    tokens.extend("s:" + w for w in WORD_PATTERN.findall((subject or "").lower()))
+    tokens.extend("b:" + w for w in WORD_PATTERN.findall((body_text or "").lower()))
+    return tokens
+
+
+def _hashed_counts(tokens):
+    """Return (indices, counts) unik. zlib.crc32 dipakai karena hash() Python di-salt per proses."""
+    if not tokens:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    idx = np.fromiter(
+        (zlib.crc32(t.encode("utf-8")) & (N_FEATURES - 1) for t in tokens),
+        dtype=np.int64,
+        count=len(tokens),
+    )
+    unique, counts = np.unique(idx, return_counts=True)
+    return unique, counts.astype(np.float32)
+
+
+def _tfidf(indices, counts, idf):
+    values = (1.0 + np.log(counts)) * idf[indices]
+    norm = np.linalg.norm(values)
+    if norm > 0:
+        values /= norm
+    return values
+
+
+# =========================================================
+# MODEL
+# =========================================================
+
+class PreClassifier:
+    def __init__(self, classes, log_prior, log_theta, idf):
+        self.classes = list(classes)
+        self.log_prior = log_prior
+        self.log_theta = log_theta
+        self.idf = idf
+
+        # Statistik per run
+        self.checked = 0
+        self.skipped = 0
+
+    @classmethod
+    def train(cls, docs, labels):
+        """docs = list (sender, subject, body_text), labels = list kategori."""
+        classes = sorted(set(labels))
+        features = [_hashed_counts(_tokens(*doc)) for doc in docs]
+
+        # IDF dari document frequency
+        df = np.zeros(N_FEATURES, dtype=np.float32)
+        for indices, _ in features:
+            df[indices] += 1
+        n_docs = len(docs)
+        idf = (np.log((n_docs + 1) / (df + 1)) + 1.0).astype(np.float32)
+
+        # Multinomial Naive Bayes di atas bobot TF-IDF
+        feature_sums = np.zeros((len(classes), N_FEATURES), dtype=np.float32)
+        class_counts = np.zeros(len(classes), dtype=np.float32)
+        for (indices, counts), label in zip(features, labels):
+            c = classes.index(label)
+            feature_sums[c, indices] += _tfidf(indices, counts, idf)
+            class_counts[c] += 1
+
+        smoothed = feature_sums + NB_ALPHA
+        log_theta = np.log(smoothed / smoothed.sum(axis=1, keepdims=True)).astype(np.float32)
+        log_prior = np.log(class_counts / class_counts.sum()).astype(np.float32)
+        return cls(classes, log_prior, log_theta, idf)
+
+    def predict(self, sender, subject, body_text):
+        """Return (kategori, confidence 0-1)."""
+        indices, counts = _hashed_counts(_tokens(sender, subject, body_text))
+        if len(indices) == 0:
+            return None, 0.0
+        values = _tfidf(indices, counts, self.idf)
+        scores = self.log_prior + self.log_theta[:, indices] @ values
+        probs = np.exp(scores - scores.max())
+        probs /= probs.sum()
+        best = int(np.argmax(probs))
+        return self.classes[best], float(probs[best])
+
+    def settle(self, email):
+        """
+        Coba putuskan email secara lokal. Return hasil ala ask_ai_json kalau
+        yakin (>= CONFIDENCE_THRESHOLD) dan kategorinya boleh diputuskan lokal, selain itu None.
+        """
+        self.checked += 1
+        category, confidence = self.predict(email['sender'], email['subject'], email['body_snippet'])
+        if category not in AUTO_CATEGORIES or confidence < CONFIDENCE_THRESHOLD:
+            return None
+        self.skipped += 1
+        # Tanpa LLM tidak ada ringkasan; subjek dipakai (potongan body mentah tampil aneh di chatbot)
+        return {
+            "category": category,
+            "deadline_date": None,
+            "priority_score": 1,
+            "summary_text": email.get('subject') or "-",
+            "action_items": ["Abaikan"] if category == "NOISE" else [],
+        }
+
+    def save(self, path=MODEL_PATH):
+        np.savez_compressed(
+            path,
+            classes=np.array(self.classes),
+            log_prior=self.log_prior,
+            log_theta=self.log_theta,
+            idf=self.idf,
+        )
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        """Return model yang tersimpan, None kalau belum pernah di-train."""
+        if not os.path.exists(path):
+            return None
+        data = np.load(path)
+        return cls(data["classes"].tolist(), data["log_prior"], data["log_theta"], data["idf"])
+
+    def report(self):
+        print("\n🧮 Pre-classifier lokal:")
+        print(f"   - Dicek             : {self.checked}")
+        print(f"   - Skip LLM (yakin)  : {self.skipped}")
+
+
+# =========================================================
+# TRAINING DARI DATABASE
+# =========================================================
+
+def fetch_training_rows(storage, page_size=1000):
+    """Ambil semua email yang labelnya dari LLM (paginasi pakai limit/offset)."""
+    rows = []
+    start = 0
+    while True:
+        page = storage.recent_by_category(
+            TRAIN_CATEGORIES, label_source=TRAIN_LABEL_SOURCE, desc=False, limit=page_size, offset=start,
+            columns="sender, subject, body_snippet, category",
+        )
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
+
+def evaluate(model, docs, labels):
+    """Cek seberapa sering model lokal setuju dengan label LLM di data held-out."""
+    agree = 0
+    confident = 0
+    confident_agree = 0
+    for doc, label in zip(docs, labels):
+        predicted, confidence = model.predict(*doc)
+        agree += predicted == label
+        if predicted in AUTO_CATEGORIES and confidence >= CONFIDENCE_THRESHOLD:
+            confident += 1
+            confident_agree += predicted == label
+    total = max(len(docs), 1)
+    print(f"   - Held-out          : {len(docs)} email")
+    print(f"   - Setuju dgn LLM    : {agree / total * 100:.1f}% (semua prediksi)")
+    print(f"   - Coverage skip LLM : {confident / total * 100:.1f}% (>= {CONFIDENCE_THRESHOLD})")
+    if confident:
+        print(f"   - Akurasi saat skip : {confident_agree / confident * 100:.1f}%")
+
+
+def retrain():
+    from clients import get_storage
+
+    print("🧮 Training pre-classifier dari label AI di database...")
+    rows = fetch_training_rows(get_storage())
+    if len(rows) < MIN_TRAINING_ROWS:
+        print(f"⚠️ Data berlabel baru {len(rows)} email (min {MIN_TRAINING_ROWS}). Training dibatalkan.")
+        return
+
+    docs = [(r.get("sender"), r.get("subject"), r.get("body_snippet")) for r in rows]
+    labels = [r["category"] for r in rows]
+
+    # Split held-out deterministik untuk evaluasi
+    order = np.random.default_rng(42).permutation(len(rows))
+    n_holdout = max(1, int(len(rows) * HOLDOUT_RATIO))
+    holdout, train_idx = order[:n_holdout], order[n_holdout:]
+    model = PreClassifier.train([docs[i] for i in train_idx], [labels[i] for i in train_idx])
+    evaluate(model, [docs[i] for i in holdout], [labels[i] for i in holdout])
+
+    # Model final dilatih ulang dengan semua data
+    PreClassifier.train(docs, labels).save()
+    print(f"✅ Model disimpan ke {MODEL_PATH} ({len(rows)} email).")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "train":
+        retrain()
+    else:
+        print("Pemakaian: python preclassifier.py train")
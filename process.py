@@ -1,79 +1,257 @@
 import os
 import time
+import uuid
+import socket
+import argparse
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from ai_engine import ask_ai_json
+from ai_engine import ask_ai_json, ask_ai_json_batch, BATCH_MAX_ITEMS
+from rate_limiter import scheduler
+from circuit_breaker import breaker
+from ai_cache import AICache
+from preclassifier import PreClassifier
+import compaction
+import ai_schema
+import urgency
+from clients import get_storage
+from storage import STORAGE_BACKEND
+from reply_cache import bump_version
+from metrics import registry, run_profiled
 
 # Setup
 load_dotenv()
 url = os.getenv("SUPABASE_URL")
 key = os.getenv("SUPABASE_KEY")
 
-if not url or not key:
+if STORAGE_BACKEND == "supabase" and (not url or not key):
     print("❌ Error: Kunci Supabase hilang.")
     exit()
 
-supabase: Client = create_client(url, key)
+storage = get_storage()
+ai_cache = AICache()
+preclassifier = PreClassifier.load()  # None kalau belum pernah `python preclassifier.py train`
 
-def process_pending_emails():
-    print("🤖 Memulai AI Processing...")
+# Jumlah worker AI paralel. Kecepatan sebenarnya tetap diatur rate limiter per model,
+# jadi worker tambahan hanya mengisi sisa kuota (tidak akan melewati RPM/TPM).
+AI_WORKERS = int(os.getenv("AI_WORKERS", "4"))
+
+# Mode batch (default): 1 request AI untuk banyak email. Set AI_BATCH_MODE=0 untuk mode lama.
+AI_BATCH_MODE = os.getenv("AI_BATCH_MODE", "1") != "0"
+PROCESS_LIMIT = int(os.getenv("PROCESS_LIMIT", "60"))
+
+# --- LEASE (KLAIM ANTRIAN) ---
+# Tiap worker mengklaim N email secara atomik (storage.claim_pending; di Supabase lewat fungsi SQL claim_pending_emails).
+# Email yang diklaim tidak akan diambil worker lain sampai lease habis, jadi
+# kalau worker crash, email otomatis bisa diklaim ulang setelah LEASE_SECONDS.
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "900"))
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def lease_fields():
+    """Kolom lease untuk email yang langsung dimiliki worker ini (dipakai daemon saat insert)."""
+    expires = datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS)
+    return {"processing_by": WORKER_ID, "lease_expires_at": expires.isoformat()}
+
+def claim_pending_emails(limit):
+    """
+    Klaim atomik max `limit` email PENDING_AI yang belum di-lease (atau lease-nya kedaluwarsa).
+    Yang diklaim duluan = queue_at paling awal (urgensi lokal + aging, lihat urgency.py).
+    """
+    return urgency.by_urgency(storage.claim_pending(WORKER_ID, limit, LEASE_SECONDS))
+
+def process_single_email(email):
+    """Klasifikasi 1 email lalu update DB. Return list email yang sukses (0/1 item)."""
+    label = email['subject'][:40]
+
+    # Panggil AI
+    ai_result = ask_ai_json(
+        sender=email['sender'], 
+        subject=email['subject'], 
+        body_text=email['body_snippet']
+    )
     
-    # Ambil 10 email antrian
-    response = supabase.table("emails") \
-        .select("*") \
-        .eq("category", "PENDING_AI") \
-        .limit(10) \
-        .execute()
+    # Cek jika result kosong/error/limit habis
+    if not ai_result or ai_result.get("category") == "ERROR":
+        print(f"   ⚠️ Skip dulu (Error AI): {label}...")
+        return []
+
+    ai_cache.store(email['sender'], email['subject'], email['body_snippet'], ai_result)
+    saved = save_ai_result(email, ai_result, source="llm")
+    return [saved] if saved else []
+
+def save_ai_result(email, ai_result, source):
+    """
+    Simpan hasil AI ke DB. `source` = asal label ("llm", "cache", "local"), disimpan di
+    label_source supaya pre-classifier hanya dilatih dari label LLM.
+    Return dict email yang sudah ter-update, None kalau gagal.
+    """
+    print(f"\n⚙️ {email['subject'][:40]}...")
+    print(f"   🏷️ Kategori: {ai_result.get('category')}")
+    print(f"   📝 Summary : {ai_result.get('summary_text')}")
     
-    emails_to_process = response.data
+    # Update Database
+    update_data = {
+        "category": ai_result.get("category", "Uncategorized"),
+        "deadline_date": ai_result.get("deadline_date"),
+        "priority_score": ai_result.get("priority_score", 1),
+        "summary_text": ai_result.get("summary_text", "-"),
+        "action_items": ai_result.get("action_items", []),
+        "label_source": source,
+        # Dipakai app.py untuk sync index pencarian (email yang diklasifikasi terlambat tetap masuk)
+        "classified_at": datetime.now(timezone.utc).isoformat(),
+        # Lease dilepas setelah hasil tersimpan
+        "processing_by": None,
+        "lease_expires_at": None
+    }
     
-    if not emails_to_process:
-        print("✅ Tidak ada email antrian (Semua sudah bersih).")
-        return
+    try:
+        # Hanya kalau lease masih milik worker ini: kalau sudah kedaluwarsa dan diklaim
+        # worker lain, hasil worker itu yang dipakai (tidak ditimpa hasil yang terlambat)
+        if not storage.update_email(email['id'], update_data, owner=WORKER_ID):
+            print("   ⏭️ Lease sudah diambil worker lain, hasil tidak disimpan.")
+            return None
+        print("   ✅ Database Updated!")
+        return {**email, **update_data}
+    except Exception as e:
+        print(f"   ❌ Gagal Update DB: {e}")
+        return None
+
+def process_email_batch(emails):
+    """Klasifikasi sekelompok email lewat ask_ai_json_batch. Return list email yang sukses."""
+    results = ask_ai_json_batch(emails)
+    saved_emails = []
+    for email in emails:
+        ai_result = results.get(str(email['id']))
+        if not ai_result:
+            print(f"   ⚠️ Skip dulu (Error AI): {email['subject'][:40]}...")
+            continue
+        ai_cache.store(email['sender'], email['subject'], email['body_snippet'], ai_result)
+        saved = save_ai_result(email, ai_result, source="llm")
+        if saved:
+            saved_emails.append(saved)
+    return saved_emails
 
-    print(f"📦 Ditemukan {len(emails_to_process)} email antrian.")
+def classify_emails(emails_to_process):
+    """
+    Klasifikasi + simpan sekumpulan email PENDING_AI (cek cache dulu, sisanya ke AI).
+    Dipakai oleh run harian dan daemon IDLE. Return list email yang sudah ter-update.
+    """
+    with registry.timer("classify"):
+        return _classify_emails(emails_to_process)
 
-    # Loop Processing
+def _classify_emails(emails_to_process):
+    saved_emails = []
+
+    # --- CEK CACHE DULU ---
+    # Email milis yang dikirim ulang (sama persis / hampir sama) pakai hasil AI yang lama
+    need_ai = []
     for email in emails_to_process:
-        print(f"\n⚙️ Memproses: {email['subject'][:40]}...")
-        
-        # Panggil AI
-        ai_result = ask_ai_json(
-            sender=email['sender'], 
-            subject=email['subject'], 
-            body_text=email['body_snippet']
-        )
-        
-        # Cek jika result kosong/error/limit habis
-        if not ai_result or ai_result.get("category") == "ERROR":
-            print("   ⚠️ Skip dulu (Error AI).")
+        cached = ai_cache.lookup(email['sender'], email['subject'], email['body_snippet'])
+        if cached:
+            print(f"   🗃️ Cache hit: {email['subject'][:40]}...")
+            registry.inc("classified_total", source="cache")
+            saved = save_ai_result(email, cached, source="cache")
+            if saved:
+                saved_emails.append(saved)
             continue
 
-        print(f"   🏷️ Kategori: {ai_result.get('category')}")
-        print(f"   📝 Summary : {ai_result.get('summary_text')}")
-        
-        # Update Database
-        update_data = {
-            "category": ai_result.get("category", "Uncategorized"),
-            "deadline_date": ai_result.get("deadline_date"),
-            "priority_score": ai_result.get("priority_score", 1),
-            "summary_text": ai_result.get("summary_text", "-"),
-            "action_items": ai_result.get("action_items", [])
-        }
+        # --- PRE-CLASSIFIER LOKAL ---
+        # Email yang jelas-jelas NOISE tidak perlu dikirim ke Gemini
+        local_result = preclassifier.settle(email) if preclassifier else None
+        if local_result:
+            print(f"   🧮 Lokal ({local_result['category']}): {email['subject'][:40]}...")
+            registry.inc("classified_total", source="preclassifier")
+            saved = save_ai_result(email, local_result, source="local")
+            if saved:
+                saved_emails.append(saved)
+        else:
+            need_ai.append(email)
+
+    if not need_ai:
+        finish_batch(saved_emails)
+        return saved_emails
+
+    registry.inc("classified_total", len(need_ai), source="llm_request")
+    # Batch paling mendesak dikirim ke AI duluan
+    need_ai = urgency.by_urgency(need_ai)
+
+    # --- PROCESSING PARALEL ---
+    # Tidak ada lagi sleep 20 detik: tiap worker menunggu slot kuota dari rate limiter.
+    with ThreadPoolExecutor(max_workers=AI_WORKERS) as pool:
+        if AI_BATCH_MODE:
+            groups = [
+                need_ai[i : i + BATCH_MAX_ITEMS]
+                for i in range(0, len(need_ai), BATCH_MAX_ITEMS)
+            ]
+            for saved in pool.map(process_email_batch, groups):
+                saved_emails.extend(saved)
+        else:
+            for saved in pool.map(process_single_email, need_ai):
+                saved_emails.extend(saved)
+
+    finish_batch(saved_emails)
+    return saved_emails
+
+def finish_batch(saved_emails):
+    """
+    Setelah hasil AI tersimpan: kabari cache chatbot (app.py) bahwa data berubah.
+    app.py lalu sync index pencarian lokalnya sendiri dari DB (lihat search_index.sync_from_db).
+    """
+    if saved_emails:
+        bump_version(storage)
+
+def report_run(processed, total, elapsed):
+    scheduler.report(processed=processed, elapsed=elapsed)
+    breaker.report()
+    breaker.save()
+    ai_cache.evict()
+    ai_cache.report()
+    compaction.stats.report("Kompaksi body (prompt AI)")
+    ai_schema.stats.report()
+    if preclassifier:
+        preclassifier.report()
+    print(f"\n📊 Selesai: {processed}/{total} email terproses.")
+
+def process_pending_emails(drain=False, limit=PROCESS_LIMIT):
+    """
+    Klaim & proses email antrian. drain=True: ulangi terus sampai antrian kosong.
+    Email yang gagal tetap di-lease sampai kedaluwarsa, jadi tidak diklaim ulang
+    berkali-kali dalam 1 run (drain tetap berhenti).
+    """
+    print(f"🤖 Memulai AI Processing (worker {WORKER_ID})...")
+    started = time.monotonic()
+    total_claimed = 0
+    total_saved = 0
+
+    while True:
+        emails_to_process = claim_pending_emails(limit)
         
-        try:
-            supabase.table("emails") \
-                .update(update_data) \
-                .eq("id", email['id']) \
-                .execute()
-            print("   ✅ Database Updated!")
-        except Exception as e:
-            print(f"   ❌ Gagal Update DB: {e}")
-            
-        # --- PENTING: JEDA DIPERLAMBAT ---
-        # Limit Google: 5 Request / Menit = 1 request tiap 12 detik.
-        print("   ⏳ Cooling down 20 detik...")
-        time.sleep(20)
+        if not emails_to_process:
+            if total_claimed == 0:
+                print("✅ Tidak ada email antrian (Semua sudah bersih).")
+            break
+
+        total_claimed += len(emails_to_process)
+        print(f"📦 Klaim {len(emails_to_process)} email antrian ({AI_WORKERS} worker).")
+
+        saved_emails = classify_emails(emails_to_process)
+        total_saved += len(saved_emails)
+
+        if not drain:
+            break
+
+    if total_claimed:
+        report_run(total_saved, total_claimed, time.monotonic() - started)
+    registry.write_run_report("process", extra={"claimed": total_claimed, "saved": total_saved,
+                                                "llm_requests_saved": ai_schema.stats.net_saved()})
 
 if __name__ == "__main__":
-    process_pending_emails()
+    parser = argparse.ArgumentParser(description="Klasifikasi email PENDING_AI dengan AI.")
+    parser.add_argument("--drain", action="store_true", help="Ulangi klaim sampai antrian kosong")
+    parser.add_argument("--limit", type=int, default=PROCESS_LIMIT, help="Jumlah email per klaim")
+    parser.add_argument("--profile", action="store_true", help="Jalankan di bawah cProfile")
+    args = parser.parse_args()
+    if args.profile:
+        run_profiled(lambda: process_pending_emails(drain=args.drain, limit=args.limit))
+    else:
+        process_pending_emails(drain=args.drain, limit=args.limit)
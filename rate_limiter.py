@@ -0,0 +1,263 @@
+import os
+import re
+import time
+import threading
+from collections import deque
+
+# --- KONFIGURASI LIMIT PER MODEL ---
+# rpm = Request per menit, tpm = Token (input) per menit.
+# Angka default mengikuti kuota free tier Google AI Studio.
+# Bisa di-override lewat .env, contoh:
+#   AI_RATE_LIMITS=gemini-2.5-flash:10:250000;gemma-3-27b-it:30:15000
+DEFAULT_LIMITS = {
+    "gemini-2.5-flash": {"rpm": 10, "tpm": 250000},
+    "gemini-2.5-flash-lite": {"rpm": 15, "tpm": 250000},
+    "gemini-3-flash": {"rpm": 5, "tpm": 250000},
+    "gemma-3-27b-it": {"rpm": 30, "tpm": 15000},
+}
+FALLBACK_LIMIT = {"rpm": 5, "tpm": 100000}
+
+BACKOFF_BASE = 5      # Detik, backoff pertama kalau 429 tanpa Retry-After
+BACKOFF_MAX = 300     # Backoff tidak pernah lebih dari 5 menit
+QUOTA_WINDOW = 60.0   # Detik; kuota RPM/TPM dihitung di jendela geser ini
+
+
+def estimate_tokens(text):
+    """Perkiraan kasar jumlah token (±4 karakter per token)."""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def parse_retry_after(error):
+    """Ambil durasi Retry-After (detik) dari exception Gemini, None kalau tidak ada."""
+    # Kalau exception bawa response HTTP, cek header dulu
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    # Format pesan google.api_core: "retry_delay { seconds: 37 }" / "Please retry in 37.5s"
+    message = str(error)
+    match = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", message)
+    if not match:
+        match = re.search(r"retry in ([\d.]+)\s*s", message, re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def is_rate_limit_error(error):
+    return "429" in str(error) or "ResourceExhausted" in type(error).__name__
+
+
+def load_limits():
+    limits = {name: dict(cfg) for name, cfg in DEFAULT_LIMITS.items()}
+    raw = os.getenv("AI_RATE_LIMITS", "")
+    for entry in raw.split(";"):
+        parts = entry.strip().split(":")
+        if len(parts) != 3:
+            continue
+        name, rpm, tpm = parts
+        try:
+            limits[name] = {"rpm": int(rpm), "tpm": int(tpm)}
+        except ValueError:
+            print(f"⚠️ AI_RATE_LIMITS tidak valid: {entry}")
+    return limits
+
+
+class TokenBucket:
+    """Token bucket klasik: kapasitas penuh di awal, terisi ulang secara linear (throttle push LINE)."""
+
+    def __init__(self, capacity, per_seconds=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now <= self.updated:
+            return
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Berapa detik lagi sampai `amount` token tersedia (0 = bisa sekarang)."""
+        self._refill(now)
+        # Request yang lebih besar dari kapasitas tetap boleh jalan kalau bucket penuh
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self):
+        self.tokens = 0.0
+
+
+class SlidingWindow:
+    """
+    Kuota per jendela geser: total pemakaian di QUOTA_WINDOW detik terakhir tidak pernah
+    melebihi `capacity`. Beda dengan token bucket yang mulai penuh, di sini tidak ada
+    "1 bucket penuh + 1 kali isi ulang" di menit pertama (RPM 10 tetap maks 10 per 60 detik).
+    """
+
+    def __init__(self, capacity, window=QUOTA_WINDOW):
+        self.capacity = float(capacity)
+        self.window = window
+        self.entries = deque()  # (waktu, jumlah), urut waktu
+        self.used = 0.0
+
+    def _expire(self, now):
+        while self.entries and self.entries[0][0] <= now - self.window:
+            self.used -= self.entries.popleft()[1]
+
+    def wait_time(self, amount, now):
+        """Berapa detik lagi sampai `amount` muat di jendela (0 = bisa sekarang)."""
+        self._expire(now)
+        # Request yang lebih besar dari kapasitas tetap boleh jalan kalau jendela kosong
+        amount = min(amount, self.capacity)
+        excess = self.used + amount - self.capacity
+        if excess <= 0:
+            return 0.0
+        freed = 0.0
+        for stamp, used in self.entries:
+            freed += used
+            if freed >= excess:
+                return stamp + self.window - now
+        return self.window
+
+    def consume(self, amount, now=None):
+        amount = min(amount, self.capacity)
+        if amount <= 0:
+            return
+        self.entries.append((time.monotonic() if now is None else now, amount))
+        self.used += amount
+
+    def drain(self, now=None):
+        """Anggap kuota jendela ini habis (server sudah membalas 429)."""
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        self.consume(self.capacity - self.used, now)
+
+
+class ModelLimiter:
+    """State rate limit untuk satu model: jendela RPM, jendela TPM, dan backoff 429."""
+
+    def __init__(self, name, rpm, tpm):
+        self.name = name
+        self.requests = SlidingWindow(rpm)
+        self.tokens = SlidingWindow(tpm)
+        self.cooldown_until = 0.0
+        self.strikes = 0
+
+        # Statistik per run
+        self.calls = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.tokens_used = 0
+
+    def wait_time(self, est_tokens, now):
+        wait = max(0.0, self.cooldown_until - now)
+        wait = max(wait, self.requests.wait_time(1, now))
+        wait = max(wait, self.tokens.wait_time(est_tokens, now))
+        return wait
+
+    def consume(self, est_tokens, now=None):
+        self.requests.consume(1, now)
+        self.tokens.consume(est_tokens, now)
+        self.calls += 1
+
+
+class RateLimitScheduler:
+    """
+    Penjadwal kuota untuk semua model di MODELS_TO_TRY.
+    Aman dipakai dari banyak thread worker sekaligus.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = limits or load_limits()
+        self.models = {}
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def _get(self, name):
+        limiter = self.models.get(name)
+        if limiter is None:
+            cfg = self.limits.get(name, FALLBACK_LIMIT)
+            limiter = ModelLimiter(name, cfg["rpm"], cfg["tpm"])
+            self.models[name] = limiter
+        return limiter
+
+    def acquire_any(self, candidates, est_tokens):
+        """
+        Ambil slot dari model pertama (sesuai urutan prioritas) yang kuotanya tersedia.
+        Return (model_name, 0) kalau dapat, atau (None, detik_tunggu_minimum) kalau semua penuh.
+        """
+        with self.lock:
+            now = time.monotonic()
+            min_wait = None
+            for name in candidates:
+                limiter = self._get(name)
+                wait = limiter.wait_time(est_tokens, now)
+                if wait <= 0:
+                    limiter.consume(est_tokens, now)
+                    return name, 0.0
+                if min_wait is None or wait < min_wait:
+                    min_wait = wait
+            return None, (min_wait or 0.0)
+
+    def report_success(self, name, est_tokens, actual_tokens=None):
+        with self.lock:
+            limiter = self._get(name)
+            limiter.successes += 1
+            limiter.strikes = 0
+            used = actual_tokens if actual_tokens else est_tokens
+            limiter.tokens_used += used
+            # Koreksi jendela TPM kalau pemakaian asli lebih besar dari perkiraan
+            if actual_tokens and actual_tokens > est_tokens:
+                limiter.tokens.consume(actual_tokens - est_tokens)
+
+    def report_rate_limited(self, name, retry_after=None):
+        """Dipanggil saat API membalas 429. Model di-cooldown untuk semua worker."""
+        with self.lock:
+            limiter = self._get(name)
+            limiter.rate_limited += 1
+            limiter.strikes += 1
+            if retry_after is None:
+                retry_after = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (limiter.strikes - 1)))
+            limiter.cooldown_until = max(limiter.cooldown_until, time.monotonic() + retry_after)
+            # Server bilang penuh, jadi anggap kuota lokal juga habis
+            limiter.requests.drain()
+            return retry_after
+
+    def report(self, processed=None, elapsed=None):
+        """Print laporan throughput per model untuk run ini."""
+        if elapsed is None:
+            elapsed = time.monotonic() - self.started
+        elapsed = max(elapsed, 1e-6)
+        print("\n📈 Throughput AI:")
+        for name, limiter in self.models.items():
+            if not limiter.calls:
+                continue
+            per_min = limiter.successes / elapsed * 60
+            print(
+                f"   - {name}: {limiter.successes}/{limiter.calls} sukses, "
+                f"{limiter.rate_limited}x 429, {limiter.tokens_used} token, "
+                f"{per_min:.1f} req/menit"
+            )
+        if processed is not None:
+            print(f"   - Total: {processed} email dalam {elapsed:.1f} detik "
+                  f"({processed / elapsed * 60:.1f} email/menit)")
+
+
+# Satu scheduler global per proses, dibagi ke semua worker
+scheduler = RateLimitScheduler()
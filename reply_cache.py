@@ -0,0 +1,122 @@
+import time
+import threading
+
+# --- VERSI DATA (INVALIDASI LINTAS PROSES) ---
+# process.py berjalan di mesin lain (GitHub Actions / daemon), jadi invalidasi cache
+# chatbot lewat 1 baris kecil di tabel cache_versions yang di-bump setiap ada tulis.
+VERSION_KEY = "emails"
+_UNSET = object()  # Versi belum pernah dibaca (poll pertama selalu dianggap berubah)
+
+
+def bump_version(storage, key=VERSION_KEY):
+    """Tandai data emails berubah. Gagal di sini tidak boleh menggagalkan proses utama."""
+    try:
+        storage.set_version(key, time.time_ns())
+    except Exception as e:
+        print(f"   ⚠️ Gagal bump versi cache: {e}")
+
+
+def fetch_version(storage, key=VERSION_KEY):
+    return storage.get_version(key)
+
+
+class ReplyCache:
+    """
+    Cache read-through untuk balasan chatbot, per key (kategori).
+    - Entry kedaluwarsa setelah `ttl` detik.
+    - Thread background cek versi data tiap `poll_interval` detik; kalau berubah, cache dikosongkan.
+    - Miss bersamaan untuk key yang sama digabung jadi 1 fetch (single-flight).
+    - `on_change` (opsional) dipanggil dari thread poller setiap versi data berubah.
+    """
+
+    def __init__(self, loader, ttl=300, version_fetcher=None, poll_interval=10, on_change=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.version_fetcher = version_fetcher
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+
+        self.lock = threading.Lock()
+        self.entries = {}     # key -> (expires_at, value)
+        self.inflight = {}    # key -> threading.Event
+        self.version = _UNSET
+        self.poller = None
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def start_poller(self):
+        with self.lock:
+            if self.version_fetcher is None or self.poller is not None:
+                return
+            self.poller = threading.Thread(target=self._poll_versions, daemon=True)
+        self.poller.start()
+
+    def _poll_versions(self):
+        while True:
+            try:
+                version = self.version_fetcher()
+                if version != self.version:
+                    with self.lock:
+                        if self.version is not _UNSET:
+                            self.entries.clear()
+                        self.version = version
+                    if self.on_change:
+                        self.on_change()
+            except Exception as e:
+                print(f"⚠️ Gagal cek versi cache: {e}")
+            time.sleep(self.poll_interval)
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def get(self, key):
+        self.start_poller()
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+
+            event = self.inflight.get(key)
+            is_owner = event is None
+            if is_owner:
+                event = threading.Event()
+                self.inflight[key] = event
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not is_owner:
+            # Thread lain sedang fetch key yang sama: tunggu hasilnya
+            event.wait(timeout=10)
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry:
+                return entry[1]
+            return self.loader(key)
+
+        try:
+            value = self.loader(key)
+            with self.lock:
+                self.entries[key] = (time.monotonic() + self.ttl, value)
+            return value
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            event.set()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self.entries),
+        }
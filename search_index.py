@@ -0,0 +1,257 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from timeutil import parse_time
+
+# --- KONFIGURASI INDEX PENCARIAN ---
+# Index full-text lokal (SQLite FTS5) di atas subject, summary_text & action_items.
+# Teks di-stem (bahasa Indonesia) sebelum masuk index, query juga di-stem dengan cara sama.
+INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "search_index.db")
+# Sync berdasarkan waktu klasifikasi (classified_at), bukan received_at: email lama yang
+# baru selesai diproses AI tetap masuk. Mundur sedikit untuk jaga-jaga beda jam antar worker.
+SYNC_OVERLAP_MINUTES = 10
+SYNC_PAGE_SIZE = 1000
+SEARCH_CATEGORIES = ["URGENT", "BENEFIT", "TASK", "NOISE"]
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "dan", "di", "ke", "dari", "yang", "untuk", "dengan", "pada", "ini", "itu", "atau",
+    "the", "of", "and", "to", "in", "for", "a", "an", "info", "ada", "mau", "cari",
+}
+
+# =========================================================
+# STEMMER BAHASA INDONESIA (BERBASIS ATURAN)
+# =========================================================
+PARTICLES = ("lah", "kah", "tah", "pun")
+POSSESSIVES = ("nya",)    # -ku/-mu tidak dipakai: terlalu sering bagian kata dasar (waktu, ilmu)
+SUFFIXES = ("kan", "an")  # -i tidak dipotong: terlalu sering bagian kata dasar (ganti, pakai, kunci)
+# Urutan penting: prefix terpanjang dicek duluan
+PREFIXES = (
+    ("meng", ""), ("meny", "s"), ("mem", "p"), ("men", "t"), ("me", ""),
+    ("peng", ""), ("peny", "s"), ("pem", "p"), ("pen", "t"), ("per", ""), ("pe", ""),
+    ("ber", ""), ("ter", ""), ("di", ""),
+)
+# ke-/se- hanya sebagai konfiks ke-an / se-an (keuangan -> uang); kelas, sekolah, senin tetap utuh
+CONFIX_PREFIXES = ("ke", "se")
+TOKENIZER_VERSION = "2"   # Naikkan kalau stem()/index_terms() berubah -> index lama dibangun ulang
+MIN_STEM = 4              # Kata dasar lebih pendek dari ini hampir selalu hasil potong yang salah
+MIN_PARTICLE_STEM = 5     # sekolah -> "seko" bukan partikel -lah
+VOWELS = "aiueo"
+
+
+def _strip_suffix(word, suffixes, min_stem=MIN_STEM):
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= min_stem:
+            return word[: -len(suffix)], suffix
+    return word, None
+
+
+def stem(word):
+    """Stemmer ringan: partikel -> kepunyaan -> akhiran -> awalan (maks 2 lapis)."""
+    if len(word) <= MIN_STEM or word.isdigit():
+        return word
+    word, _ = _strip_suffix(word, PARTICLES, MIN_PARTICLE_STEM)
+    word, _ = _strip_suffix(word, POSSESSIVES)
+    word, suffix = _strip_suffix(word, SUFFIXES)
+    if suffix == "an":
+        for prefix in CONFIX_PREFIXES:
+            if word.startswith(prefix) and len(word) - len(prefix) >= MIN_STEM:
+                return word[len(prefix):]
+    for _ in range(2):
+        for prefix, replacement in PREFIXES:
+            if not word.startswith(prefix):
+                continue
+            # Peluluhan: menulis -> tulis, memakai -> pakai, menyapu -> sapu
+            rest = word[len(prefix):]
+            if replacement and rest[:1] in VOWELS:
+                rest = replacement + rest
+            if len(rest) >= MIN_STEM:
+                word = rest
+                break
+        else:
+            break
+    return word
+
+
+def _words(text):
+    return [w for w in WORD_PATTERN.findall((text or "").lower()) if w not in STOPWORDS]
+
+
+def index_terms(text):
+    """Kata asli + kata dasarnya (kalau beda): kata yang persis sama dengan query dapat skor lebih."""
+    terms = []
+    for word in _words(text):
+        terms.append(word)
+        root = stem(word)
+        if root != word:
+            terms.append(root)
+    return terms
+
+
+def query_groups(query):
+    """1 grup FTS per kata query: kata asli ATAU kata dasarnya (prefix, untuk kata yang belum selesai diketik)."""
+    groups = []
+    for word in dict.fromkeys(_words(query)):
+        variants = dict.fromkeys([word, stem(word)])
+        groups.append("(" + " OR ".join(f'"{v}"*' for v in variants) + ")")
+    return groups
+
+
+# =========================================================
+# INDEX
+# =========================================================
+
+class SearchIndex:
+    def __init__(self, path=INDEX_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS docs (
+                email_id TEXT PRIMARY KEY,
+                subject TEXT,
+                summary_text TEXT,
+                deadline_date TEXT,
+                category TEXT,
+                received_at TEXT
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        self.conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+                email_id UNINDEXED, subject, summary, actions, tokenize = 'unicode61'
+            )
+        """)
+        self._reset_if_tokenizer_changed()
+        self.conn.commit()
+
+    def _reset_if_tokenizer_changed(self):
+        """Term di docs_fts ikut format tokenizer lama -> kosongkan index & watermark supaya sync penuh ulang."""
+        row = self.conn.execute("SELECT value FROM sync_state WHERE key = 'tokenizer'").fetchone()
+        if row and row[0] == TOKENIZER_VERSION:
+            return
+        if row or self.conn.execute("SELECT 1 FROM docs LIMIT 1").fetchone():
+            print("🔄 Tokenizer search berubah, index dibangun ulang dari DB...")
+            self.conn.execute("DELETE FROM docs")
+            self.conn.execute("DELETE FROM docs_fts")
+            self.conn.execute("DELETE FROM sync_state WHERE key = 'classified_at'")
+        self.conn.execute("INSERT OR REPLACE INTO sync_state VALUES ('tokenizer', ?)", (TOKENIZER_VERSION,))
+
+    def index_emails(self, emails):
+        """Tambah/update email ke index (incremental). Email PENDING_AI dilewati."""
+        rows = [e for e in emails if e.get("category") in SEARCH_CATEGORIES]
+        if not rows:
+            return 0
+        with self.lock:
+            for email in rows:
+                email_id = str(email["id"])
+                actions = email.get("action_items") or []
+                if isinstance(actions, list):
+                    actions = " ".join(str(a) for a in actions)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?)",
+                    (email_id, email.get("subject"), email.get("summary_text"),
+                     email.get("deadline_date"), email.get("category"), email.get("received_at")),
+                )
+                self.conn.execute("DELETE FROM docs_fts WHERE email_id = ?", (email_id,))
+                self.conn.execute(
+                    "INSERT INTO docs_fts (email_id, subject, summary, actions) VALUES (?, ?, ?, ?)",
+                    (email_id, " ".join(index_terms(email.get("subject"))),
+                     " ".join(index_terms(email.get("summary_text"))), " ".join(index_terms(actions))),
+                )
+            self.conn.commit()
+        return len(rows)
+
+    def synced_until(self):
+        """classified_at terbesar yang sudah di-sync dari DB (None = belum pernah)."""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM sync_state WHERE key = 'classified_at'").fetchone()
+        return row[0] if row else None
+
+    def set_synced_until(self, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO sync_state VALUES ('classified_at', ?)", (value,))
+            self.conn.commit()
+
+    def search(self, query, limit=5):
+        """Cari email paling relevan (BM25). Semua kata wajib ada; kalau kosong, cukup salah satu."""
+        groups = query_groups(query)
+        if not groups:
+            return []
+        for match in (" AND ".join(groups), " OR ".join(groups)):
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT d.email_id, d.subject, d.summary_text, d.deadline_date, d.category, d.received_at "
+                    "FROM docs_fts JOIN docs d ON d.email_id = docs_fts.email_id "
+                    "WHERE docs_fts MATCH ? "
+                    "ORDER BY bm25(docs_fts, 0.0, 3.0, 1.5, 1.0), d.received_at DESC LIMIT ?",
+                    (match, limit),
+                ).fetchall()
+            if rows:
+                keys = ["id", "subject", "summary_text", "deadline_date", "category", "received_at"]
+                return [dict(zip(keys, row)) for row in rows]
+            if len(groups) == 1:
+                break
+        return []
+
+    def get_docs(self, email_ids):
+        """Ambil detail email dari tabel docs, urutan mengikuti email_ids."""
+        if not email_ids:
+            return []
+        placeholders = ",".join("?" * len(email_ids))
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT email_id, subject, summary_text, deadline_date, category, received_at "
+                f"FROM docs WHERE email_id IN ({placeholders})",
+                [str(i) for i in email_ids],
+            ).fetchall()
+        keys = ["id", "subject", "summary_text", "deadline_date", "category", "received_at"]
+        by_id = {row[0]: dict(zip(keys, row)) for row in rows}
+        return [by_id[str(i)] for i in email_ids if str(i) in by_id]
+
+    def sync_from_db(self, storage, also_index=()):
+        """
+        Tarik email yang sudah diklasifikasi dari storage (Supabase/SQLite) ke index lokal.
+        Mulai dari classified_at terakhir yang di-sync dikurangi SYNC_OVERLAP_MINUTES
+        (belum pernah sync = sync penuh, termasuk baris lama tanpa classified_at).
+        `also_index`: index lain (punya `index_emails`) yang ikut diisi dari halaman yang sama.
+        """
+        synced = self.synced_until()
+        query_from = None
+        synced_at = parse_time(synced)
+        if synced_at:
+            query_from = (synced_at - timedelta(minutes=SYNC_OVERLAP_MINUTES)).isoformat()
+
+        total = 0
+        start = 0
+        latest = synced
+        while True:
+            rows = storage.recent_by_category(
+                SEARCH_CATEGORIES, since=query_from, since_column="classified_at",
+                order_by="classified_at", desc=False, limit=SYNC_PAGE_SIZE, offset=start,
+                columns="id, subject, summary_text, action_items, deadline_date, category, received_at, classified_at",
+            )
+            total += self.index_emails(rows)
+            for index in also_index:
+                index.index_emails(rows)
+            stamps = [row["classified_at"] for row in rows if row.get("classified_at")]
+            if stamps:
+                latest = max([latest or "", *stamps], key=_timestamp_key)
+            if len(rows) < SYNC_PAGE_SIZE:
+                break
+            start += SYNC_PAGE_SIZE
+        if latest and latest != synced:
+            self.set_synced_until(latest)
+        return total
+
+
+def _timestamp_key(value):
+    """Bandingkan timestamp ISO dari Postgres/SQLite (format zona bisa beda) sebagai datetime."""
+    return parse_time(value) or datetime.min.replace(tzinfo=timezone.utc)
@@ -0,0 +1,402 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from timeutil import parse_time
+
+# --- KONFIGURASI STORAGE ---
+# Semua modul membaca/menulis tabel bot (emails, subscribers, deliveries, cache_versions)
+# lewat 1 objek repository dari clients.get_storage(), bukan query Supabase langsung.
+# "supabase" (default) = PostgREST lewat HTTP, "sqlite" = file lokal (self-hosted / tes tanpa jaringan).
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "emails.db")
+
+EMAIL_TABLE = "emails"
+SUBSCRIBER_TABLE = "subscribers"
+DELIVERY_TABLE = "deliveries"
+VERSION_TABLE = "cache_versions"
+
+IN_CHUNK_SIZE = 200      # Jumlah nilai per filter IN (Supabase: biar URL tidak kepanjangan)
+PAGE_SIZE = 1000         # Baris per halaman saat membaca hasil besar
+
+SUBSCRIBER_COLUMNS = "id, line_user_id, categories, faculty, batch, created_at"
+EMAIL_COLUMNS = {
+    "id", "email_uid", "sender", "subject", "body_snippet", "received_at", "category",
+    "summary_text", "action_items", "deadline_date", "priority_score", "is_notified",
+    "created_at", "processing_by", "lease_expires_at", "target_faculties", "target_batches",
+    "urgency_score", "queue_at", "label_source", "classified_at",
+}
+# Kolom list/JSON di Postgres, disimpan sebagai teks JSON di SQLite
+JSON_COLUMNS = {"action_items", "target_faculties", "target_batches", "categories"}
+BOOL_COLUMNS = {"is_notified", "active"}
+# Timestamp disimpan UTC ISO-8601 supaya urutan teks = urutan waktu
+TIME_COLUMNS = {"received_at", "created_at", "lease_expires_at", "delivered_at", "queue_at", "classified_at"}
+
+
+def _chunks(values, size):
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+# =========================================================
+# SUPABASE (POSTGREST)
+# =========================================================
+
+class SupabaseStorage:
+    def __init__(self, client):
+        self.client = client
+
+    def find_existing_uids(self, uids):
+        """Set email_uid yang sudah ada di DB."""
+        existing = set()
+        for chunk in _chunks(list(uids), IN_CHUNK_SIZE):
+            response = self.client.table(EMAIL_TABLE) \
+                .select("email_uid") \
+                .in_("email_uid", chunk) \
+                .execute()
+            existing.update(row["email_uid"] for row in response.data)
+        return existing
+
+    def insert_emails(self, rows):
+        """
+        Bulk insert. Konflik di email_uid diabaikan (bukan error), jadi kalau proses lain
+        insert duluan, baris itu dilewati. Return baris yang benar-benar masuk.
+        """
+        response = self.client.table(EMAIL_TABLE) \
+            .upsert(rows, on_conflict="email_uid", ignore_duplicates=True) \
+            .execute()
+        return response.data
+
+    def claim_pending(self, worker_id, limit, lease_seconds):
+        """Klaim atomik lewat fungsi SQL claim_pending_emails (lihat README)."""
+        response = self.client.rpc("claim_pending_emails", {
+            "p_worker_id": worker_id,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds,
+        }).execute()
+        return response.data or []
+
+    def update_email(self, email_id, fields, owner=None):
+        """
+        Update 1 email. owner = WORKER_ID: hanya kalau baris masih di-lease worker itu
+        (lease kedaluwarsa lalu diklaim worker lain -> tidak ditimpa). Return True kalau ada baris ter-update.
+        """
+        query = self.client.table(EMAIL_TABLE).update(fields).eq("id", email_id)
+        if owner is not None:
+            query = query.eq("processing_by", owner)
+        return bool(query.execute().data)
+
+    def mark_notified(self, email_ids):
+        for chunk in _chunks(list(email_ids), IN_CHUNK_SIZE):
+            self.client.table(EMAIL_TABLE).update({"is_notified": True}).in_("id", chunk).execute()
+
+    def recent_by_category(self, categories, since=None, unnotified_only=False, label_source=None,
+                           order_by="received_at", desc=True, limit=None, offset=0, columns="*",
+                           since_column="received_at"):
+        query = self.client.table(EMAIL_TABLE).select(columns).in_("category", list(categories))
+        if since:
+            query = query.gte(since_column, since)
+        if unnotified_only:
+            query = query.eq("is_notified", False)
+        if label_source:
+            query = query.eq("label_source", label_source)
+        query = query.order(order_by, desc=desc)
+        if limit is not None:
+            query = query.range(offset, offset + limit - 1)
+        return query.execute().data
+
+    def active_subscribers(self):
+        response = self.client.table(SUBSCRIBER_TABLE) \
+            .select(SUBSCRIBER_COLUMNS) \
+            .eq("active", True) \
+            .execute()
+        return response.data
+
+    def delivered_pairs(self, email_ids):
+        """Set (subscriber_id, email_id) yang sudah pernah terkirim."""
+        delivered = set()
+        for chunk in _chunks(list(email_ids), IN_CHUNK_SIZE):
+            start = 0
+            while True:
+                response = self.client.table(DELIVERY_TABLE) \
+                    .select("subscriber_id, email_id") \
+                    .in_("email_id", chunk) \
+                    .range(start, start + PAGE_SIZE - 1) \
+                    .execute()
+                delivered.update((row["subscriber_id"], row["email_id"]) for row in response.data)
+                if len(response.data) < PAGE_SIZE:
+                    break
+                start += PAGE_SIZE
+        return delivered
+
+    def record_deliveries(self, pairs):
+        rows = [{"subscriber_id": sub_id, "email_id": email_id} for sub_id, email_id in pairs]
+        self.client.table(DELIVERY_TABLE) \
+            .upsert(rows, on_conflict="subscriber_id,email_id", ignore_duplicates=True) \
+            .execute()
+
+    def get_version(self, key):
+        response = self.client.table(VERSION_TABLE).select("version").eq("key", key).limit(1).execute()
+        return response.data[0]["version"] if response.data else None
+
+    def set_version(self, key, version):
+        self.client.table(VERSION_TABLE).upsert({"key": key, "version": version}).execute()
+
+
+# =========================================================
+# SQLITE (LOKAL)
+# =========================================================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    id TEXT PRIMARY KEY,
+    email_uid TEXT UNIQUE NOT NULL,
+    sender TEXT,
+    subject TEXT,
+    body_snippet TEXT,
+    received_at TEXT,
+    category TEXT,
+    summary_text TEXT,
+    action_items TEXT,
+    deadline_date TEXT,
+    priority_score INTEGER,
+    is_notified INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    processing_by TEXT,
+    lease_expires_at TEXT,
+    target_faculties TEXT,
+    target_batches TEXT,
+    urgency_score INTEGER,
+    queue_at TEXT,
+    label_source TEXT,
+    classified_at TEXT
+);
+-- Kategori + waktu: chatbot, rekap notify, sync index
+CREATE INDEX IF NOT EXISTS emails_category_received_idx ON emails (category, received_at);
+-- Klaim PENDING_AI, paling mendesak dulu (lihat urgency.py); baris lama tanpa queue_at pakai received_at
+DROP INDEX IF EXISTS emails_category_queue_idx;
+CREATE INDEX IF NOT EXISTS emails_category_queue_order_idx ON emails (category, COALESCE(queue_at, received_at));
+-- Mode 1 penerima: kategori yang belum terkirim
+CREATE INDEX IF NOT EXISTS emails_category_notified_idx ON emails (category, is_notified, received_at);
+-- Sync index pencarian chatbot: email yang baru diklasifikasi
+CREATE INDEX IF NOT EXISTS emails_classified_idx ON emails (classified_at);
+
+CREATE TABLE IF NOT EXISTS subscribers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    line_user_id TEXT UNIQUE NOT NULL,
+    name TEXT,
+    categories TEXT,
+    faculty TEXT,
+    batch INTEGER,
+    active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS subscribers_active_idx ON subscribers (active);
+
+CREATE TABLE IF NOT EXISTS deliveries (
+    subscriber_id INTEGER NOT NULL,
+    email_id TEXT NOT NULL,
+    delivered_at TEXT,
+    PRIMARY KEY (subscriber_id, email_id)
+);
+CREATE INDEX IF NOT EXISTS deliveries_email_idx ON deliveries (email_id);
+
+CREATE TABLE IF NOT EXISTS cache_versions (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+# Kolom yang ditambahkan setelah skema pertama: (nama, tipe), di-ALTER kalau file DB lama belum punya
+SQLITE_ADDED_COLUMNS = [("urgency_score", "INTEGER"), ("queue_at", "TEXT"), ("label_source", "TEXT"),
+                        ("classified_at", "TEXT")]
+
+
+def _utc_iso(value):
+    """Timestamp apa pun (ISO dengan/tanpa zona, datetime) -> ISO UTC. Tanpa zona dianggap UTC (sama seperti Postgres)."""
+    if value is None:
+        return None
+    parsed = parse_time(value)
+    if parsed is None:
+        return value
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _encode(column, value):
+    if column in JSON_COLUMNS and value is not None:
+        return json.dumps(value, ensure_ascii=False)
+    if column in BOOL_COLUMNS and value is not None:
+        return int(bool(value))
+    if column in TIME_COLUMNS:
+        return _utc_iso(value)
+    return value
+
+
+def _decode(row):
+    data = dict(row)
+    for column, value in data.items():
+        if value is None:
+            continue
+        if column in JSON_COLUMNS:
+            data[column] = json.loads(value)
+        elif column in BOOL_COLUMNS:
+            data[column] = bool(value)
+    return data
+
+
+def _email_columns(columns):
+    """Validasi daftar kolom gaya PostgREST ("id, subject") sebelum masuk SQL."""
+    if columns.strip() == "*":
+        return "*"
+    names = [name.strip() for name in columns.split(",")]
+    unknown = [name for name in names if name not in EMAIL_COLUMNS]
+    if unknown:
+        raise ValueError(f"Kolom tidak dikenal: {unknown}")
+    return ", ".join(names)
+
+
+class SQLiteStorage:
+    """
+    Backend lokal 1 file (WAL). 1 koneksi dipakai bersama semua thread (dikunci),
+    proses lain (worker process.py kedua) aman karena klaim dilakukan dalam 1 statement UPDATE.
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(emails)")}
+        if existing:
+            for column, column_type in SQLITE_ADDED_COLUMNS:
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE emails ADD COLUMN {column} {column_type}")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.conn.commit()
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return [_decode(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def find_existing_uids(self, uids):
+        existing = set()
+        for chunk in _chunks([str(uid) for uid in uids], IN_CHUNK_SIZE):
+            marks = ",".join("?" * len(chunk))
+            rows = self._query(f"SELECT email_uid FROM emails WHERE email_uid IN ({marks})", chunk)
+            existing.update(row["email_uid"] for row in rows)
+        return existing
+
+    def insert_emails(self, rows):
+        inserted = []
+        with self.lock:
+            for row in rows:
+                row = {"id": str(uuid.uuid4()), "is_notified": False, "created_at": _now(), **row}
+                columns = list(row)
+                _email_columns(", ".join(columns))
+                cursor = self.conn.execute(
+                    f"INSERT INTO emails ({', '.join(columns)}) VALUES ({','.join('?' * len(columns))}) "
+                    "ON CONFLICT(email_uid) DO NOTHING RETURNING *",
+                    [_encode(column, row[column]) for column in columns],
+                )
+                inserted.extend(_decode(r) for r in cursor.fetchall())
+            self.conn.commit()
+        return inserted
+
+    def claim_pending(self, worker_id, limit, lease_seconds):
+        now = datetime.now(timezone.utc)
+        expires = datetime.fromtimestamp(now.timestamp() + lease_seconds, timezone.utc).isoformat()
+        with self.lock:
+            # 1 statement = 1 transaksi tulis, jadi 2 proses tidak bisa mengklaim baris yang sama
+            rows = self.conn.execute("""
+                UPDATE emails SET processing_by = ?, lease_expires_at = ?
+                WHERE id IN (
+                    SELECT id FROM emails
+                    WHERE category = 'PENDING_AI'
+                      AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+                    ORDER BY COALESCE(queue_at, received_at)
+                    LIMIT ?
+                )
+                RETURNING *
+            """, (worker_id, expires, now.isoformat(), limit)).fetchall()
+            self.conn.commit()
+        return [_decode(row) for row in rows]
+
+    def update_email(self, email_id, fields, owner=None):
+        columns = list(fields)
+        _email_columns(", ".join(columns))
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        sql = f"UPDATE emails SET {assignments} WHERE id = ?"
+        params = [_encode(column, fields[column]) for column in columns] + [email_id]
+        if owner is not None:
+            sql += " AND processing_by = ?"
+            params.append(owner)
+        with self.lock:
+            updated = self.conn.execute(sql, params).rowcount
+            self.conn.commit()
+        return updated > 0
+
+    def mark_notified(self, email_ids):
+        with self.lock:
+            for chunk in _chunks(list(email_ids), IN_CHUNK_SIZE):
+                marks = ",".join("?" * len(chunk))
+                self.conn.execute(f"UPDATE emails SET is_notified = 1 WHERE id IN ({marks})", chunk)
+            self.conn.commit()
+
+    def recent_by_category(self, categories, since=None, unnotified_only=False, label_source=None,
+                           order_by="received_at", desc=True, limit=None, offset=0, columns="*",
+                           since_column="received_at"):
+        categories = list(categories)
+        sql = f"SELECT {_email_columns(columns)} FROM emails WHERE category IN ({','.join('?' * len(categories))})"
+        params = categories
+        if since:
+            sql += f" AND {_email_columns(since_column)} >= ?"
+            params.append(_utc_iso(since))
+        if unnotified_only:
+            sql += " AND is_notified = 0"
+        if label_source:
+            sql += " AND label_source = ?"
+            params.append(label_source)
+        sql += f" ORDER BY {_email_columns(order_by)} {'DESC' if desc else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return self._query(sql, params)
+
+    def active_subscribers(self):
+        return self._query(f"SELECT {SUBSCRIBER_COLUMNS} FROM subscribers WHERE active = 1")
+
+    def delivered_pairs(self, email_ids):
+        delivered = set()
+        for chunk in _chunks([str(email_id) for email_id in email_ids], IN_CHUNK_SIZE):
+            marks = ",".join("?" * len(chunk))
+            rows = self._query(f"SELECT subscriber_id, email_id FROM deliveries WHERE email_id IN ({marks})", chunk)
+            delivered.update((row["subscriber_id"], row["email_id"]) for row in rows)
+        return delivered
+
+    def record_deliveries(self, pairs):
+        now = _now()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (subscriber_id, email_id, delivered_at) VALUES (?, ?, ?)",
+                [(sub_id, str(email_id), now) for sub_id, email_id in pairs],
+            )
+            self.conn.commit()
+
+    def get_version(self, key):
+        rows = self._query("SELECT version FROM cache_versions WHERE key = ?", (key,))
+        return rows[0]["version"] if rows else None
+
+    def set_version(self, key, version):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO cache_versions (key, version) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET version = excluded.version",
+                (key, version),
+            )
+            self.conn.commit()
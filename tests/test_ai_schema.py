@@ -0,0 +1,174 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ai_schema  # noqa: E402
+from ai_schema import repair_json, validate, needs_followup, merge, TRUNCATED_KEY  # noqa: E402
+
+ITEM = '{"id": "1", "category": "TASK", "deadline_date": "2026-05-10", "summary_text": "Kumpulkan laporan"}'
+
+
+# =========================================================
+# PERBAIKAN JSON
+# =========================================================
+
+def test_valid_json_not_marked_repaired():
+    result, repaired = repair_json(ITEM)
+    assert result["category"] == "TASK"
+    assert repaired is False
+
+
+@pytest.mark.parametrize("text", [
+    f"```json\n{ITEM}\n```",
+    f"Berikut hasilnya:\n```json\n{ITEM}\n```",
+    f"Berikut hasilnya: {ITEM}",
+    f"{ITEM}\n\nSemoga membantu!",
+])
+def test_fences_and_surrounding_text(text):
+    result, _ = repair_json(text)
+    assert result["summary_text"] == "Kumpulkan laporan"
+    assert TRUNCATED_KEY not in result
+
+
+def test_single_quotes_and_python_literals():
+    result, repaired = repair_json("{'category': 'NOISE', 'deadline_date': None, 'urgent': False}")
+    assert result == {"category": "NOISE", "deadline_date": None, "urgent": False}
+    assert repaired is True
+
+
+def test_escaped_single_quote_inside_single_quoted_string():
+    result, _ = repair_json("{'category': 'TASK', 'summary_text': 'Kuis hari Jum\\'at'}")
+    assert result["summary_text"] == "Kuis hari Jum'at"
+
+
+def test_double_quote_inside_single_quoted_string():
+    result, _ = repair_json("{'summary_text': 'Webinar \"AI untuk Kampus\"'}")
+    assert result["summary_text"] == 'Webinar "AI untuk Kampus"'
+
+
+def test_trailing_commas():
+    result, _ = repair_json('[{"id": "1", "action_items": ["Daftar", ],}, ]')
+    assert result == [{"id": "1", "action_items": ["Daftar"]}]
+
+
+def test_truncated_string_value_is_dropped_not_closed():
+    # "2025-10-1" bukan tanggal yang benar: harus dibuang, lalu ditanyakan lagi
+    result, repaired = repair_json('[{"id": "1", "category": "TASK", "deadline_date": "2025-10-1')
+    assert repaired is True
+    assert result == [{"id": "1", "category": "TASK", TRUNCATED_KEY: True}]
+
+
+def test_truncated_batch_keeps_complete_items():
+    text = (f'[{ITEM}, {{"id": "2", "category": "BENEFIT", "deadline_date": null, '
+            '"summary_text": "Pendaftaran beasiswa dib')
+    result, _ = repair_json(text)
+    assert len(result) == 2
+    assert TRUNCATED_KEY not in result[0]
+    assert "summary_text" not in result[1]
+    assert result[1][TRUNCATED_KEY] is True
+
+
+def test_truncated_number_is_dropped():
+    result, _ = repair_json('{"category": "TASK", "summary_text": "Kuis", "priority_score": 4')
+    assert "priority_score" not in result
+    assert result[TRUNCATED_KEY] is True
+
+
+def test_truncated_between_items_drops_nothing_complete():
+    result, _ = repair_json(f"[{ITEM}, ")
+    assert result == [repair_json(ITEM)[0]]
+
+
+def test_truncated_inside_nested_array_keeps_complete_elements():
+    result, _ = repair_json('{"category": "TASK", "summary_text": "Kuis", "action_items": ["Daftar", "Kump')
+    assert result["action_items"] == ["Daftar"]
+
+
+def test_unrecoverable_raises():
+    with pytest.raises(ValueError):
+        repair_json("Maaf, saya tidak bisa membantu.")
+    with pytest.raises(ValueError):
+        repair_json('{"category": "TAS')
+
+
+# =========================================================
+# VALIDASI & FOLLOW-UP
+# =========================================================
+
+def test_validate_normalizes_category_and_date():
+    clean, missing, repaired = validate({"category": "Penting!", "deadline_date": "5 Mei 2026",
+                                         "summary_text": "Kelas dibatalkan"})
+    assert clean["category"] == "URGENT"
+    assert clean["deadline_date"] == "2026-05-05"
+    assert missing == []
+    assert set(repaired) == {"category", "deadline_date"}
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("urgent", "URGENT"),
+    ("Tugas!", "TASK"),
+    ("TASK (tugas kuliah)", "TASK"),
+    ("URGENT/BENEFIT/TASK/NOISE", None),
+    ("URGENT atau TASK", None),
+    ("entah", None),
+])
+def test_normalize_category(value, expected):
+    assert ai_schema.normalize_category(value) == expected
+
+
+def test_ambiguous_category_needs_followup():
+    clean, missing, _ = validate({"category": "URGENT/BENEFIT/TASK/NOISE", "summary_text": "Info beasiswa"})
+    assert clean["category"] is None
+    assert missing == ["category"]
+    assert needs_followup(missing, [])
+
+
+def test_unreadable_deadline_alone_does_not_need_followup():
+    clean, missing, repaired = validate({"category": "TASK", "deadline_date": "minggu depan",
+                                         "summary_text": "Kuis"})
+    assert missing == ["deadline_date"]
+    assert not needs_followup(missing, repaired)
+
+
+def test_truncated_item_asks_for_unwritten_fields():
+    result, _ = repair_json('[{"id": "1", "category": "TASK", "deadline_date": "2025-10-1')
+    clean, missing, repaired = validate(result[0])
+    assert clean["deadline_date"] is None
+    assert set(missing) == {"summary_text", "deadline_date"}
+    assert needs_followup(missing, repaired)
+
+
+def test_truncated_deadline_only_still_needs_followup():
+    item = {"category": "TASK", "summary_text": "Kuis", TRUNCATED_KEY: True}
+    _, missing, repaired = validate(item)
+    assert missing == ["deadline_date"]
+    assert needs_followup(missing, repaired)
+
+
+def test_merge_fills_missing_fields():
+    clean, missing, _ = validate({"category": "TASK", TRUNCATED_KEY: True})
+    patched, still_missing = merge(clean, {"summary_text": "Kumpulkan laporan", "deadline_date": "10/05/2026"},
+                                   missing)
+    assert still_missing == []
+    assert patched["summary_text"] == "Kumpulkan laporan"
+    assert patched["deadline_date"] == "2026-05-10"
+
+
+def test_merge_reports_required_still_missing():
+    clean, missing, _ = validate({"category": "TASK"})
+    patched, still_missing = merge(clean, {}, missing)
+    assert still_missing == ["summary_text"]
+
+
+def test_normalize_date_formats():
+    assert ai_schema.normalize_date("2026-06-05") == ("2026-06-05", True)
+    assert ai_schema.normalize_date("5/6/2026") == ("2026-06-05", True)
+    assert ai_schema.normalize_date("2026/06/05") == ("2026-06-05", True)
+    assert ai_schema.normalize_date("2026.06.05") == ("2026-06-05", True)
+    assert ai_schema.normalize_date("2026-06-05T23:59:00+07:00") == ("2026-06-05", True)
+    assert ai_schema.normalize_date("05-06-26") == ("2026-06-05", True)
+    assert ai_schema.normalize_date("June 5, 2026") == ("2026-06-05", True)
+    assert ai_schema.normalize_date("tidak ada") == (None, True)
+    assert ai_schema.normalize_date("2026-02-30") == (None, False)
@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import delivery  # noqa: E402
+from linebot.exceptions import LineBotApiError  # noqa: E402
+from linebot.models.error import Error  # noqa: E402
+
+
+class FlakyLine:
+    """push_message gagal sesuai `errors` (status code) dulu, lalu berhasil."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.keys = []
+
+    def push_message(self, to, messages, retry_key=None):
+        self.keys.append(retry_key)
+        if self.errors:
+            raise LineBotApiError(self.errors.pop(0), {}, error=Error(message="gagal"))
+
+    multicast = push_message
+
+
+class NoThrottle:
+    def acquire(self):
+        pass
+
+
+def test_retry_reuses_one_retry_key(monkeypatch):
+    monkeypatch.setattr(delivery.time, "sleep", lambda seconds: None)
+    line = FlakyLine([500, 429])
+    sent = delivery._send_digest(line, NoThrottle(), ["U1"], [("balon", [7])])
+    assert sent == [7]
+    assert len(line.keys) == 3
+    assert len(set(line.keys)) == 1 and line.keys[0]
+
+
+def test_each_push_gets_its_own_retry_key():
+    line = FlakyLine([])
+    bubbles = [(f"balon {i}", [i]) for i in range(delivery.MAX_MESSAGES_PER_PUSH + 1)]
+    delivery._send_digest(line, NoThrottle(), ["U1", "U2"], bubbles)
+    assert len(line.keys) == 2
+    assert line.keys[0] != line.keys[1]
+
+
+def test_conflict_means_already_sent(monkeypatch):
+    monkeypatch.setattr(delivery.time, "sleep", lambda seconds: None)
+    line = FlakyLine([500, 409])
+    assert delivery._send_digest(line, NoThrottle(), ["U1"], [("balon", [7])]) == [7]
+    assert len(line.keys) == 2
+
+
+def test_client_error_is_not_retried():
+    line = FlakyLine([400])
+    assert delivery._send_digest(line, NoThrottle(), ["U1"], [("balon", [7])]) == []
+    assert len(line.keys) == 1
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import html_text  # noqa: E402
+from html_text import html_to_text  # noqa: E402
+
+BACKEND_NAMES = [
+    "html.parser",
+    pytest.param("lxml", marks=pytest.mark.skipif(html_text.etree is None, reason="lxml tidak terpasang")),
+]
+
+
+@pytest.fixture(params=BACKEND_NAMES)
+def to_text(request):
+    return lambda html, **kwargs: html_to_text(html, backend=request.param, **kwargs)
+
+
+@pytest.mark.parametrize("html", [
+    "<p hidden>rahasia<p>Kuliah diganti Jumat",
+    "<div><p hidden>rahasia</div><p>Kuliah diganti Jumat",
+    "<p style='display:none'>rahasia<div>Kuliah diganti Jumat</div>",
+    "<ul><li hidden>rahasia<li>Kuliah diganti Jumat</ul>",
+])
+def test_hidden_element_closed_implicitly(to_text, html):
+    assert to_text(html) == "Kuliah diganti Jumat"
+
+
+def test_nested_blocks_inside_hidden_element(to_text):
+    html = "<div hidden>rahasia<p>masih rahasia<p>tetap rahasia</div><p>Terlihat"
+    assert to_text(html) == "Terlihat"
+
+
+@pytest.mark.parametrize("html", [
+    "<style>p { color: red; }</style><p>Terlihat</p>",
+    "<script>var x = '<p>bukan teks</p>';</script><p>Terlihat</p>",
+    "<div style='Display: None'>preheader</div><p>Terlihat</p>",
+    "<span style='visibility:hidden'>preheader</span><p>Terlihat</p>",
+    "<div style='mso-hide:all'>khusus Outlook</div><p>Terlihat</p>",
+])
+def test_invisible_content_skipped(to_text, html):
+    assert to_text(html) == "Terlihat"
+
+
+def test_blocks_become_lines_and_spaces_collapse(to_text):
+    html = "<h1>Pengumuman</h1><p>Batas   <b>pengumpulan</b>\n 10 Mei<br>Ruang B201</p>​"
+    assert to_text(html) == "Pengumuman\nBatas pengumpulan 10 Mei\nRuang B201"
+
+
+def test_limit(to_text):
+    html = "<p>" + "kata " * 5000 + "</p>"
+    assert len(to_text(html, limit=100)) == 100
+
+
+def test_empty(to_text):
+    assert to_text("") == ""
@@ -0,0 +1,67 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rate_limiter  # noqa: E402
+from rate_limiter import RateLimitScheduler, SlidingWindow  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def max_in_window(stamps, window=60.0):
+    """Jumlah terbanyak kejadian di jendela (t - window, t] mana pun."""
+    return max(sum(1 for other in stamps if stamp - window < other <= stamp) for stamp in stamps)
+
+
+def run_scheduler(monkeypatch, limits, seconds, est_tokens=100, step=0.25):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    scheduler = RateLimitScheduler(limits=limits)
+    calls = []
+    end = clock.now + seconds
+    while clock.now < end:
+        name, _ = scheduler.acquire_any(["model"], est_tokens)
+        if name:
+            calls.append(clock.now)
+        else:
+            clock.now += step
+    return calls
+
+
+def test_calls_per_minute_never_exceed_rpm(monkeypatch):
+    calls = run_scheduler(monkeypatch, {"model": {"rpm": 10, "tpm": 1_000_000}}, seconds=300)
+    assert max_in_window(calls) <= 10
+    # Kuota tetap terpakai penuh: ~10 per menit selama 5 menit
+    assert len(calls) >= 45
+
+
+def test_first_minute_has_no_double_burst(monkeypatch):
+    calls = run_scheduler(monkeypatch, {"model": {"rpm": 10, "tpm": 1_000_000}}, seconds=60)
+    assert len(calls) == 10
+
+
+def test_tokens_per_minute_never_exceed_tpm(monkeypatch):
+    calls = run_scheduler(monkeypatch, {"model": {"rpm": 1000, "tpm": 1000}}, seconds=300, est_tokens=300)
+    assert max_in_window(calls) * 300 <= 1000
+
+
+def test_oversized_request_runs_when_window_empty():
+    window = SlidingWindow(100)
+    assert window.wait_time(500, now=0.0) == 0.0
+    window.consume(500, now=0.0)
+    assert window.wait_time(1, now=30.0) == 30.0
+    assert window.wait_time(1, now=60.0) == 0.0
+
+
+def test_drain_blocks_until_window_passes():
+    window = SlidingWindow(10)
+    window.consume(3, now=0.0)
+    window.drain(now=5.0)
+    assert window.wait_time(1, now=10.0) == 50.0
+    assert window.wait_time(1, now=65.0) == 0.0
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import search_index  # noqa: E402
+from search_index import SearchIndex, stem, index_terms  # noqa: E402
+
+
+def make_email(email_id, subject, summary="", received_at="2026-05-01T08:00:00+00:00"):
+    return {
+        "id": email_id, "subject": subject, "summary_text": summary, "action_items": [],
+        "deadline_date": None, "category": "TASK", "received_at": received_at,
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SearchIndex(str(tmp_path / "search.db"))
+
+
+# =========================================================
+# STEMMER
+# =========================================================
+
+@pytest.mark.parametrize("word, expected", [
+    # Kata dasar tidak boleh terpotong
+    ("kelas", "kelas"),
+    ("berita", "berita"),
+    ("sekolah", "sekolah"),
+    ("senin", "senin"),
+    ("beasiswa", "beasiswa"),
+    ("sampai", "sampai"),
+    # Imbuhan dilepas
+    ("memakai", "pakai"),
+    ("dibatalkan", "batal"),
+    ("keuangan", "uang"),
+    ("pengganti", "ganti"),
+    ("pendaftaran", "daftar"),
+    ("perkuliahan", "kuliah"),
+    ("mahasiswanya", "mahasiswa"),
+])
+def test_stem(word, expected):
+    assert stem(word) == expected
+
+
+def test_index_terms_keep_raw_word_next_to_stem():
+    assert index_terms("Pendaftaran kelas") == ["pendaftaran", "daftar", "kelas"]
+
+
+# =========================================================
+# PENCARIAN
+# =========================================================
+
+def test_search_does_not_match_mangled_stems(index):
+    index.index_emails([
+        make_email(1, "Jadwal kelas pengganti"),
+        make_email(2, "Workshop laser cutting"),
+        make_email(3, "Last call lomba"),
+    ])
+    assert [row["id"] for row in index.search("kelas")] == ["1"]
+
+
+def test_search_exact_word_ranks_first(index):
+    index.index_emails([
+        make_email(1, "Pendaftaran seminar nasional", received_at="2026-05-01T08:00:00+00:00"),
+        make_email(2, "Daftar hadir kuliah", received_at="2026-05-02T08:00:00+00:00"),
+    ])
+    assert [row["id"] for row in index.search("pendaftaran")] == ["1", "2"]
+
+
+def test_search_falls_back_to_any_word(index):
+    index.index_emails([make_email(1, "Pembayaran UKT semester genap")])
+    assert [row["id"] for row in index.search("bayar wisuda")] == ["1"]
+
+
+def test_old_tokenizer_index_is_rebuilt(tmp_path):
+    path = str(tmp_path / "search.db")
+    index = SearchIndex(path)
+    index.index_emails([make_email(1, "Jadwal kelas")])
+    index.set_synced_until("2026-05-01T08:00:00+00:00")
+    index.conn.execute("UPDATE sync_state SET value = 'lama' WHERE key = 'tokenizer'")
+    index.conn.commit()
+    index.conn.close()
+
+    reopened = SearchIndex(path)
+    assert reopened.synced_until() is None
+    assert reopened.get_docs([1]) == []
+    version = sqlite3.connect(path).execute("SELECT value FROM sync_state WHERE key = 'tokenizer'").fetchone()
+    assert version[0] == search_index.TOKENIZER_VERSION
@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import SQLiteStorage  # noqa: E402
+
+
+def pending(uid, received_at, queue_at=None):
+    return {"email_uid": uid, "subject": uid, "received_at": received_at,
+            "queue_at": queue_at, "category": "PENDING_AI"}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / "emails.db"))
+
+
+def test_claim_orders_rows_without_queue_at_by_received_at(storage):
+    storage.insert_emails([
+        pending("awal", "2026-05-01T08:00:00+00:00", queue_at="2026-05-01T08:00:00+00:00"),
+        pending("lama", "2026-05-01T12:00:00+00:00"),  # Baris sebelum kolom queue_at ada: tidak boleh menyalip
+        pending("lama_awal", "2026-05-01T06:00:00+00:00"),
+        pending("urgent", "2026-05-01T11:00:00+00:00", queue_at="2026-05-01T07:00:00+00:00"),
+    ])
+    claimed = storage.claim_pending("w1", limit=3, lease_seconds=60)
+    assert {row["email_uid"] for row in claimed} == {"lama_awal", "urgent", "awal"}
+
+
+# =========================================================
+# LEASE MULTI-WORKER
+# =========================================================
+
+def test_expired_lease_is_reclaimed(storage):
+    storage.insert_emails([pending("a", "2026-05-01T08:00:00+00:00")])
+    first = storage.claim_pending("w1", limit=10, lease_seconds=-1)  # Lease langsung kedaluwarsa
+    second = storage.claim_pending("w2", limit=10, lease_seconds=60)
+    assert [row["id"] for row in second] == [first[0]["id"]]
+    assert second[0]["processing_by"] == "w2"
+
+
+def test_active_lease_is_not_reclaimed(storage):
+    storage.insert_emails([pending("a", "2026-05-01T08:00:00+00:00")])
+    assert len(storage.claim_pending("w1", limit=10, lease_seconds=60)) == 1
+    assert storage.claim_pending("w2", limit=10, lease_seconds=60) == []
+
+
+def test_non_owner_write_is_rejected(storage):
+    storage.insert_emails([pending("a", "2026-05-01T08:00:00+00:00")])
+    email_id = storage.claim_pending("w1", limit=10, lease_seconds=-1)[0]["id"]
+    storage.claim_pending("w2", limit=10, lease_seconds=60)
+
+    assert storage.update_email(email_id, {"category": "NOISE"}, owner="w1") is False
+    assert storage.update_email(email_id, {"category": "TASK"}, owner="w2") is True
+    assert storage.recent_by_category(["TASK"])[0]["id"] == email_id
+    assert storage.recent_by_category(["NOISE"]) == []
+
+
+def test_two_workers_never_claim_the_same_row(tmp_path):
+    path = str(tmp_path / "emails.db")
+    SQLiteStorage(path).insert_emails(
+        [pending(f"uid-{i}", f"2026-05-01T08:{i // 60:02d}:{i % 60:02d}+00:00") for i in range(200)]
+    )
+    # 2 koneksi terpisah ke file yang sama = 2 proses process.py
+    workers = {name: SQLiteStorage(path) for name in ("w1", "w2")}
+    claimed = {name: [] for name in workers}
+    barrier = threading.Barrier(len(workers))
+
+    def run(name):
+        barrier.wait()
+        while True:
+            rows = workers[name].claim_pending(name, limit=7, lease_seconds=60)
+            if not rows:
+                return
+            claimed[name].extend(row["id"] for row in rows)
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not set(claimed["w1"]) & set(claimed["w2"])
+    assert len(claimed["w1"]) + len(claimed["w2"]) == 200
@@ -0,0 +1,37 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from timeutil import parse_time  # noqa: E402
+
+EXPECTED = datetime(2026, 5, 1, 8, 30, 22, 123450, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("value", [
+    "2026-05-01T08:30:22.12345+00:00",    # Postgres membuang 0 di belakang
+    "2026-05-01T08:30:22.123450+00:00",
+    "2026-05-01 08:30:22.12345+00:00",
+    "2026-05-01T08:30:22.1234509+00:00",  # >6 digit dipotong
+    "2026-05-01T08:30:22.12345Z",
+    "2026-05-01T08:30:22.12345",          # Tanpa zona = UTC
+    "2026-05-01T15:30:22.12345+07:00",
+])
+def test_fraction_any_length(value):
+    assert parse_time(value) == EXPECTED
+
+
+def test_short_fraction_and_no_fraction():
+    assert parse_time("2026-05-01T08:30:22.1+00:00").microsecond == 100000
+    assert parse_time("2026-05-01T08:30:22+00:00") == datetime(2026, 5, 1, 8, 30, 22, tzinfo=timezone.utc)
+
+
+def test_datetime_input_gets_timezone():
+    assert parse_time(datetime(2026, 5, 1, 8, 0)).tzinfo == timezone.utc
+
+
+@pytest.mark.parametrize("value", [None, "", "bukan tanggal", "2026-13-01T00:00:00"])
+def test_invalid_returns_none(value):
+    assert parse_time(value) is None
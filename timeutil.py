@@ -0,0 +1,30 @@
+import re
+from datetime import datetime, timezone
+
+# --- PARSING TIMESTAMP ---
+# Satu parser untuk semua timestamp dari Postgres/SQLite/LINE.
+# Python 3.10 (dipakai CI) hanya menerima pecahan detik 3 atau 6 digit di fromisoformat,
+# padahal Postgres bisa mengirim "...:22.12345+00:00" (angka 0 di belakang dibuang).
+FRACTION_PATTERN = re.compile(r"(\d{2}:\d{2}:\d{2})\.(\d+)")
+
+
+def _normalize_fraction(match):
+    return f"{match.group(1)}.{(match.group(2) + '000000')[:6]}"
+
+
+def parse_time(value):
+    """
+    Timestamp ISO (string/datetime) -> datetime dengan zona. Tanpa zona dianggap UTC (sama seperti Postgres).
+    Pecahan detik berapa pun digitnya dipotong/diisi jadi 6 digit. Return None kalau kosong/tidak valid.
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = FRACTION_PATTERN.sub(_normalize_fraction, str(value).strip().replace("Z", "+00:00"), count=1)
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
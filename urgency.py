@@ -0,0 +1,88 @@
+import os
+import heapq
+import itertools
+from datetime import datetime, timedelta, timezone
+from timeutil import parse_time
+
+# --- SKOR URGENSI LOKAL (TANPA LLM) ---
+# Dihitung saat ingest supaya antrian PENDING_AI bisa dikerjakan yang paling mendesak dulu
+# (pembatalan kelas tidak menunggu di belakang tumpukan newsletter saat kuota AI tipis).
+# Pengirim akademik: cocok di local-part ("dosen.kalkulus@...") atau domain (LECTURER_DOMAINS)
+ACADEMIC_SENDER_HINTS = ("dosen", "lecturer", "akademik", "baak", "kaprodi", "prodi", "fakultas", "registrar")
+LECTURER_DOMAINS = [d.strip().lower() for d in os.getenv("LECTURER_DOMAINS", "lecturer.umn.ac.id").split(",") if d.strip()]
+# Kata di subjek yang biasanya berarti jadwal berubah
+CHANGE_KEYWORDS = ("batal", "perubahan", "berubah", "pindah ruang", "ganti ruang", "diundur", "dimajukan",
+                   "reschedule", "cancel", "libur")
+# Kata waktu relatif: hanya berarti kalau emailnya masih baru (lihat FRESH_HOURS)
+SOON_KEYWORDS = ("besok", "hari ini", "nanti malam", "sekarang", "segera", "mendadak")
+FRESH_HOURS = 24
+
+SENDER_POINTS = 2
+CHANGE_POINTS = 3
+SOON_POINTS = 2
+
+# --- AGING ---
+# Tiap poin urgensi = email dianggap masuk URGENCY_HEAD_START_MINUTES lebih awal (kolom queue_at).
+# Antrian diurutkan queue_at, jadi email biasa paling lama dilangkahi
+# skor maksimal x head start (default 7 x 30 menit), tidak pernah menunggu selamanya.
+URGENCY_HEAD_START_MINUTES = int(os.getenv("URGENCY_HEAD_START_MINUTES", "30"))
+
+
+def is_academic_sender(sender):
+    address = (sender or "").lower()
+    local, _, domain = address.rpartition("@")
+    return any(hint in local for hint in ACADEMIC_SENDER_HINTS) or \
+        any(domain == d or domain.endswith("." + d) for d in LECTURER_DOMAINS)
+
+
+def urgency_score(sender, subject, received_at, now=None):
+    """Skor 0..7 dari pengirim, kata kunci subjek, dan umur email."""
+    subject = (subject or "").lower()
+    score = 0
+    if is_academic_sender(sender):
+        score += SENDER_POINTS
+    if any(keyword in subject for keyword in CHANGE_KEYWORDS):
+        score += CHANGE_POINTS
+    received = parse_time(received_at)
+    now = now or datetime.now(timezone.utc)
+    # "Besok" di email 3 hari lalu sudah lewat (misal saat sync awal / backlog lama)
+    if received and now - received <= timedelta(hours=FRESH_HOURS) and \
+            any(keyword in subject for keyword in SOON_KEYWORDS):
+        score += SOON_POINTS
+    return score
+
+
+def urgency_fields(sender, subject, received_at):
+    """Kolom urgency_score + queue_at untuk baris email baru (dipakai ingest)."""
+    score = urgency_score(sender, subject, received_at)
+    received = parse_time(received_at) or datetime.now(timezone.utc)
+    queue_at = received - timedelta(minutes=score * URGENCY_HEAD_START_MINUTES)
+    return {"urgency_score": score, "queue_at": queue_at.isoformat()}
+
+
+def queue_key(email):
+    """Urutan antrian: queue_at paling awal dulu (baris lama tanpa queue_at pakai received_at)."""
+    when = parse_time(email.get("queue_at")) or parse_time(email.get("received_at"))
+    return when.timestamp() if when else 0.0
+
+
+def by_urgency(emails):
+    return sorted(emails, key=queue_key)
+
+
+class UrgencyQueue:
+    """Heap email menunggu AI di dalam 1 proses (pipeline): pop() selalu mengambil yang paling mendesak."""
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()  # Seri: urutan masuk
+
+    def push(self, emails):
+        for email in emails:
+            heapq.heappush(self.heap, (queue_key(email), next(self.counter), email))
+
+    def pop(self, limit):
+        return [heapq.heappop(self.heap)[2] for _ in range(min(limit, len(self.heap)))]
+
+    def __len__(self):
+        return len(self.heap)